@@ -0,0 +1,98 @@
+"""Архивирование старых визитов в холодную секцию appointments.
+
+На Postgres appointments секционирована по флагу archived (LIST): горячая
+секция appointments_hot разбита по месяцам date, холодная appointments_cold
+одна. Смена archived переносит строку между секциями средствами Postgres,
+а запросы через appointments (карточка пациента) видят обе секции. Копия
+ключа визита в medical_records обновляется каскадом по внешнему ключу
+(нужен Postgres 15+, см. миграцию 0012).
+
+В архив уходят визиты старше ARCHIVE_AFTER_YEARS лет и прошедшие визиты
+пациентов со статусом archived. Будущие визиты остаются в горячей секции,
+чтобы проверки занятости слотов не ходили в архив.
+"""
+import os
+from datetime import date
+
+from sqlalchemy import text
+
+from .partitions import month_start, partition_name, ensure_monthly_partitions
+
+ARCHIVE_AFTER_YEARS = int(os.getenv("ARCHIVE_AFTER_YEARS", "3"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+# На сколько месяцев вперед держать готовые секции расписания
+APPOINTMENT_PARTITIONS_AHEAD = int(os.getenv("APPOINTMENT_PARTITIONS_AHEAD", "12"))
+
+# Условие «визит должен быть в архиве»; a — appointments, p — patients
+ARCHIVE_CONDITION = "(a.date < :cutoff OR (p.status = 'archived' AND a.date < :today))"
+
+def archive_cutoff(years: int = ARCHIVE_AFTER_YEARS, today: date = None) -> date:
+    """Граница архива: начало месяца, отстоящего от текущего на years лет"""
+    return month_start(today or date.today(), -12 * years)
+
+def ensure_appointment_partitions(connection, cutoff: date, months_ahead: int = APPOINTMENT_PARTITIONS_AHEAD) -> list:
+    """Месячные секции appointments_hot от границы архива до months_ahead месяцев вперед"""
+    return ensure_monthly_partitions(
+        connection, "appointments_hot", "date", cutoff, month_start(date.today(), months_ahead),
+        default="appointments_hot_default"
+    )
+
+def drop_empty_hot_partitions(connection, cutoff: date) -> list:
+    """Удаляет опустевшие месячные секции appointments_hot целиком раньше cutoff"""
+    if connection.dialect.name != "postgresql":
+        return []
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class parent ON parent.oid = i.inhparent "
+        "WHERE parent.relname = 'appointments_hot' AND c.relname < :bound "
+        "AND c.relname ~ '^appointments_hot_y[0-9]{4}m[0-9]{2}$'"
+    ), {"bound": partition_name("appointments_hot", cutoff)}).scalars().all()
+
+    dropped = []
+    for name in names:
+        if connection.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {name})")).scalar():
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+def archive_appointments(db, years: int = ARCHIVE_AFTER_YEARS, batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """Переносит визиты в архив и обратно (если пациента вернули из архива) пачками.
+
+    Каждая пачка — отдельная транзакция, чтобы не держать блокировки на всей таблице.
+    """
+    cutoff, today = archive_cutoff(years), date.today()
+    params = {"cutoff": cutoff, "today": today, "limit": batch_size}
+
+    archived = 0
+    while True:
+        moved = db.execute(text(
+            "UPDATE appointments SET archived = TRUE WHERE id IN ("
+            "SELECT a.id FROM appointments a LEFT JOIN patients p ON p.id = a.patient_id "
+            f"WHERE NOT a.archived AND {ARCHIVE_CONDITION} LIMIT :limit)"
+        ), params).rowcount
+        db.commit()
+        archived += moved
+        if moved < batch_size:
+            break
+
+    restored = 0
+    while True:
+        moved = db.execute(text(
+            "UPDATE appointments SET archived = FALSE WHERE id IN ("
+            "SELECT a.id FROM appointments a LEFT JOIN patients p ON p.id = a.patient_id "
+            f"WHERE a.archived AND NOT {ARCHIVE_CONDITION} LIMIT :limit)"
+        ), params).rowcount
+        db.commit()
+        restored += moved
+        if moved < batch_size:
+            break
+
+    connection = db.connection()
+    created = ensure_appointment_partitions(connection, cutoff)
+    dropped = drop_empty_hot_partitions(connection, cutoff)
+    db.commit()
+    return {
+        "cutoff": cutoff, "archived": archived, "restored": restored,
+        "created_partitions": created, "dropped_partitions": dropped
+    }
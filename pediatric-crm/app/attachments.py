@@ -0,0 +1,266 @@
+"""Вложения: анализы, снимки, выписки к пациенту или медицинской записи.
+
+Содержимое хранится на диске по SHA-256 (objects/ab/cdef...): одинаковые
+файлы лежат один раз, сколько бы записей Attachment на них ни ссылалось.
+Загрузка идет потоком прямо в файл с подсчетом хэша, отдача — кусками с
+поддержкой Range или через X-Accel-Redirect (nginx отдает файл sendfile).
+В браузере открываются только PDF и растровые картинки, остальное скачивается.
+Превью строятся в пуле процессов после ответа клиенту.
+"""
+import os
+import re
+import shutil
+import hashlib
+import logging
+import tempfile
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from .database import SessionLocal
+from .models import Attachment
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ATTACHMENTS_DIR = os.getenv("ATTACHMENTS_DIR", os.path.join(BASE_DIR, "attachments"))
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(200 * 1024 * 1024)))
+# Внутренний location nginx, указывающий на ATTACHMENTS_DIR (пусто — файлы отдает приложение)
+ATTACHMENTS_ACCEL_PREFIX = os.getenv("ATTACHMENTS_ACCEL_PREFIX", "")
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+PREVIEW_SIZE = 320
+CHUNK_SIZE = 256 * 1024
+# Типы, которые браузер показывает сам; остальное (HTML, SVG, скрипты) только скачивается:
+# Content-Type задает клиент при загрузке, и HTML с нашего домена — это XSS
+INLINE_CONTENT_TYPES = {"application/pdf", "image/jpeg", "image/png", "image/gif", "image/webp", "image/bmp"}
+
+class AttachmentTooLarge(Exception):
+    pass
+
+# ========== ХРАНИЛИЩЕ ==========
+
+def object_path(sha256: str) -> str:
+    return os.path.join(ATTACHMENTS_DIR, "objects", sha256[:2], sha256[2:])
+
+def preview_path(sha256: str) -> str:
+    return os.path.join(ATTACHMENTS_DIR, "previews", sha256[:2], f"{sha256[2:]}.jpg")
+
+def _write_chunk(file, hasher, chunk: bytes):
+    hasher.update(chunk)
+    file.write(chunk)
+
+def _commit_object(tmp_path: str, sha256: str) -> bool:
+    """Переносит временный файл в хранилище; False, если такой объект уже был"""
+    path = object_path(sha256)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(tmp_path, path)
+    return True
+
+async def store_stream(chunks, max_bytes: int = ATTACHMENT_MAX_BYTES):
+    """Пишет поток байтов в хранилище, не держа файл в памяти; возвращает (sha256, size)"""
+    tmp_dir = os.path.join(ATTACHMENTS_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    file = tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False)
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            size += len(chunk)
+            if size > max_bytes:
+                raise AttachmentTooLarge(f"Файл больше {max_bytes} байт")
+            await run_in_threadpool(_write_chunk, file, hasher, chunk)
+        await run_in_threadpool(file.close)
+        sha256 = hasher.hexdigest()
+        await run_in_threadpool(_commit_object, file.name, sha256)
+        return sha256, size
+    except BaseException:
+        file.close()
+        if os.path.exists(file.name):
+            os.remove(file.name)
+        raise
+
+# ========== ПРЕВЬЮ ==========
+
+def render_preview(source: str, target: str, content_type: str) -> str:
+    """Строит JPEG-превью (выполняется в отдельном процессе); возвращает статус"""
+    if os.path.exists(target):
+        return "ready"
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{os.getpid()}.tmp"
+
+    if content_type.startswith("image/"):
+        from PIL import Image
+
+        with Image.open(source) as image:
+            image.thumbnail((PREVIEW_SIZE, PREVIEW_SIZE))
+            image.convert("RGB").save(tmp_target, "JPEG", quality=80)
+    elif content_type == "application/pdf" and shutil.which("pdftoppm"):
+        # Первая страница PDF; pdftoppm сам добавит расширение .jpg
+        subprocess.run(
+            ["pdftoppm", "-jpeg", "-f", "1", "-l", "1", "-singlefile",
+             "-scale-to", str(PREVIEW_SIZE), source, tmp_target],
+            check=True, timeout=60, capture_output=True
+        )
+        tmp_target = f"{tmp_target}.jpg"
+    else:
+        return "none"
+
+    os.replace(tmp_target, target)
+    return "ready"
+
+_executor = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Пул создается лениво, уже в процессе воркера (после fork в gunicorn)
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PREVIEW_WORKERS)
+    return _executor
+
+def _save_preview_status(sha256: str, future):
+    try:
+        status = future.result()
+    except ImportError:
+        status = "none"
+    except Exception as e:
+        logger.error(f"Не удалось построить превью {sha256}: {e}")
+        status = "failed"
+    db = SessionLocal()
+    try:
+        db.query(Attachment).filter(
+            Attachment.sha256 == sha256, Attachment.preview_status == "pending"
+        ).update({"preview_status": status}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def schedule_preview(sha256: str, content_type: str):
+    """Ставит построение превью в пул процессов; статус запишется по готовности"""
+    future = _get_executor().submit(
+        render_preview, object_path(sha256), preview_path(sha256), content_type or ""
+    )
+    future.add_done_callback(partial(_save_preview_status, sha256))
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+# ========== ОТДАЧА ==========
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(header: str, size: int):
+    """(start, end) включительно для одиночного диапазона; None — отдать файл целиком.
+
+    Несколько диапазонов не поддерживаются: по RFC 9110 можно ответить всем файлом.
+    Неудовлетворимый диапазон — ValueError (ответ 416).
+    """
+    match = _RANGE_RE.match((header or "").strip())
+    if not match:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("Unsatisfiable range")
+    return start, end
+
+def _content_disposition(filename: str, inline: bool) -> str:
+    fallback = filename.encode("ascii", "replace").decode().replace('"', "")
+    kind = "inline" if inline else "attachment"
+    return f"{kind}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+def serving_headers(attachment: Attachment) -> list:
+    """Content-Type и Content-Disposition для отдачи: inline только для INLINE_CONTENT_TYPES"""
+    inline = (attachment.content_type or "").lower() in INLINE_CONTENT_TYPES
+    content_type = attachment.content_type.lower() if inline else "application/octet-stream"
+    return [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"content-disposition", _content_disposition(attachment.filename or "file", inline).encode("latin-1")),
+        (b"x-content-type-options", b"nosniff"),
+    ]
+
+class RangeFileResponse(Response):
+    """Файл из хранилища с поддержкой Range, читаемый кусками по CHUNK_SIZE.
+
+    Если задан ATTACHMENTS_ACCEL_PREFIX, тело не передается: nginx получает
+    X-Accel-Redirect и сам отдает файл через sendfile, включая Range.
+    """
+
+    def __init__(self, attachment: Attachment, range_header: str = None):
+        self.attachment = attachment
+        self.range_header = range_header
+        self.background = None
+        self.status_code = 200
+
+    async def __call__(self, scope, receive, send):
+        attachment = self.attachment
+        headers = serving_headers(attachment) + [
+            (b"accept-ranges", b"bytes"),
+            (b"etag", f'"{attachment.sha256}"'.encode()),
+            (b"cache-control", b"private, max-age=86400"),
+        ]
+
+        if ATTACHMENTS_ACCEL_PREFIX:
+            relative = os.path.relpath(object_path(attachment.sha256), ATTACHMENTS_DIR).replace(os.sep, "/")
+            headers.append((b"x-accel-redirect", f"{ATTACHMENTS_ACCEL_PREFIX.rstrip('/')}/{relative}".encode()))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        size = attachment.size
+        try:
+            byte_range = parse_range(self.range_header, size)
+        except ValueError:
+            await send({
+                "type": "http.response.start",
+                "status": 416,
+                "headers": [(b"content-range", f"bytes */{size}".encode()), (b"content-length", b"0")]
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        status = 200
+        start, end = 0, size - 1
+        if byte_range is not None:
+            status = 206
+            start, end = byte_range
+            headers.append((b"content-range", f"bytes {start}-{end}/{size}".encode()))
+        remaining = end - start + 1 if size else 0
+        headers.append((b"content-length", str(remaining).encode()))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+
+        if scope.get("method") == "HEAD" or remaining == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        file = await run_in_threadpool(open, object_path(attachment.sha256), "rb")
+        try:
+            await run_in_threadpool(file.seek, start)
+            while remaining > 0:
+                chunk = await run_in_threadpool(file.read, min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # Файл оказался короче записанного размера — закрываем ответ
+                await send({"type": "http.response.body", "body": b""})
+        finally:
+            await run_in_threadpool(file.close)
@@ -0,0 +1,178 @@
+"""Журнал изменений медицинских и учетных данных.
+
+Изменения собираются событиями сессии SQLAlchemy (after_flush) в виде
+{поле: [было, стало]}, после коммита попадают в буфер в памяти, а фоновая
+задача пишет их в audit_log пачками. Запрос не ждет записи журнала.
+
+На Postgres audit_log секционирована по месяцам; секции создаются заранее
+(ensure_partitions) при старте фоновой задачи.
+"""
+import os
+import atexit
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, inspect, insert
+from sqlalchemy.orm import Session
+
+from .database import engine
+from .partitions import month_start, ensure_monthly_partitions
+from .models import (
+    Patient, Appointment, MedicalRecord, Payment, Parent, ParentChild,
+    Vaccination, LedgerTransaction, AppointmentSeries, AuditLog
+)
+
+logger = logging.getLogger(__name__)
+
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "2"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+# Предел буфера: при недоступной БД старые записи вытесняются, а не копятся бесконечно
+AUDIT_BUFFER_LIMIT = int(os.getenv("AUDIT_BUFFER_LIMIT", "100000"))
+AUDIT_PARTITIONS_AHEAD = int(os.getenv("AUDIT_PARTITIONS_AHEAD", "3"))
+
+AUDITED = {
+    Patient: "patient",
+    Appointment: "appointment",
+    MedicalRecord: "medical_record",
+    Payment: "payment",
+    Parent: "parent",
+    ParentChild: "parent_child",
+    Vaccination: "vaccination",
+    LedgerTransaction: "ledger_transaction",
+    AppointmentSeries: "appointment_series",
+}
+MASKED_FIELDS = {"password"}
+
+# Кто вносит изменения: «web:<ip> <маршрут>», «bot:<user_id>», «script»
+current_actor: ContextVar[str] = ContextVar("audit_actor", default="script")
+
+_buffer = deque(maxlen=AUDIT_BUFFER_LIMIT)
+_flush_lock = threading.Lock()
+
+# ========== СБОР ИЗМЕНЕНИЙ ==========
+
+def _plain(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def _changes(obj, action: str):
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        if action == "update":
+            if not history.has_changes():
+                continue
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+        elif action == "insert":
+            old, new = None, getattr(obj, attr.key)
+            if new is None:
+                continue
+        else:
+            old, new = getattr(obj, attr.key), None
+        if attr.key in MASKED_FIELDS:
+            old, new = old and "***", new and "***"
+        changes[attr.key] = [_plain(old), _plain(new)]
+    return changes
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    pending = session.info.setdefault("audit_pending", [])
+    now = datetime.now()
+    actor = current_actor.get()
+    for action, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            entity = AUDITED.get(type(obj))
+            if entity is None:
+                continue
+            changes = _changes(obj, action)
+            if action == "update" and not changes:
+                continue
+            pending.append({
+                "ts": now,
+                "entity": entity,
+                "entity_id": getattr(obj, "id", None),
+                "action": action,
+                "actor": actor,
+                "changes": changes,
+            })
+
+def record(session: Session, entity: str, entity_id: int, action: str, changes: dict):
+    """Запись о действии в обход ORM (массовые UPDATE и INSERT, слияние); в журнал — после коммита.
+
+    changes — {поле: [было, стало]}, значения приводятся к виду after_flush.
+    """
+    session.info.setdefault("audit_pending", []).append({
+        "ts": datetime.now(),
+        "entity": entity,
+        "entity_id": entity_id,
+        "action": action,
+        "actor": current_actor.get(),
+        "changes": {key: [_plain(old), _plain(new)] for key, (old, new) in changes.items()},
+    })
+
+@event.listens_for(Session, "after_commit")
+def _enqueue(session):
+    pending = session.info.pop("audit_pending", None)
+    if pending:
+        _buffer.extend(pending)
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop("audit_pending", None)
+
+# ========== ЗАПИСЬ ==========
+
+def flush():
+    """Пишет накопленные записи в audit_log пачками; возвращает число записей"""
+    written = 0
+    with _flush_lock:
+        while _buffer:
+            batch = []
+            while _buffer and len(batch) < AUDIT_BATCH_SIZE:
+                batch.append(_buffer.popleft())
+            try:
+                with engine.begin() as connection:
+                    connection.execute(insert(AuditLog), batch)
+            except Exception as e:
+                # Возвращаем пачку в начало буфера и пробуем в следующий раз
+                _buffer.extendleft(reversed(batch))
+                logger.error(f"Не удалось записать журнал изменений: {e}")
+                break
+            written += len(batch)
+    return written
+
+def ensure_partitions(months_ahead: int = AUDIT_PARTITIONS_AHEAD):
+    """Создает месячные секции audit_log на текущий и months_ahead следующих месяцев"""
+    today = date.today()
+    with engine.begin() as connection:
+        ensure_monthly_partitions(
+            connection, "audit_log", "ts", today, month_start(today, months_ahead), default="audit_log_default"
+        )
+
+async def run_flusher(interval: float = AUDIT_FLUSH_INTERVAL):
+    """Фоновая задача: секции заранее, затем запись буфера раз в interval секунд"""
+    try:
+        await run_in_threadpool(ensure_partitions)
+    except Exception as e:
+        logger.error(f"Не удалось создать секции audit_log: {e}")
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            if _buffer:
+                await run_in_threadpool(flush)
+    finally:
+        await run_in_threadpool(flush)
+
+# Скрипты без цикла событий дописывают журнал при выходе
+atexit.register(flush)
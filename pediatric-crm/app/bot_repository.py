@@ -0,0 +1,205 @@
+"""Доступ бота к БД без блокировки цикла событий.
+
+Запросы синхронного SQLAlchemy выполняются в ограниченном пуле потоков
+(BOT_DB_THREADS): медленный запрос занимает один поток, а не весь бот,
+а пул не дает открыть больше соединений, чем выдержит пул движка.
+Каждый вызов — отдельная короткая сессия; наружу отдаются строки-кортежи,
+а не ORM-объекты, привязанные к закрытой сессии.
+
+Частые запросы собраны заранее как Core-выражения с bindparam: их
+скомпилированный SQL берется из кэша SQLAlchemy, меняются только параметры.
+
+Родитель видит только привязанных детей (parent_children). Связи создаются
+при авторизации: ребенок привязывается, если его телефон или телефон
+родителя в карточке совпадает с телефоном авторизовавшегося.
+"""
+import os
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select, update, bindparam, func, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .database import SessionLocal
+from .dedupe import normalize_phone
+from . import visit_pdf
+from .models import Patient, Parent, ParentChild, Appointment, MedicalRecord, ParentNotification
+from .scheduling import get_booked_times
+
+BOT_DB_THREADS = int(os.getenv("BOT_DB_THREADS", "8"))
+# Повторы неудачной доставки уведомлений: пауза удваивается от BASE до MAX секунд,
+# после MAX_ATTEMPTS попыток уведомление помечается недоставленным
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "8"))
+NOTIFY_RETRY_BASE = float(os.getenv("NOTIFY_RETRY_BASE", "60"))
+NOTIFY_RETRY_MAX = float(os.getenv("NOTIFY_RETRY_MAX", str(6 * 3600)))
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "5"))
+
+_executor = ThreadPoolExecutor(max_workers=BOT_DB_THREADS, thread_name_prefix="bot-db")
+
+async def run_db(fn, *args):
+    """Выполняет fn(db, *args) в пуле потоков в собственной сессии.
+
+    Контекст (счетчики SQL, автор изменений для журнала) переносится в поток.
+    """
+    context = contextvars.copy_context()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, context.run, _in_session, fn, *args)
+
+def _in_session(fn, *args):
+    db = SessionLocal()
+    try:
+        result = fn(db, *args)
+        db.commit()
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# ========== ЗАПРОСЫ ==========
+
+CHILD_COLUMNS = (Patient.id, Patient.first_name, Patient.last_name, Patient.birth_date)
+
+PARENT_BY_CREDENTIALS = select(Parent).where(
+    Parent.phone == bindparam("phone"), Parent.password == bindparam("password")
+)
+LINKED_CHILDREN = select(*CHILD_COLUMNS) \
+    .join(ParentChild, ParentChild.patient_id == Patient.id) \
+    .where(ParentChild.parent_id == bindparam("parent_id")) \
+    .order_by(Patient.last_name, Patient.first_name)
+LINKED_CHILD_BY_ID = select(*CHILD_COLUMNS) \
+    .join(ParentChild, ParentChild.patient_id == Patient.id) \
+    .where(ParentChild.parent_id == bindparam("parent_id"), Patient.id == bindparam("child_id"))
+CHILDREN_BY_PHONE = select(Patient.id).where(or_(
+    Patient.phone_key == bindparam("phone_key"), Patient.parent_phone_key == bindparam("phone_key")
+))
+PENDING_NOTIFICATIONS = select(
+    ParentNotification.id, ParentNotification.text, ParentNotification.medical_record_id,
+    ParentNotification.attempts, Parent.telegram_chat_id.label("chat_id")
+).join(Parent, ParentNotification.parent_id == Parent.id) \
+    .where(
+        ParentNotification.sent_at.is_(None),
+        ParentNotification.failed_at.is_(None),
+        ParentNotification.next_attempt_at <= bindparam("now"),
+        Parent.telegram_chat_id.isnot(None)
+    ).order_by(ParentNotification.next_attempt_at, ParentNotification.id).limit(bindparam("limit"))
+MARK_SENT = update(ParentNotification) \
+    .where(ParentNotification.id.in_(bindparam("ids", expanding=True))) \
+    .values(sent_at=bindparam("sent_at"))
+MARK_ATTEMPT = update(ParentNotification) \
+    .where(ParentNotification.id == bindparam("notification_id")) \
+    .values(
+        attempts=ParentNotification.attempts + 1,
+        last_error=bindparam("last_error"),
+        next_attempt_at=bindparam("next_attempt_at"),
+        failed_at=bindparam("failed_at")
+    )
+
+def _authenticate(db, phone: str, password: str, chat_id: str):
+    parent = db.execute(PARENT_BY_CREDENTIALS, {"phone": phone, "password": password}).scalars().first()
+    if parent is None:
+        return None
+    # Через ORM, чтобы смена чата попала в журнал изменений
+    parent.telegram_chat_id = chat_id
+    _link_children(db, parent)
+    return {"id": parent.id, "first_name": parent.first_name, "last_name": parent.last_name}
+
+def _link_children(db, parent: Parent) -> int:
+    """Привязывает к родителю детей с его телефоном в карточке; существующие связи не дублируются"""
+    phone_key = normalize_phone(parent.phone)
+    if not phone_key:
+        return 0
+    patient_ids = db.execute(CHILDREN_BY_PHONE, {"phone_key": phone_key}).scalars().all()
+    if not patient_ids:
+        return 0
+    # Уникальный индекс (parent_id, patient_id): одновременные авторизации не создают дублей
+    insert = pg_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    now = datetime.now()
+    return db.execute(
+        insert(ParentChild.__table__).on_conflict_do_nothing(index_elements=["parent_id", "patient_id"]),
+        [{"parent_id": parent.id, "patient_id": patient_id, "created_at": now} for patient_id in patient_ids]
+    ).rowcount
+
+async def authenticate_parent(phone: str, password: str, chat_id: str):
+    """Проверяет телефон и пароль; при успехе запоминает чат для уведомлений"""
+    return await run_db(_authenticate, phone, password, chat_id)
+
+async def linked_children(parent_id: int):
+    """Дети, привязанные к родителю через parent_children"""
+    return await run_db(lambda db: db.execute(LINKED_CHILDREN, {"parent_id": parent_id}).all())
+
+async def child_by_id(parent_id: int, child_id: int):
+    """Ребенок, только если он привязан к родителю"""
+    return await run_db(
+        lambda db: db.execute(LINKED_CHILD_BY_ID, {"parent_id": parent_id, "child_id": child_id}).first()
+    )
+
+async def booked_times(day: date):
+    return await run_db(get_booked_times, day)
+
+async def visit_summary_text(medical_record_id: int):
+    """Итоги визита текстом или None, если записи уже нет"""
+    summary = await run_db(visit_pdf.visit_summary, medical_record_id)
+    return visit_pdf.summary_text(summary) if summary else None
+
+def _history_page(db, parent_id: int, child_id: int, cursor):
+    query = db.query(
+        Appointment.id,
+        Appointment.date,
+        Appointment.time,
+        Appointment.type,
+        MedicalRecord.diagnosis["main"].as_string().label("diagnosis_code"),
+        MedicalRecord.diagnosis["mainText"].as_string().label("diagnosis_text"),
+        func.substr(MedicalRecord.recommendations, 1, 300).label("recommendations")
+    ).join(ParentChild, (ParentChild.patient_id == Appointment.patient_id) & (ParentChild.parent_id == parent_id)) \
+        .outerjoin(MedicalRecord, MedicalRecord.appointment_id == Appointment.id) \
+        .filter(
+            Appointment.patient_id == child_id,
+            Appointment.date <= date.today(),
+            Appointment.status != "cancelled"
+        )
+    if cursor:
+        query = query.filter(tuple_(Appointment.date, Appointment.time, Appointment.id) < tuple_(*cursor))
+    rows = query.order_by(Appointment.date.desc(), Appointment.time.desc(), Appointment.id.desc()) \
+        .limit(HISTORY_PAGE_SIZE + 1).all()
+    return rows[:HISTORY_PAGE_SIZE], len(rows) > HISTORY_PAGE_SIZE
+
+async def history_page(parent_id: int, child_id: int, cursor=None):
+    """Страница прошедших визитов ребенка (новые сверху) с keyset-пагинацией.
+
+    Выбираются только показываемые поля; cursor — (date, time, id) последней
+    строки предыдущей страницы. Возвращает (строки, есть_ли_следующая).
+    """
+    return await run_db(_history_page, parent_id, child_id, cursor)
+
+async def pending_notifications(limit: int = 100):
+    """Уведомления, которым пора уйти родителям с известным чатом; отложенные и
+    окончательно недоставленные не выбираются и не загораживают очередь"""
+    return await run_db(
+        lambda db: db.execute(PENDING_NOTIFICATIONS, {"limit": limit, "now": datetime.now()}).all()
+    )
+
+async def mark_notifications_sent(ids: list):
+    if ids:
+        await run_db(lambda db: db.execute(MARK_SENT, {"ids": ids, "sent_at": datetime.now()}))
+
+def retry_delay(attempts: int) -> float:
+    """Пауза перед следующей попыткой после attempts неудачных"""
+    return min(NOTIFY_RETRY_BASE * 2 ** max(attempts - 1, 0), NOTIFY_RETRY_MAX)
+
+async def mark_notification_failed(notification, error: str, permanent: bool = False):
+    """Записывает неудачную попытку: откладывает повтор или, если повторять
+    бессмысленно или попытки кончились, помечает уведомление недоставленным"""
+    attempts = notification.attempts + 1
+    now = datetime.now()
+    give_up = permanent or attempts >= NOTIFY_MAX_ATTEMPTS
+    await run_db(lambda db: db.execute(MARK_ATTEMPT, {
+        "notification_id": notification.id,
+        "last_error": error[:1000],
+        "next_attempt_at": None if give_up else now + timedelta(seconds=retry_delay(attempts)),
+        "failed_at": now if give_up else None,
+    }))
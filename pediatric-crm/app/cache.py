@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# memory — LRU внутри процесса (только для одного воркера; занятые слоты не кэшируются),
+# redis — общий для всех воркеров и бота Redis-совместимый сервер
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+CACHE_MAX_ITEMS = int(os.getenv("CACHE_MAX_ITEMS", "1024"))
+CACHE_DEFAULT_TTL = int(os.getenv("CACHE_DEFAULT_TTL", "300"))
+CACHE_PREFIX = os.getenv("CACHE_PREFIX", "pcrm")
+
+# Пространства имен, которые инвалидируются при записи
+TEMPLATES = "templates"
+STATS = "stats"
+AVAILABILITY = "availability"
+
+class BaseCache:
+    """Кэш с пространствами имен.
+
+    Инвалидация пространства — это увеличение его версии: версия входит в ключ,
+    поэтому старые значения перестают находиться и вытесняются по TTL. В Redis
+    версия хранится общим счетчиком, и инвалидация сразу видна всем воркерам.
+    Пространства из uncached не кэшируются: factory() вызывается каждый раз.
+    """
+
+    uncached = ()
+
+    def _version(self, namespace):
+        raise NotImplementedError
+
+    def _get(self, key):
+        raise NotImplementedError
+
+    def _set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def invalidate(self, *namespaces):
+        raise NotImplementedError
+
+    def _key(self, namespace, key):
+        return f"{CACHE_PREFIX}:{namespace}:{self._version(namespace)}:{key}"
+
+    def get(self, namespace, key):
+        return self._get(self._key(namespace, key))
+
+    def set(self, namespace, key, value, ttl=CACHE_DEFAULT_TTL):
+        self._set(self._key(namespace, key), value, ttl)
+
+    def get_or_set(self, namespace, key, factory, ttl=CACHE_DEFAULT_TTL):
+        """Возвращает значение из кэша или вычисляет его через factory()"""
+        if namespace in self.uncached:
+            return factory()
+        try:
+            value = self.get(namespace, key)
+        except Exception as e:
+            logger.warning(f"Кэш недоступен, вычисляем напрямую: {e}")
+            return factory()
+        if value is not None:
+            return value
+        value = factory()
+        try:
+            self.set(namespace, key, value, ttl)
+        except Exception as e:
+            logger.warning(f"Не удалось записать в кэш: {e}")
+        return value
+
+class LocalLRUCache(BaseCache):
+    """LRU с TTL в памяти процесса"""
+
+    # Занятые слоты читают все воркеры и бот, а инвалидация в памяти видна только
+    # своему процессу: устаревший список предлагал бы уже занятое время
+    uncached = (AVAILABILITY,)
+
+    def __init__(self, max_items=CACHE_MAX_ITEMS):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def _get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._items[key] = (value, time.monotonic() + ttl)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, *namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+class RedisCache(BaseCache):
+    """Общий кэш в Redis-совместимом сервере, значения хранятся в JSON"""
+
+    def __init__(self, url=CACHE_REDIS_URL):
+        import redis
+
+        self._redis = redis.Redis.from_url(url)
+
+    def _version(self, namespace):
+        version = self._redis.get(f"{CACHE_PREFIX}:version:{namespace}")
+        return int(version) if version else 0
+
+    def _get(self, key):
+        value = self._redis.get(key)
+        return json.loads(value) if value is not None else None
+
+    def _set(self, key, value, ttl):
+        self._redis.set(key, json.dumps(value, default=str), ex=ttl)
+
+    def invalidate(self, *namespaces):
+        try:
+            pipeline = self._redis.pipeline()
+            for namespace in namespaces:
+                pipeline.incr(f"{CACHE_PREFIX}:version:{namespace}")
+            pipeline.execute()
+        except Exception as e:
+            logger.error(f"Не удалось инвалидировать кэш {namespaces}: {e}")
+
+def build_cache():
+    if CACHE_BACKEND == "redis":
+        try:
+            return RedisCache()
+        except ImportError:
+            logger.error("CACHE_BACKEND=redis, но пакет redis не установлен; используем LRU в памяти")
+    return LocalLRUCache()
+
+cache = build_cache()
@@ -0,0 +1,118 @@
+from datetime import date
+from typing import Optional
+from sqlalchemy import Text, case, column, event, func, literal, literal_column, or_, select, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Session
+
+from .models import Patient, Appointment, MedicalRecord
+from .patient_picker import search_key
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _json_items(db: Session, document, path: str):
+    """Элементы JSON-массива по ключу верхнего уровня (колонка value) для подзапроса EXISTS"""
+    if _is_postgres(db):
+        array = type_coerce(document, JSONB)[path]
+        # Не-массив (строка, объект) дал бы ошибку jsonb_array_elements
+        array = case((func.jsonb_typeof(array) == "array", array))
+        return func.jsonb_array_elements(array).table_valued(column("value", JSONB))
+    return func.json_each(document, f"$.{path}").table_valued("value", "type")
+
+def _item_text(db: Session, items, key: Optional[str] = None):
+    """Текст элемента массива (или его поля key) для сравнения"""
+    if _is_postgres(db):
+        value = items.c.value[key] if key else items.c.value
+        # #>> '{}' — скалярное значение jsonb как текст без кавычек
+        return value.op("#>>", return_type=Text)(literal_column("'{}'"))
+    if key:
+        return func.json_extract(items.c.value, f"$.{key}")
+    return case((items.c.type == "text", items.c.value))
+
+def diagnosis_filter(db: Session, code: str, include_additional: bool = True):
+    """Основной диагноз по коду МКБ или его префиксу (J06 найдет J06.9).
+
+    На Postgres использует индексы ix_medical_records_diagnosis_main и
+    ix_medical_records_diagnosis_gin (см. миграцию 0004).
+    """
+    condition = MedicalRecord.diagnosis["main"].as_string().like(f"{_escape_like(code)}%", escape="\\")
+    if not include_additional:
+        return condition
+    if _is_postgres(db):
+        additional = type_coerce(MedicalRecord.diagnosis, JSONB).contains({"additional": [code]})
+    else:
+        items = _json_items(db, MedicalRecord.diagnosis, "additional")
+        additional = select(literal(1)).select_from(items).where(_item_text(db, items) == code).exists()
+    return or_(condition, additional)
+
+def medications_key(prescriptions) -> Optional[str]:
+    """Ключ поиска препаратов: названия в нижнем регистре, по одному на строку"""
+    return "\n".join(search_key(name) for name in medication_names(prescriptions)) or None
+
+@event.listens_for(MedicalRecord, "before_insert")
+@event.listens_for(MedicalRecord, "before_update")
+def _set_medications_key(mapper, connection, record):
+    record.medications_key = medications_key(record.prescriptions)
+
+def medication_filter(db: Session, medication: str):
+    """Препарат по подстроке в шаблонных (template[*]) или ручных (manual[*].medication) назначениях.
+
+    Сравниваются только названия препаратов, а не весь документ: иначе «diet»
+    или «dosage» находили бы каждую запись. Поиск идет по хранимому ключу
+    medications_key, нормализованному в Python: lower() в SQLite не знает
+    кириллицы. На Postgres подстроку находит trigram-индекс по ключу.
+    """
+    pattern = f"%{_escape_like(search_key(medication))}%"
+    return MedicalRecord.medications_key.like(pattern, escape="\\")
+
+def search_medical_records(
+    db: Session,
+    diagnosis: Optional[str] = None,
+    medication: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = 100,
+    offset: int = 0,
+):
+    """Клинический поиск по медицинским записям; возвращает строки и общее число"""
+    query = db.query(
+        MedicalRecord.id,
+        MedicalRecord.created_at,
+        MedicalRecord.diagnosis,
+        MedicalRecord.prescriptions,
+        Appointment.date.label("visit_date"),
+        Patient.id.label("patient_id"),
+        Patient.first_name,
+        Patient.last_name,
+        Patient.birth_date,
+    ).join(Appointment, MedicalRecord.appointment_id == Appointment.id) \
+     .join(Patient, Appointment.patient_id == Patient.id)
+
+    if diagnosis:
+        query = query.filter(diagnosis_filter(db, diagnosis.strip().upper()))
+    if medication:
+        query = query.filter(medication_filter(db, medication.strip()))
+    # Период — по дате визита: запись могли заполнить позже
+    if date_from:
+        query = query.filter(Appointment.date >= date_from)
+    if date_to:
+        query = query.filter(Appointment.date <= date_to)
+
+    total = query.order_by(None).count()
+    rows = query.order_by(Appointment.date.desc(), Appointment.time.desc(), MedicalRecord.id.desc()) \
+        .limit(limit).offset(offset).all()
+    return rows, total
+
+def medication_names(prescriptions) -> list:
+    """Названия препаратов из структуры назначений visit_result.js"""
+    if not isinstance(prescriptions, dict):
+        return [str(name) for name in prescriptions if name] if isinstance(prescriptions, list) else []
+    names = [str(name) for name in prescriptions.get("template") or [] if name]
+    names.extend(
+        str(item["medication"]) for item in prescriptions.get("manual") or []
+        if isinstance(item, dict) and item.get("medication")
+    )
+    return names
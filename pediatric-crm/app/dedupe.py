@@ -0,0 +1,294 @@
+"""Поиск дублей пациентов и слияние карточек.
+
+Пары сравниваются только внутри блоков — групп пациентов с общим ключом:
+нормализованный телефон (свой или родителя), дата рождения, фонетический
+ключ ФИО. Так вместо O(n²) сравнений получается сумма квадратов размеров
+небольших блоков. Пара оценивается похожестью имени и фамилии, совпадением
+даты рождения и телефона; близнецы (та же дата и телефон, другое имя)
+отсекаются отдельно.
+
+Ключи хранятся в patients (phone_key, parent_phone_key, name_key) под
+индексами: проверка при создании пациента — один индексный запрос.
+"""
+import os
+import re
+from collections import defaultdict
+from datetime import date
+from difflib import SequenceMatcher
+from itertools import combinations
+from types import SimpleNamespace
+from typing import Optional
+
+from sqlalchemy import event, select, update, delete, or_
+from sqlalchemy.orm import Session
+
+from . import audit, ledger, patient_summary
+from .models import Base, Patient, ParentChild, GrowthMeasurement, VaccinationDue, PatientSummary
+
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.8"))
+# Блок больше этого (популярная дата рождения, общий номер клиники) попарно не сравнивается
+DEDUPE_MAX_BLOCK = int(os.getenv("DEDUPE_MAX_BLOCK", "200"))
+# Ниже этой похожести имени при совпадающей дате это скорее близнецы, чем опечатка
+FIRST_NAME_MIN_SIMILARITY = 0.8
+
+NAME_WEIGHT = 0.5
+BIRTH_WEIGHT = 0.35
+PHONE_WEIGHT = 0.15
+
+# Пустые поля основной карточки заполняются из сливаемой
+MERGE_FILL_FIELDS = (
+    "parent_name", "parent_phone", "address", "email", "birth_weight", "birth_height",
+    "allergies", "chronic_diseases", "health_group", "vaccinations", "development_notes"
+)
+# Таблицы со ссылкой на пациента, которые переносятся особым образом
+MERGE_SPECIAL_TABLES = {"patient_balances", "patient_summary", "vaccinations_due"}
+
+class DedupeError(ValueError):
+    pass
+
+# ========== КЛЮЧИ ==========
+
+def normalize_phone(phone: Optional[str]) -> Optional[str]:
+    """Только цифры, российский номер к виду 7XXXXXXXXXX"""
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    return digits if len(digits) >= 6 else None
+
+def normalize_name(name: Optional[str]) -> str:
+    return re.sub(r"[^a-zа-я]", "", (name or "").lower().replace("ё", "е"))
+
+# Упрощенный русский метафон: гласные сводятся к а/и/у, звонкие согласные
+# оглушаются, ь/ъ выпадают — Иванов/Иваноф/Ивонов дают один ключ
+_PHONETIC = str.maketrans({
+    "о": "а", "ы": "а", "я": "а",
+    "е": "и", "э": "и", "й": "и",
+    "ю": "у",
+    "б": "п", "в": "ф", "г": "к", "д": "т", "ж": "ш", "з": "с",
+    "ь": None, "ъ": None,
+})
+
+def phonetic(name: Optional[str]) -> str:
+    key = normalize_name(name).translate(_PHONETIC)
+    return re.sub(r"(.)\1+", r"\1", key)
+
+def name_key(last_name: Optional[str], first_name: Optional[str]) -> Optional[str]:
+    key = f"{phonetic(last_name)} {phonetic(first_name)}".strip()
+    return key[:64] or None
+
+@event.listens_for(Patient, "before_insert")
+@event.listens_for(Patient, "before_update")
+def _set_keys(mapper, connection, patient):
+    patient.phone_key = normalize_phone(patient.phone)
+    patient.parent_phone_key = normalize_phone(patient.parent_phone)
+    patient.name_key = name_key(patient.last_name, patient.first_name)
+
+def refresh_keys(db: Session) -> int:
+    """Заполняет ключи пациентов, созданных в обход ORM-событий (скрипты, импорт)"""
+    rows = db.query(Patient.id, Patient.phone, Patient.parent_phone, Patient.last_name, Patient.first_name) \
+        .filter(Patient.name_key.is_(None)).all()
+    if rows:
+        db.bulk_update_mappings(Patient, [{
+            "id": row.id,
+            "phone_key": normalize_phone(row.phone),
+            "parent_phone_key": normalize_phone(row.parent_phone),
+            "name_key": name_key(row.last_name, row.first_name),
+        } for row in rows])
+    return len(rows)
+
+# ========== ОЦЕНКА ==========
+
+CANDIDATE_COLUMNS = (
+    Patient.id, Patient.first_name, Patient.last_name, Patient.birth_date, Patient.gender,
+    Patient.phone, Patient.parent_phone
+)
+
+def _similarity(a: Optional[str], b: Optional[str]) -> float:
+    a, b = normalize_name(a), normalize_name(b)
+    if not a or not b:
+        return 0.0
+    return 1.0 if a == b else SequenceMatcher(None, a, b).ratio()
+
+def _birth_similarity(a: Optional[date], b: Optional[date]) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 1.0
+    # Одна опечатка в дате или перепутаны день и месяц
+    same = (a.year == b.year) + (a.month == b.month) + (a.day == b.day)
+    if same == 2 or (a.year == b.year and a.month == b.day and a.day == b.month):
+        return 0.5
+    return 0.0
+
+def _phones(row) -> set:
+    return {phone for phone in (normalize_phone(row.phone), normalize_phone(row.parent_phone)) if phone}
+
+def score(a, b) -> tuple:
+    """(оценка 0..1, причины) для пары строк с полями CANDIDATE_COLUMNS"""
+    if a.gender and b.gender and a.gender != b.gender:
+        return 0.0, []
+    first = _similarity(a.first_name, b.first_name)
+    if first < FIRST_NAME_MIN_SIMILARITY and phonetic(a.first_name) != phonetic(b.first_name):
+        return 0.0, []
+    last = _similarity(a.last_name, b.last_name)
+    birth = _birth_similarity(a.birth_date, b.birth_date)
+    phone = 1.0 if _phones(a) & _phones(b) else 0.0
+
+    reasons = []
+    if first == 1.0 and last == 1.0:
+        reasons.append("name")
+    elif first > 0 and last > 0:
+        reasons.append("similar_name")
+    if birth == 1.0:
+        reasons.append("birth_date")
+    elif birth:
+        reasons.append("similar_birth_date")
+    if phone:
+        reasons.append("phone")
+    total = NAME_WEIGHT * (first + last) / 2 + BIRTH_WEIGHT * birth + PHONE_WEIGHT * phone
+    return round(total, 3), reasons
+
+def _blocking_keys(row) -> list:
+    keys = [("phone", phone) for phone in _phones(row)]
+    if row.birth_date:
+        keys.append(("birth_date", row.birth_date))
+    key = name_key(row.last_name, row.first_name)
+    if key:
+        keys.append(("name", key))
+    return keys
+
+# ========== ПОИСК ==========
+
+def find_duplicates(db: Session, threshold: float = DEDUPE_THRESHOLD, max_block: int = DEDUPE_MAX_BLOCK) -> list:
+    """Пакетный поиск: все пары с оценкой не ниже threshold, лучшие сверху.
+
+    Каждая пара: {"patient_id", "duplicate_id", "score", "reasons"}; patient_id —
+    более ранняя карточка (меньший id), в нее предлагается сливать.
+    """
+    rows = db.query(*CANDIDATE_COLUMNS).filter(or_(Patient.status.is_(None), Patient.status != "archived")).all()
+    blocks = defaultdict(list)
+    for row in rows:
+        for key in _blocking_keys(row):
+            blocks[key].append(row)
+
+    seen = set()
+    pairs = []
+    for members in blocks.values():
+        if len(members) < 2 or len(members) > max_block:
+            continue
+        for a, b in combinations(members, 2):
+            pair = (min(a.id, b.id), max(a.id, b.id))
+            if pair in seen:
+                continue
+            seen.add(pair)
+            value, reasons = score(a, b)
+            if value >= threshold:
+                pairs.append({"patient_id": pair[0], "duplicate_id": pair[1], "score": value, "reasons": reasons})
+    pairs.sort(key=lambda pair: (-pair["score"], pair["patient_id"], pair["duplicate_id"]))
+    return pairs
+
+def find_candidates(
+    db: Session,
+    first_name: str,
+    last_name: str,
+    birth_date: Optional[date],
+    gender: Optional[str] = None,
+    phone: Optional[str] = None,
+    parent_phone: Optional[str] = None,
+    exclude_id: Optional[int] = None,
+    threshold: float = DEDUPE_THRESHOLD,
+    limit: int = 5
+) -> list:
+    """Возможные дубли одной карточки: блоки выбираются по индексам ключей"""
+    probe = SimpleNamespace(
+        first_name=first_name, last_name=last_name, birth_date=birth_date,
+        gender=gender, phone=phone, parent_phone=parent_phone
+    )
+    phones = list(_phones(probe))
+    conditions = [Patient.name_key == name_key(last_name, first_name)]
+    if birth_date:
+        conditions.append(Patient.birth_date == birth_date)
+    if phones:
+        conditions += [Patient.phone_key.in_(phones), Patient.parent_phone_key.in_(phones)]
+    query = db.query(*CANDIDATE_COLUMNS).filter(
+        or_(*conditions), or_(Patient.status.is_(None), Patient.status != "archived")
+    )
+    if exclude_id is not None:
+        query = query.filter(Patient.id != exclude_id)
+
+    candidates = []
+    for row in query.limit(DEDUPE_MAX_BLOCK).all():
+        value, reasons = score(probe, row)
+        if value >= threshold:
+            candidates.append({
+                "id": row.id,
+                "name": f"{row.last_name} {row.first_name}",
+                "birth_date": row.birth_date.isoformat() if row.birth_date else None,
+                "phone": row.phone,
+                "score": value,
+                "reasons": reasons,
+            })
+    candidates.sort(key=lambda candidate: -candidate["score"])
+    return candidates[:limit]
+
+# ========== СЛИЯНИЕ ==========
+
+def _patient_references():
+    """(таблица, колонка) для всех внешних ключей на patients.id"""
+    for table in Base.metadata.sorted_tables:
+        if table.name in MERGE_SPECIAL_TABLES:
+            continue
+        for fk in table.foreign_keys:
+            if fk.column.table.name == "patients":
+                yield table, fk.parent
+
+def merge_patients(db: Session, patient_id: int, duplicate_id: int) -> dict:
+    """Переносит визиты, связи с родителями и прочие данные duplicate_id в patient_id
+    и удаляет дубль. Все в одной транзакции; коммит — на стороне вызывающего.
+    Прививки к сроку основной карточки пересчитываются после коммита
+    (vaccinations.refresh_due коммитит сам).
+
+    Возвращает {таблица: перенесено строк}.
+    """
+    if patient_id == duplicate_id:
+        raise DedupeError("Нельзя объединить карточку саму с собой")
+    patient = db.get(Patient, patient_id)
+    duplicate = db.get(Patient, duplicate_id)
+    if patient is None or duplicate is None:
+        raise DedupeError("Пациент не найден")
+
+    # Родитель, уже привязанный к основной карточке, второй раз не привязывается
+    db.execute(delete(ParentChild).where(
+        ParentChild.patient_id == duplicate_id,
+        ParentChild.parent_id.in_(select(ParentChild.parent_id).where(ParentChild.patient_id == patient_id))
+    ).execution_options(synchronize_session=False))
+    # Производные данные пересчитываются для основной карточки
+    for model in (VaccinationDue, PatientSummary):
+        db.execute(delete(model).where(model.patient_id == duplicate_id).execution_options(synchronize_session=False))
+    ledger.transfer_balance(db, duplicate_id, patient_id)
+
+    # Возраст в измерениях роста считается от даты рождения основной карточки
+    if patient.birth_date and duplicate.birth_date != patient.birth_date:
+        measurements = db.query(GrowthMeasurement.id, GrowthMeasurement.measured_on) \
+            .filter(GrowthMeasurement.patient_id == duplicate_id).all()
+        db.bulk_update_mappings(GrowthMeasurement, [
+            {"id": m.id, "age_days": (m.measured_on - patient.birth_date).days} for m in measurements
+        ])
+
+    moved = {}
+    for table, column in _patient_references():
+        result = db.execute(update(table).where(column == duplicate_id).values({column.name: patient_id}))
+        if result.rowcount:
+            moved[table.name] = moved.get(table.name, 0) + result.rowcount
+
+    for field in MERGE_FILL_FIELDS:
+        if not getattr(patient, field) and getattr(duplicate, field):
+            setattr(patient, field, getattr(duplicate, field))
+    db.delete(duplicate)
+    db.flush()
+
+    patient_summary.mark_dirty(db, [patient_id, duplicate_id])
+    audit.record(db, "patient", patient_id, "merge", {"merged_from": [duplicate_id, None], "moved": [None, moved]})
+    return moved
@@ -0,0 +1,258 @@
+"""Антропометрия: ряды измерений и z-оценки по стандартам роста ВОЗ (метод LMS).
+
+Таблицы LMS загружаются один раз (load_tables() в lifespan приложения) из
+каталога GROWTH_TABLES_DIR. Ожидаются CSV-файлы из официальных расширенных
+таблиц ВОЗ (WHO Child Growth Standards, по дням 0–1856):
+
+    wfa_boys.csv, wfa_girls.csv    — вес к возрасту
+    lhfa_boys.csv, lhfa_girls.csv  — длина/рост к возрасту
+
+с колонками Day, L, M, S (import_who_tables.py готовит их из файлов ВОЗ).
+Если таблиц нет, ряды отдаются без z-оценок, /ready показывает их отсутствие,
+а flag_growth_outliers.py завершается с ошибкой.
+
+Стандарты ВОЗ охватывают возраст 0–5 лет: для измерений старше
+AGE_RANGE_DAYS z-оценки не считаются (NaN) и такие измерения не
+помечаются выбросами — они учитываются отдельно как out_of_range.
+"""
+import os
+import csv
+import math
+import logging
+from datetime import date
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .models import Patient, GrowthMeasurement
+
+logger = logging.getLogger(__name__)
+
+GROWTH_TABLES_DIR = os.getenv(
+    "GROWTH_TABLES_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "who")
+)
+# Порог |z|, выше которого измерение считается выбросом
+GROWTH_OUTLIER_Z = float(os.getenv("GROWTH_OUTLIER_Z", "3"))
+
+WEIGHT = "wfa"
+HEIGHT = "lhfa"
+INDICATORS = (WEIGHT, HEIGHT)
+SEXES = {"М": "boys", "Ж": "girls"}
+# Последний день расширенных таблиц ВОЗ (5 лет)
+AGE_RANGE_DAYS = 1856
+
+# Центильные кривые для графика (z-оценки для 3, 15, 50, 85, 97 центилей)
+REFERENCE_CENTILES = {"p3": -1.881, "p15": -1.036, "p50": 0.0, "p85": 1.036, "p97": 1.881}
+
+# (indicator, sex) -> (age_days, L, M, S) массивы numpy
+_tables = {}
+
+# ========== ТАБЛИЦЫ LMS ==========
+
+def load_tables(directory: str = GROWTH_TABLES_DIR):
+    """Загружает таблицы LMS в память; повторный вызов ничего не делает"""
+    if _tables:
+        return len(_tables)
+    for indicator in INDICATORS:
+        for sex in SEXES.values():
+            path = os.path.join(directory, f"{indicator}_{sex}.csv")
+            if not os.path.exists(path):
+                logger.error(f"Нет таблицы LMS: {path}, z-оценки по ней не считаются")
+                continue
+            with open(path, newline="") as f:
+                rows = [(float(r["Day"]), float(r["L"]), float(r["M"]), float(r["S"])) for r in csv.DictReader(f)]
+            days = [row[0] for row in rows]
+            if days != [float(day) for day in range(AGE_RANGE_DAYS + 1)]:
+                logger.error(f"Таблица LMS {path} не покрывает дни 0–{AGE_RANGE_DAYS} подряд, пропущена")
+                continue
+            _tables[(indicator, sex)] = tuple(np.array(column) for column in zip(*rows))
+    return len(_tables)
+
+def missing_tables() -> list:
+    """Имена незагруженных таблиц, например ["wfa_boys"]"""
+    return [
+        f"{indicator}_{sex}" for indicator in INDICATORS for sex in SEXES.values()
+        if (indicator, sex) not in _tables
+    ]
+
+def _lms(indicator: str, sex: str, age_days: np.ndarray):
+    """L, M, S для массива возрастов; вне диапазона таблицы — NaN"""
+    table = _tables.get((indicator, SEXES.get(sex, sex)))
+    if table is None:
+        nan = np.full(age_days.shape, np.nan)
+        return nan, nan, nan
+    days, l, m, s = table
+    return tuple(np.interp(age_days, days, column, left=np.nan, right=np.nan) for column in (l, m, s))
+
+# ========== Z-ОЦЕНКИ ==========
+
+def _erf(x: np.ndarray) -> np.ndarray:
+    """Векторная erf (Абрамовиц–Стиган 7.1.26, погрешность < 1.5e-7)"""
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    y = 1.0 - (((((1.061405429 * t - 1.453152027) * t) + 1.421413741) * t - 0.284496736) * t + 0.254829592) * t * np.exp(-x * x)
+    return sign * y
+
+def percentiles(z: np.ndarray) -> np.ndarray:
+    return 50.0 * (1.0 + _erf(z / math.sqrt(2.0)))
+
+def value_at_z(l, m, s, z):
+    """Значение показателя, соответствующее z-оценке"""
+    l = np.where(l == 0, 1e-9, l)
+    return m * np.power(1.0 + l * s * z, 1.0 / l)
+
+def zscores(indicator: str, sex: str, age_days, values) -> np.ndarray:
+    """z-оценки для всего ряда сразу.
+
+    Для веса за пределами ±3 SD применяется поправка ВОЗ (расстояние между
+    SD2 и SD3 как единица), чтобы не раздувать оценки из-за асимметрии.
+    """
+    age_days = np.asarray(age_days, dtype=float)
+    values = np.asarray(values, dtype=float)
+    l, m, s = _lms(indicator, sex, age_days)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        safe_l = np.where(l == 0, 1e-9, l)
+        z = (np.power(values / m, safe_l) - 1.0) / (safe_l * s)
+
+        if indicator == WEIGHT:
+            sd3_pos = value_at_z(l, m, s, 3.0)
+            sd23_pos = sd3_pos - value_at_z(l, m, s, 2.0)
+            sd3_neg = value_at_z(l, m, s, -3.0)
+            sd23_neg = value_at_z(l, m, s, -2.0) - sd3_neg
+            z = np.where(z > 3, 3.0 + (values - sd3_pos) / sd23_pos, z)
+            z = np.where(z < -3, -3.0 + (values - sd3_neg) / sd23_neg, z)
+    return z
+
+# ========== ИЗМЕРЕНИЯ ==========
+
+def parse_measurement(value) -> Optional[float]:
+    """Число из поля формы осмотра ("20,5", "36.6", "") или None"""
+    if value is None or value == "":
+        return None
+    try:
+        number = float(str(value).replace(",", ".").strip())
+    except ValueError:
+        return None
+    return number if number > 0 else None
+
+def measurement_from_examination(patient: Patient, examination: dict, measured_on: date, medical_record_id=None):
+    """GrowthMeasurement из JSON осмотра или None, если измерений нет"""
+    examination = examination or {}
+    weight = parse_measurement(examination.get("weight"))
+    height = parse_measurement(examination.get("height"))
+    temperature = parse_measurement(examination.get("temperature"))
+    if weight is None and height is None and temperature is None:
+        return None
+    return GrowthMeasurement(
+        patient_id=patient.id,
+        medical_record_id=medical_record_id,
+        measured_on=measured_on,
+        age_days=(measured_on - patient.birth_date).days,
+        weight_kg=weight,
+        height_cm=height,
+        temperature_c=temperature
+    )
+
+def growth_chart(db: Session, patient: Patient):
+    """Данные графика роста пациента: ряды с z/центилями и центильные кривые"""
+    rows = db.query(
+        GrowthMeasurement.measured_on,
+        GrowthMeasurement.age_days,
+        GrowthMeasurement.weight_kg,
+        GrowthMeasurement.height_cm
+    ).filter(GrowthMeasurement.patient_id == patient.id).order_by(GrowthMeasurement.measured_on).all()
+
+    chart = {"weight": [], "height": [], "reference": {}, "tables_missing": bool(missing_tables()), "out_of_range": False}
+    if not rows:
+        return chart
+
+    ages = np.array([r.age_days for r in rows], dtype=float)
+    chart["out_of_range"] = bool((ages > AGE_RANGE_DAYS).any())
+    for key, indicator, column in (("weight", WEIGHT, 2), ("height", HEIGHT, 3)):
+        values = np.array([r[column] if r[column] is not None else np.nan for r in rows], dtype=float)
+        z = zscores(indicator, patient.gender, ages, values)
+        p = percentiles(z)
+        for i, row in enumerate(rows):
+            if np.isnan(values[i]):
+                continue
+            chart[key].append({
+                "date": row.measured_on.isoformat(),
+                "age_days": int(ages[i]),
+                "value": float(values[i]),
+                "z": None if np.isnan(z[i]) else round(float(z[i]), 2),
+                "percentile": None if np.isnan(p[i]) else round(float(p[i]), 1)
+            })
+
+        grid = np.arange(max(ages.min() - 30, 0), ages.max() + 31, 30.0)
+        l, m, s = _lms(indicator, patient.gender, grid)
+        if not np.all(np.isnan(m)):
+            chart["reference"][key] = {"age_days": grid.astype(int).tolist()}
+            for name, z_value in REFERENCE_CENTILES.items():
+                curve = value_at_z(l, m, s, z_value)
+                chart["reference"][key][name] = [None if np.isnan(v) else round(float(v), 2) for v in curve]
+    return chart
+
+def flag_outliers(db: Session, threshold: float = GROWTH_OUTLIER_Z):
+    """Пересчитывает z-оценки всех измерений и помечает выбросы.
+
+    Один проход numpy на пол и показатель; в БД пишутся только строки,
+    у которых изменились оценки или флаг.
+    """
+    rows = db.query(
+        GrowthMeasurement.id,
+        GrowthMeasurement.age_days,
+        GrowthMeasurement.weight_kg,
+        GrowthMeasurement.height_cm,
+        GrowthMeasurement.weight_z,
+        GrowthMeasurement.height_z,
+        GrowthMeasurement.is_outlier,
+        Patient.gender
+    ).join(Patient, GrowthMeasurement.patient_id == Patient.id).all()
+    if not rows:
+        return {"measurements": 0, "outliers": 0, "updated": 0, "out_of_range": 0}
+
+    ids = np.array([r.id for r in rows])
+    ages = np.array([r.age_days for r in rows], dtype=float)
+    genders = np.array([r.gender for r in rows])
+    weights = np.array([r.weight_kg if r.weight_kg is not None else np.nan for r in rows], dtype=float)
+    heights = np.array([r.height_cm if r.height_cm is not None else np.nan for r in rows], dtype=float)
+
+    weight_z = np.full(len(rows), np.nan)
+    height_z = np.full(len(rows), np.nan)
+    for sex in SEXES:
+        mask = genders == sex
+        if mask.any():
+            weight_z[mask] = zscores(WEIGHT, sex, ages[mask], weights[mask])
+            height_z[mask] = zscores(HEIGHT, sex, ages[mask], heights[mask])
+
+    with np.errstate(invalid="ignore"):
+        outliers = (np.abs(weight_z) > threshold) | (np.abs(height_z) > threshold)
+
+    def rounded(values):
+        return [None if np.isnan(v) else round(float(v), 2) for v in values]
+
+    weight_z_list, height_z_list = rounded(weight_z), rounded(height_z)
+    updates = []
+    for i, row in enumerate(rows):
+        flag = bool(outliers[i])
+        if (row.weight_z, row.height_z, row.is_outlier) != (weight_z_list[i], height_z_list[i], flag):
+            updates.append({
+                "id": int(ids[i]),
+                "weight_z": weight_z_list[i],
+                "height_z": height_z_list[i],
+                "is_outlier": flag
+            })
+
+    if updates:
+        db.bulk_update_mappings(GrowthMeasurement, updates)
+        db.commit()
+    return {
+        "measurements": len(rows),
+        "outliers": int(outliers.sum()),
+        "updated": len(updates),
+        "out_of_range": int((ages > AGE_RANGE_DAYS).sum()),
+    }
@@ -0,0 +1,92 @@
+import os
+import time
+import hashlib
+import logging
+from sqlalchemy import text
+
+from .database import engine
+from . import growth
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд кэшируется результат проверки готовности
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "5"))
+# Сколько соединений пула открыть при старте
+DB_POOL_WARM_CONNECTIONS = int(os.getenv("DB_POOL_WARM_CONNECTIONS", "5"))
+# Файл, который бот периодически обновляет (см. telegram_bot.write_heartbeat)
+BOT_HEARTBEAT_FILE = os.getenv("BOT_HEARTBEAT_FILE", "bot.heartbeat")
+BOT_HEARTBEAT_MAX_AGE = float(os.getenv("BOT_HEARTBEAT_MAX_AGE", "120"))
+# Считать ли приложение неготовым, если бот не отвечает
+BOT_REQUIRED = os.getenv("BOT_REQUIRED", "False").lower() in ("1", "true", "yes")
+
+# ========== ПРОГРЕВ ==========
+
+def warm_db_pool(connections: int = DB_POOL_WARM_CONNECTIONS):
+    """Открывает соединения пула заранее, чтобы первые запросы не ждали подключения"""
+    opened = []
+    try:
+        for _ in range(connections):
+            connection = engine.connect()
+            connection.execute(text("SELECT 1"))
+            opened.append(connection)
+    finally:
+        for connection in opened:
+            connection.close()
+    return len(opened)
+
+def warm_templates(templates):
+    """Компилирует все Jinja-шаблоны в кэш окружения"""
+    names = [name for name in templates.env.list_templates() if name.endswith(".html")]
+    for name in names:
+        templates.env.get_template(name)
+    return len(names)
+
+def build_static_manifest(static_dir: str):
+    """Строит словарь путь -> короткий хэш содержимого для версионирования статики"""
+    manifest = {}
+    for root, _, files in os.walk(static_dir):
+        for filename in files:
+            full_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(full_path, static_dir).replace(os.sep, "/")
+            with open(full_path, "rb") as f:
+                manifest[relative_path] = hashlib.md5(f.read()).hexdigest()[:10]
+    return manifest
+
+# ========== ПРОВЕРКИ ГОТОВНОСТИ ==========
+
+def check_database():
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        return {"ok": True}
+    except Exception as e:
+        logger.error(f"Проверка БД не прошла: {e}")
+        return {"ok": False, "error": str(e)}
+
+def check_bot():
+    try:
+        age = time.time() - os.path.getmtime(BOT_HEARTBEAT_FILE)
+    except OSError:
+        return {"ok": False, "error": "heartbeat not found"}
+    return {"ok": age <= BOT_HEARTBEAT_MAX_AGE, "heartbeat_age": round(age, 1)}
+
+def check_growth_tables():
+    """Таблицы ВОЗ не влияют на готовность, но их отсутствие должно быть видно"""
+    missing = growth.missing_tables()
+    return {"ok": not missing, "missing": missing}
+
+_ready_cache = {"checked_at": 0.0, "result": None}
+
+def readiness():
+    """Результат проверок БД и бота, кэшируется на READY_CACHE_SECONDS"""
+    now = time.monotonic()
+    if _ready_cache["result"] is not None and now - _ready_cache["checked_at"] < READY_CACHE_SECONDS:
+        return _ready_cache["result"]
+
+    checks = {"database": check_database(), "bot": check_bot(), "growth_tables": check_growth_tables()}
+    ready = checks["database"]["ok"] and (checks["bot"]["ok"] or not BOT_REQUIRED)
+    result = {"status": "ready" if ready else "not_ready", "checks": checks}
+
+    _ready_cache["checked_at"] = now
+    _ready_cache["result"] = result
+    return result
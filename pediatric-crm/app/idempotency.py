@@ -0,0 +1,231 @@
+"""Повтор POST-запросов по заголовку Idempotency-Key.
+
+Первый запрос с ключом выполняется как обычно, его статус и тело ответа
+сохраняются в idempotency_keys. Повтор с тем же ключом получает сохраненный
+ответ без повторного выполнения транзакции. Пока первый запрос выполняется,
+повтор получает 409; тот же ключ с другим телом — 422. Сохраняются только
+успешные ответы: после 4xx (ошибка проверки, конфликт) или 5xx ключ
+освобождается, и клиент может отправить исправленный запрос с тем же ключом.
+
+Тело сравнивается по содержанию, а не побайтно: граница multipart меняется
+от запроса к запросу, поэтому отпечаток строится по отсортированным полям
+формы (файлы — по имени и хэшу) или по каноническому JSON. Ответ больше
+IDEMPOTENCY_MAX_BODY не хранится целиком: повтор получает тот же статус
+и короткую отметку вместо тела, а транзакция не выполняется второй раз.
+"""
+import os
+import json
+import random
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from starlette.datastructures import UploadFile
+from starlette.requests import Request
+
+from .database import SessionLocal
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL_HOURS = float(os.getenv("IDEMPOTENCY_TTL_HOURS", "24"))
+# Через сколько секунд «зависший» незавершенный ключ можно занять заново
+IDEMPOTENCY_PENDING_TIMEOUT = float(os.getenv("IDEMPOTENCY_PENDING_TIMEOUT", "60"))
+# Максимальный размер сохраняемого ответа
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", "65536"))
+
+HEADER = b"idempotency-key"
+# Тело повтора, если исходный ответ был слишком большим для сохранения
+TRUNCATED_BODY = json.dumps({
+    "detail": "Запрос уже выполнен; ответ слишком большой для повтора",
+    "truncated": True
+}, ensure_ascii=False)
+# Потоковые загрузки не буферизуются; повтор загрузки вложения безопасен (хранилище по хэшу)
+STREAMING_PATH_SUFFIXES = ("/attachments",)
+
+def _begin(key: str, fingerprint: str):
+    """Занимает ключ. Возвращает ("run", None), ("replay", запись),
+    ("in_progress", None) или ("mismatch", None)"""
+    db = SessionLocal()
+    try:
+        now = datetime.now()
+        record = db.get(IdempotencyKey, key)
+        if record is not None and record.expires_at < now:
+            db.delete(record)
+            db.flush()
+            record = None
+
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return "mismatch", None
+            if record.status_code is not None:
+                return "replay", (record.status_code, record.content_type, record.response_body)
+            if record.created_at > now - timedelta(seconds=IDEMPOTENCY_PENDING_TIMEOUT):
+                return "in_progress", None
+            record.created_at = now
+            db.commit()
+            return "run", None
+
+        db.add(IdempotencyKey(
+            key=key,
+            fingerprint=fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(hours=IDEMPOTENCY_TTL_HOURS)
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return "in_progress", None
+
+        if random.random() < 0.01:
+            _purge_expired(db)
+        return "run", None
+    finally:
+        db.close()
+
+def _complete(key: str, status_code: int, content_type: str, body: bytes):
+    db = SessionLocal()
+    try:
+        record = db.get(IdempotencyKey, key)
+        if record is None:
+            return
+        if status_code >= 400:
+            db.delete(record)
+        elif len(body) > IDEMPOTENCY_MAX_BODY:
+            record.status_code = status_code
+            record.content_type = "application/json"
+            record.response_body = TRUNCATED_BODY
+        else:
+            record.status_code = status_code
+            record.content_type = content_type
+            record.response_body = body.decode("utf-8", errors="replace")
+        db.commit()
+    finally:
+        db.close()
+
+def _release(key: str):
+    db = SessionLocal()
+    try:
+        db.query(IdempotencyKey).filter(IdempotencyKey.key == key).delete()
+        db.commit()
+    finally:
+        db.close()
+
+def _purge_expired(db):
+    deleted = db.query(IdempotencyKey).filter(IdempotencyKey.expires_at < datetime.now()).delete()
+    db.commit()
+    if deleted:
+        logger.info(f"Удалено просроченных ключей идемпотентности: {deleted}")
+
+async def _fingerprint(scope, body: bytes) -> str:
+    """Отпечаток запроса: метод, путь и содержание тела независимо от его кодирования"""
+    content_type = dict(scope["headers"]).get(b"content-type", b"").decode("latin-1").lower()
+    if content_type.startswith("multipart/form-data"):
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        form = await Request(scope, receive).form()
+        fields = []
+        for name, value in form.multi_items():
+            if isinstance(value, UploadFile):
+                value = f"{value.filename}:{hashlib.sha256(await value.read()).hexdigest()}"
+            fields.append((name, value))
+        await form.close()
+        canonical = json.dumps(sorted(fields), ensure_ascii=False)
+    elif content_type.startswith("application/x-www-form-urlencoded"):
+        fields = parse_qsl(body.decode("utf-8", errors="replace"), keep_blank_values=True)
+        canonical = json.dumps(sorted(fields), ensure_ascii=False)
+    elif content_type.startswith("application/json"):
+        try:
+            canonical = json.dumps(json.loads(body), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            canonical = body.decode("utf-8", errors="replace")
+    else:
+        canonical = body.decode("utf-8", errors="replace")
+    payload = f"{scope['method']}{scope['path']}\n{canonical}"
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def _send_json(send, status_code: int, payload: dict):
+    body = json.dumps(payload, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class IdempotencyMiddleware:
+    """ASGI-middleware для всех POST-эндпоинтов"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].endswith(STREAMING_PATH_SUFFIXES):
+            return await self.app(scope, receive, send)
+        key = dict(scope["headers"]).get(HEADER)
+        if not key:
+            return await self.app(scope, receive, send)
+        key = key.decode("latin-1")[:128]
+
+        # Тело читается целиком: POST-формы и JSON этих эндпоинтов небольшие
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        request_body = b"".join(chunks)
+        fingerprint = await _fingerprint(scope, request_body)
+
+        state, stored = await run_in_threadpool(_begin, key, fingerprint)
+        if state == "replay":
+            status_code, content_type, body = stored
+            body = (body or "").encode()
+            await send({
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", (content_type or "application/json").encode()),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"idempotent-replayed", b"true")
+                ]
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        if state == "in_progress":
+            return await _send_json(send, 409, {"detail": "Запрос с этим Idempotency-Key еще выполняется"})
+        if state == "mismatch":
+            return await _send_json(send, 422, {"detail": "Idempotency-Key уже использован для другого запроса"})
+
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": request_body, "more_body": False}
+            return await receive()
+
+        response = {"status": 500, "content_type": "", "body": []}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["content_type"] = dict(message.get("headers", [])).get(b"content-type", b"").decode()
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(_release, key)
+            raise
+        await run_in_threadpool(
+            _complete, key, response["status"], response["content_type"], b"".join(response["body"])
+        )
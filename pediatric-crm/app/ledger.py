@@ -0,0 +1,124 @@
+"""Денежный учет по принципу двойной записи.
+
+Каждая операция — LedgerTransaction с проводками LedgerEntry, сумма которых
+равна нулю. Счет receivable — задолженность пациента; его остаток хранится
+в patient_balances и обновляется в той же транзакции БД, поэтому отчет
+по должникам и бейдж баланса читаются одной строкой, без агрегации.
+"""
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+from sqlalchemy import update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from .models import Patient, LedgerTransaction, LedgerEntry, PatientBalance
+
+CENTS = Decimal("0.01")
+PAYMENT_METHODS = ("cash", "card", "transfer")
+
+# kind -> (счет дебета, счет кредита); None — счет способа оплаты
+POSTINGS = {
+    "charge": ("receivable", "revenue"),      # начислена стоимость визита
+    "payment": (None, "receivable"),          # пациент заплатил
+    "refund": ("receivable", None),           # возврат пациенту
+    "adjustment": ("revenue", "receivable"),  # скидка или списание долга
+}
+
+class LedgerError(ValueError):
+    pass
+
+def to_money(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+def _apply_balance(db: Session, patient_id: int, delta: Decimal):
+    """Атомарно меняет остаток пациента (balance = balance + delta)"""
+    if db.get_bind().dialect.name == "postgresql":
+        statement = pg_insert(PatientBalance).values(
+            patient_id=patient_id, balance=delta, updated_at=datetime.now()
+        )
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[PatientBalance.patient_id],
+            set_={
+                "balance": PatientBalance.balance + statement.excluded.balance,
+                "updated_at": statement.excluded.updated_at
+            }
+        ))
+        return
+
+    result = db.execute(
+        update(PatientBalance)
+        .where(PatientBalance.patient_id == patient_id)
+        .values(balance=PatientBalance.balance + delta, updated_at=datetime.now())
+    )
+    if result.rowcount == 0:
+        db.add(PatientBalance(patient_id=patient_id, balance=delta, updated_at=datetime.now()))
+        db.flush()
+
+def post(
+    db: Session,
+    patient_id: int,
+    kind: str,
+    amount,
+    method: Optional[str] = None,
+    medical_record_id: Optional[int] = None,
+    comment: str = ""
+) -> LedgerTransaction:
+    """Проводит операцию и обновляет баланс; коммит — на стороне вызывающего"""
+    if kind not in POSTINGS:
+        raise LedgerError(f"Unknown transaction kind: {kind}")
+    amount = to_money(amount)
+    if amount <= 0:
+        raise LedgerError("Amount must be positive")
+    if kind in ("payment", "refund"):
+        method = method or "cash"
+        if method not in PAYMENT_METHODS:
+            raise LedgerError(f"Unknown payment method: {method}")
+
+    debit, credit = POSTINGS[kind]
+    transaction = LedgerTransaction(
+        patient_id=patient_id,
+        medical_record_id=medical_record_id,
+        kind=kind,
+        amount=amount,
+        method=method,
+        comment=comment,
+        created_at=datetime.now()
+    )
+    transaction.entries = [
+        LedgerEntry(account=debit or method, amount=amount),
+        LedgerEntry(account=credit or method, amount=-amount),
+    ]
+    db.add(transaction)
+
+    # Остаток receivable: дебет увеличивает долг, кредит уменьшает
+    delta = amount if debit == "receivable" else -amount
+    _apply_balance(db, patient_id, delta)
+    return transaction
+
+def transfer_balance(db: Session, from_patient_id: int, to_patient_id: int) -> Decimal:
+    """Переносит остаток одного пациента на другого (слияние дублей); коммит — на стороне вызывающего"""
+    balance = get_balance(db, from_patient_id)
+    if balance:
+        _apply_balance(db, to_patient_id, balance)
+    db.query(PatientBalance).filter(PatientBalance.patient_id == from_patient_id).delete(synchronize_session=False)
+    return balance
+
+def get_balance(db: Session, patient_id: int) -> Decimal:
+    balance = db.query(PatientBalance.balance).filter(PatientBalance.patient_id == patient_id).scalar()
+    return balance if balance is not None else Decimal("0.00")
+
+def debtors(db: Session, limit: int = 100, offset: int = 0):
+    """Кто нам должен: по индексу patient_balances.balance"""
+    return db.query(
+        PatientBalance.patient_id,
+        PatientBalance.balance,
+        PatientBalance.updated_at,
+        Patient.first_name,
+        Patient.last_name,
+        Patient.phone
+    ).join(Patient, PatientBalance.patient_id == Patient.id) \
+     .filter(PatientBalance.balance > 0) \
+     .order_by(PatientBalance.balance.desc()) \
+     .limit(limit).offset(offset).all()
@@ -0,0 +1,188 @@
+"""Живое обновление расписания через Server-Sent Events.
+
+Обработчики, меняющие записи, публикуют события в брокер по дате записи,
+а каждая открытая вкладка /appointments держит подписку на свою дату.
+Сообщение сериализуется один раз и раздается всем подписчикам; на
+соединение приходится одна ограниченная очередь готовых строк.
+
+Подписки живут в процессе воркера. При LIVE_BACKEND=redis события идут
+через канал Redis pub/sub, и каждый воркер раздает их своим вкладкам —
+изменение видно всем, через какой бы воркер оно ни прошло. В памяти
+процесса (memory) это возможно только с одним воркером; при нескольких
+поток отвечает 204, и браузер не переподключается: страница работает
+без живого обновления, а не показывает половину изменений.
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import date
+
+from .cache import CACHE_BACKEND, CACHE_REDIS_URL, CACHE_PREFIX
+
+logger = logging.getLogger(__name__)
+
+# memory — брокер в процессе (один воркер), redis — общий канал для всех воркеров
+LIVE_BACKEND = os.getenv("LIVE_BACKEND", CACHE_BACKEND)
+# Число воркеров gunicorn (gunicorn.conf.py выставляет фактическое значение)
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+LIVE_CHANNEL = f"{CACHE_PREFIX}:schedule"
+# Пауза перед переподключением к Redis после обрыва канала
+LIVE_RECONNECT_DELAY = float(os.getenv("LIVE_RECONNECT_DELAY", "1"))
+
+# Сколько событий может ждать отправки одному клиенту; при переполнении клиент перечитывает страницу
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "64"))
+# Интервал комментариев-пингов, чтобы прокси не закрывали простаивающее соединение
+SSE_PING_INTERVAL = float(os.getenv("SSE_PING_INTERVAL", "20"))
+SSE_RETRY_MS = int(os.getenv("SSE_RETRY_MS", "3000"))
+
+RESET_MESSAGE = "event: reset\ndata: {}\n\n"
+
+class ScheduleBroker:
+    """Подписки на изменения расписания по датам внутри процесса"""
+
+    # Без общего канала события одного воркера не дойдут до вкладок другого
+    enabled = WEB_WORKERS <= 1
+
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def subscribe(self, day: date) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[day].add(queue)
+        return queue
+
+    def unsubscribe(self, day: date, queue: asyncio.Queue):
+        with self._lock:
+            subscribers = self._subscribers.get(day)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[day]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def has_listeners(self) -> bool:
+        """Есть ли кому отправлять события (иначе изменения можно не читать)"""
+        return self.subscriber_count() > 0
+
+    def publish(self, day: date, event: str, data: dict):
+        """Отправляет событие всем вкладкам, открытым на дату day.
+
+        Можно вызывать из обработчиков в пуле потоков: доставка передается
+        в цикл событий, где живут очереди.
+        """
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        self._publish_local(day, message)
+
+    async def run(self):
+        """Фоновая задача воркера; брокеру в памяти она не нужна"""
+
+    def _publish_local(self, day: date, message: str):
+        with self._lock:
+            if not self._subscribers.get(day):
+                return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(day, message)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._deliver, day, message)
+
+    def _deliver(self, day: date, message: str):
+        with self._lock:
+            queues = list(self._subscribers.get(day, ()))
+        for queue in queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: вместо хвоста событий — команда перечитать день
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESET_MESSAGE)
+
+    async def stream(self, request, day: date):
+        """Генератор тела ответа text/event-stream для вкладки на дату day"""
+        queue = self.subscribe(day)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=SSE_PING_INTERVAL)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    message = ": ping\n\n"
+                yield message
+        finally:
+            self.unsubscribe(day, queue)
+
+class RedisScheduleBroker(ScheduleBroker):
+    """События расходятся через Redis pub/sub по всем воркерам"""
+
+    enabled = True
+
+    def __init__(self, url=CACHE_REDIS_URL, queue_size: int = SSE_QUEUE_SIZE):
+        import redis
+        from redis import asyncio as aioredis
+
+        super().__init__(queue_size)
+        self._redis = redis.Redis.from_url(url)
+        self._async_redis = aioredis.Redis.from_url(url)
+
+    def has_listeners(self) -> bool:
+        # Подписчики других воркеров отсюда не видны
+        return True
+
+    def publish(self, day: date, event: str, data: dict):
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        try:
+            self._redis.publish(LIVE_CHANNEL, json.dumps({"day": day.isoformat(), "message": message}))
+        except Exception as e:
+            # Хотя бы вкладки этого воркера получат событие
+            logger.warning(f"Канал расписания в Redis недоступен: {e}")
+            self._publish_local(day, message)
+
+    async def run(self):
+        """Слушает канал и раздает события вкладкам своего воркера"""
+        self._loop = asyncio.get_running_loop()
+        while True:
+            try:
+                async with self._async_redis.pubsub() as pubsub:
+                    await pubsub.subscribe(LIVE_CHANNEL)
+                    async for item in pubsub.listen():
+                        if item["type"] != "message":
+                            continue
+                        payload = json.loads(item["data"])
+                        self._publish_local(date.fromisoformat(payload["day"]), payload["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Обрыв канала расписания в Redis: {e}")
+                # За время обрыва события могли потеряться — вкладки перечитают день
+                with self._lock:
+                    days = list(self._subscribers)
+                for day in days:
+                    self._deliver(day, RESET_MESSAGE)
+                await asyncio.sleep(LIVE_RECONNECT_DELAY)
+
+def build_broker() -> ScheduleBroker:
+    if LIVE_BACKEND == "redis":
+        try:
+            return RedisScheduleBroker()
+        except ImportError:
+            logger.error("LIVE_BACKEND=redis, но пакет redis не установлен; используем брокер в памяти")
+    return ScheduleBroker()
+
+schedule_broker = build_broker()
@@ -0,0 +1,162 @@
+"""Общая настройка логирования веб-приложения и бота.
+
+Обработчики логгеров только кладут запись в очередь (QueueHandler). Запись
+на диск с ротацией делает отдельный поток QueueListener, поэтому цикл событий
+не ждет файловую систему. Записи в формате JSON: одна строка — одно событие,
+с идентификатором запроса (web) или чата и апдейта (бот). DEBUG-записи
+выборочно отбрасываются (LOG_DEBUG_SAMPLE_RATE), чтобы подробный режим
+можно было включить и под нагрузкой.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+# Ротация по размеру; если задан LOG_ROTATE_WHEN (например, midnight) — по времени
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "")
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "10"))
+# Доля DEBUG-записей, которые попадают в лог
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1"))
+LOG_TO_STDERR = os.getenv("LOG_TO_STDERR", "False").lower() in ("1", "true", "yes")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Сторонние логгеры, которые пишут слишком много на INFO
+QUIET_LOGGERS = ("httpx", "httpcore", "apscheduler", "multipart")
+# Логгеры сервера со своими обработчиками: перенаправляем в общую очередь
+SERVER_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+request_id = contextvars.ContextVar("request_id", default="-")
+chat_id = contextvars.ContextVar("chat_id", default="-")
+
+# Атрибуты стандартной LogRecord; все остальное — поля из extra=
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "chat_id", "service"}
+
+_listener = None
+
+class ContextFilter(logging.Filter):
+    """Добавляет идентификаторы корреляции; выполняется в потоке и задаче, где вызван логгер"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def filter(self, record):
+        record.service = self.service
+        record.request_id = request_id.get()
+        record.chat_id = chat_id.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю DEBUG-записей; INFO и выше проходят всегда"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "service": getattr(record, "service", "-"),
+            "pid": record.process,
+            "request_id": getattr(record, "request_id", "-"),
+            "chat_id": getattr(record, "chat_id", "-"),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS:
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class _QueueHandler(QueueHandler):
+    """Как QueueHandler, но трассировка исключения остается отдельным полем,
+    а при переполненной очереди запись отбрасывается без ожидания"""
+
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+def _file_handler(service: str) -> logging.Handler:
+    os.makedirs(LOG_DIR, exist_ok=True)
+    # Номер слота воркера gunicorn (gunicorn.conf.py, post_fork): у каждого живого воркера
+    # свой файл, ротация одного файла из нескольких процессов теряет записи. Слот
+    # переходит к воркеру, пришедшему на смену, поэтому число файлов не растет
+    slot = os.getenv("LOG_WORKER_SLOT", "")
+    name = f"{service}-{slot}.log" if slot else f"{service}.log"
+    path = os.path.join(LOG_DIR, name)
+    if LOG_ROTATE_WHEN:
+        return TimedRotatingFileHandler(path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+    return RotatingFileHandler(path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+
+def setup_logging(service: str):
+    """Настраивает корневой логгер процесса; повторный вызов ничего не делает"""
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s %(chat_id)s] %(message)s")
+    handlers = [_file_handler(service)]
+    if LOG_TO_STDERR:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(service))
+    queue_handler.addFilter(SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    for name in SERVER_LOGGERS:
+        server_logger = logging.getLogger(name)
+        server_logger.handlers.clear()
+        server_logger.propagate = True
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
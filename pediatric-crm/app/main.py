@@ -1,23 +1,103 @@
-from fastapi import FastAPI, Request, Depends, HTTPException, Form
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi import FastAPI, APIRouter, Request, Depends, HTTPException, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, RedirectResponse, StreamingResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
 import json
-from typing import Optional
+import asyncio
+import tempfile
+import zipfile
+import os
+from decimal import Decimal
+import time
+import cProfile
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from typing import List, Optional
 
-from .database import get_db, engine
-from .models import Base, Patient, Appointment, MedicalRecord, MedicalTemplate, Payment, Parent, ParentChild
+from .database import get_db, get_read_db, track_queries
+from . import health
+from . import audit
+from . import attachments
+from . import visit_pdf
+from .clinical_search import search_medical_records, medication_names
+from .patient_picker import pick_patients
+from . import growth
+from . import vaccinations
+from . import ledger
+from . import scheduling
+from . import dedupe
+from .notifications import notify_families, notify_visit_summary
+from .live import schedule_broker
+from .idempotency import IdempotencyMiddleware
+from .ratelimit import RateLimitMiddleware
+from .logging_config import setup_logging, request_id
+from .cache import cache, TEMPLATES, STATS, AVAILABILITY
+from .schemas import MedicalRecordIn, MedicalRecordCreated, PatientItem, AppointmentItem
+from .models import Patient, Appointment, MedicalRecord, MedicalTemplate, Payment, Parent, ParentChild, Vaccination, VaccinationDue, LedgerTransaction, AppointmentSeries, Attachment, PatientSummary
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-# Монтируем статические файлы
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
+# Режим отладки: счетчики SQL в заголовках ответа
+DEBUG = os.getenv("DEBUG", "False").lower() in ("1", "true", "yes")
+# Профилирование отдельного запроса по заголовку X-Profile: 1
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "False").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Фильтр «давно не были»: последний визит раньше, чем столько дней назад
+LAPSED_AFTER_DAYS = int(os.getenv("LAPSED_AFTER_DAYS", "365"))
 
-# Создаем таблицы
-Base.metadata.create_all(bind=engine)
+STATIC_DIR = "app/static"
+TEMPLATES_DIR = "app/templates"
+
+templates = Jinja2Templates(directory=TEMPLATES_DIR)
+router = APIRouter()
+# JSON-API: тело запроса — JSON по моделям app/schemas.py, ответы сериализует orjson
+api_v2 = APIRouter(prefix="/api/v2", default_response_class=ORJSONResponse)
+
+# Манифест статики: путь -> хэш содержимого, заполняется при старте
+static_manifest = {}
+
+def static_version(path: str) -> str:
+    return static_manifest.get(path.lstrip("/"), "")
+
+async def query_stats_middleware(request: Request, call_next):
+    """Считает SQL-запросы обработчика и по запросу профилирует его"""
+    route = f"{request.method} {request.url.path}"
+    client = request.client.host if request.client else "-"
+    audit.current_actor.set(f"web:{client} {route}")
+    # Идентификатор от nginx или новый; возвращается клиенту для поиска записей лога
+    correlation_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    request_id.set(correlation_id)
+    with track_queries(route) as stats:
+        if PROFILING_ENABLED and request.headers.get("X-Profile") == "1":
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profile_path = os.path.join(
+                PROFILE_DIR,
+                f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{request.url.path.replace('/', '_')}.prof"
+            )
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+            # Клиенту — только имя файла: путь на сервере ему не нужен
+            logger.info(f"Профиль {route} записан в {profile_path}")
+            response.headers["X-Profile-File"] = os.path.basename(profile_path)
+        else:
+            response = await call_next(request)
+
+    if DEBUG:
+        response.headers["X-DB-Queries"] = str(stats.count)
+        response.headers["X-DB-Time-Ms"] = f"{stats.total_ms:.1f}"
+        response.headers["X-DB-Source"] = stats.db_source
+    response.headers["X-Request-ID"] = correlation_id
+    return response
 
 # Вспомогательная функция для расчета возраста
 def calculate_age(birth_date):
@@ -27,30 +107,108 @@ def calculate_age(birth_date):
     age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
     return age
 
-# Добавляем функцию в шаблоны
+def appointment_row(appointment: Appointment, patient: Optional[Patient]):
+    """Строка расписания: и для шаблона, и для событий SSE"""
+    return {
+        'id': appointment.id,
+        'date': appointment.date.isoformat(),
+        'time': appointment.time.strftime('%H:%M'),
+        'patient_name': f"{patient.last_name} {patient.first_name}" if patient else "Неизвестный",
+        'patient_age': calculate_age(patient.birth_date) if patient and patient.birth_date else None,
+        'type': appointment.type,
+        'status': appointment.status,
+        'notes': appointment.comment
+    }
+
+def publish_schedule(db: Session, *conditions, moved_from=()):
+    """Рассылает открытым вкладкам расписания новое состояние записей.
+
+    conditions выбирают измененные записи; moved_from — пары (id, старая дата)
+    для записей, перенесенных на другой день. Без подписчиков ничего не читает.
+    """
+    if not schedule_broker.has_listeners():
+        return
+    rows = db.query(Appointment, Patient).outerjoin(Patient, Patient.id == Appointment.patient_id) \
+        .filter(*conditions).all()
+    for appointment, patient in rows:
+        schedule_broker.publish(appointment.date, "upsert", appointment_row(appointment, patient))
+    for appointment_id, old_date in moved_from:
+        schedule_broker.publish(old_date, "remove", {"id": appointment_id})
+
+def moved_appointments(changes: list):
+    return [(c["id"], c["before"]["date"]) for c in changes if "date" in c["after"]]
+
+def get_dashboard_stats(db: Session):
+    """Счетчики для главной страницы (кэшируются до изменения пациентов или записей)"""
+    def load():
+        by_status = dict(db.query(Patient.status, func.count(Patient.id)).group_by(Patient.status).all())
+        return {
+            'total_patients': sum(by_status.values()),
+            'new_patients': by_status.get('new', 0),
+            'active_patients': by_status.get('confirmed', 0),
+            'today_appointments': db.query(Appointment).filter(Appointment.date == date.today()).count()
+        }
+
+    return cache.get_or_set(STATS, f"dashboard:{date.today().isoformat()}", load)
+
+def get_templates_data(db: Session):
+    """Медицинские шаблоны в виде словарей (общий кэш для всех воркеров)"""
+    def load():
+        return [{
+            "id": t.id,
+            "name": t.name,
+            "diagnosis": t.diagnosis,
+            "prescriptions": t.prescriptions
+        } for t in db.query(MedicalTemplate).order_by(MedicalTemplate.id).all()]
+
+    return cache.get_or_set(TEMPLATES, "all", load)
+
+# Добавляем функции в шаблоны
 templates.env.globals["calculate_age"] = calculate_age
+templates.env.globals["static_version"] = static_version
+
+# Сортировки и фильтры списка пациентов — по индексированным полям patient_summary
+PATIENT_SORTS = {
+    "created": (Patient.created_at.desc(),),
+    "name": (Patient.last_name, Patient.first_name),
+    "last_visit": (PatientSummary.last_visit_date.desc().nullslast(), Patient.id),
+    "next_visit": (PatientSummary.next_visit_date.nullslast(), PatientSummary.next_visit_time, Patient.id),
+    "visits": (PatientSummary.visits_count.desc(), Patient.id),
+    "balance": (PatientSummary.balance.desc(), Patient.id),
+}
+PATIENT_FILTERS = {
+    "all": lambda today: [],
+    "debt": lambda today: [PatientSummary.balance > 0],
+    "upcoming": lambda today: [PatientSummary.next_visit_date >= today],
+    # Пациент без строки сводки (еще не пересчитан) тоже без визитов
+    "no_visits": lambda today: [or_(PatientSummary.visits_count == 0, PatientSummary.patient_id.is_(None))],
+    "lapsed": lambda today: [PatientSummary.last_visit_date < today - timedelta(days=LAPSED_AFTER_DAYS)],
+}
 
 # ========== ГЛАВНЫЕ СТРАНИЦЫ ==========
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root(request: Request, db: Session = Depends(get_db)):
-    patients = db.query(Patient).order_by(Patient.created_at.desc()).all()
+@router.get("/", response_class=HTMLResponse)
+async def read_root(request: Request, sort: str = "created", filter: str = "all", db: Session = Depends(get_db)):
+    sort = sort if sort in PATIENT_SORTS else "created"
+    filter = filter if filter in PATIENT_FILTERS else "all"
+    patients = db.query(Patient, PatientSummary) \
+        .outerjoin(PatientSummary, PatientSummary.patient_id == Patient.id) \
+        .filter(*PATIENT_FILTERS[filter](date.today())) \
+        .order_by(*PATIENT_SORTS[sort]).all()
     
     # Получаем статистику
-    stats = {
-        'total_patients': len(patients),
-        'new_patients': len([p for p in patients if p.status == 'new']),
-        'active_patients': len([p for p in patients if p.status == 'confirmed']),
-        'today_appointments': db.query(Appointment).filter(Appointment.date == date.today()).count()
-    }
+    stats = get_dashboard_stats(db)
     
     return templates.TemplateResponse("patients/list.html", {
         "request": request,
         "patients": patients,
+        "sort": sort,
+        "filter": filter,
+        "today": date.today(),
         "stats": stats
     })
 
-@app.get("/patients/{patient_id}", response_class=HTMLResponse)
+@router.get("/patients/{patient_id}", response_class=HTMLResponse)
 async def patient_detail(request: Request, patient_id: int, db: Session = Depends(get_db)):
     patient = db.query(Patient).filter(Patient.id == patient_id).first()
     if not patient:
@@ -65,15 +223,17 @@ async def patient_detail(request: Request, patient_id: int, db: Session = Depend
     return templates.TemplateResponse("patients/detail.html", {
         "request": request,
         "patient": patient,
+        "summary": db.get(PatientSummary, patient_id),
+        "today": date.today(),
         "appointments": appointments,
         "parents": parents
     })
 
-@app.get("/create-patient", response_class=HTMLResponse)
+@router.get("/create-patient", response_class=HTMLResponse)
 async def create_patient_page(request: Request):
     return templates.TemplateResponse("patients/create.html", {"request": request})
 
-@app.get("/appointments", response_class=HTMLResponse)
+@router.get("/appointments", response_class=HTMLResponse)
 async def appointments_page(request: Request, db: Session = Depends(get_db)):
     # Получаем даты для навигации
     today = date.today()
@@ -87,22 +247,10 @@ async def appointments_page(request: Request, db: Session = Depends(get_db)):
     except:
         selected_date = today
     
-    # Получаем записи на выбранную дату
-    appointments = db.query(Appointment).filter(Appointment.date == selected_date).order_by(Appointment.time).all()
-    
-    # Формируем данные для отображения
-    appointments_data = []
-    for appointment in appointments:
-        patient = db.query(Patient).filter(Patient.id == appointment.patient_id).first()
-        appointments_data.append({
-            'id': appointment.id,
-            'time': appointment.time.strftime('%H:%M'),
-            'patient_name': f"{patient.last_name} {patient.first_name}" if patient else "Неизвестный",
-            'patient_age': calculate_age(patient.birth_date) if patient and patient.birth_date else None,
-            'type': appointment.type,
-            'status': appointment.status,
-            'notes': appointment.comment
-        })
+    # Получаем записи на выбранную дату вместе с пациентами одним запросом
+    rows = db.query(Appointment, Patient).outerjoin(Patient, Patient.id == Appointment.patient_id) \
+        .filter(Appointment.date == selected_date).order_by(Appointment.time).all()
+    appointments_data = [appointment_row(appointment, patient) for appointment, patient in rows]
     
     return templates.TemplateResponse("appointments/list.html", {
         "request": request,
@@ -116,34 +264,38 @@ async def appointments_page(request: Request, db: Session = Depends(get_db)):
         }
     })
 
-@app.get("/reports", response_class=HTMLResponse)
-async def reports_page(request: Request, db: Session = Depends(get_db)):
+@router.get("/reports", response_class=HTMLResponse)
+async def reports_page(request: Request, db: Session = Depends(get_read_db)):
     # Базовая статистика для отчетов
-    total_patients = db.query(Patient).count()
-    total_appointments = db.query(Appointment).count()
-    completed_appointments = db.query(Appointment).filter(Appointment.status == 'completed').count()
+    def load_stats():
+        return {
+            'total_patients': db.query(Patient).count(),
+            'total_appointments': db.query(Appointment).count(),
+            'completed_appointments': db.query(Appointment).filter(Appointment.status == 'completed').count()
+        }
     
     return templates.TemplateResponse("reports/list.html", {
         "request": request,
-        "stats": {
-            'total_patients': total_patients,
-            'total_appointments': total_appointments,
-            'completed_appointments': completed_appointments
-        }
+        "stats": cache.get_or_set(STATS, "reports", load_stats)
     })
 
-@app.get("/settings", response_class=HTMLResponse)
+@router.get("/settings", response_class=HTMLResponse)
 async def settings_page(request: Request, db: Session = Depends(get_db)):
-    templates_list = db.query(MedicalTemplate).all()
     return templates.TemplateResponse("settings/list.html", {
         "request": request,
-        "templates": templates_list
+        "templates": get_templates_data(db)
     })
 
 # ========== API ЭНДПОИНТЫ ==========
 
+# Списки выбирают только отдаваемые колонки, без загрузки ORM-объектов
+PATIENT_LIST_COLUMNS = (Patient.id, Patient.first_name, Patient.last_name, Patient.birth_date, Patient.phone, Patient.status)
+APPOINTMENT_LIST_COLUMNS = (
+    Appointment.id, Appointment.patient_id, Appointment.date, Appointment.time, Appointment.type, Appointment.status
+)
+
 # Пациенты
-@app.post("/api/patients")
+@router.post("/api/patients")
 async def create_patient(
     first_name: str = Form(...),
     last_name: str = Form(...),
@@ -156,12 +308,28 @@ async def create_patient(
     email: str = Form(""),
     birth_weight: int = Form(0),
     birth_height: int = Form(0),
+    force: bool = Form(False),
     db: Session = Depends(get_db)
 ):
     try:
         # Преобразуем дату рождения
         birth_date_obj = datetime.strptime(birth_date, "%Y-%m-%d").date()
-        
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid birth date format")
+    
+    # Похожие карточки: регистратор подтверждает создание повторной отправкой с force
+    if not force:
+        candidates = dedupe.find_candidates(
+            db, first_name, last_name, birth_date_obj, gender=gender, phone=phone, parent_phone=parent_phone
+        )
+        if candidates:
+            return JSONResponse({
+                "status": "duplicate",
+                "message": "Похожий пациент уже есть",
+                "candidates": candidates
+            }, status_code=409)
+    
+    try:
         patient = Patient(
             first_name=first_name,
             last_name=last_name,
@@ -181,6 +349,7 @@ async def create_patient(
         db.add(patient)
         db.commit()
         db.refresh(patient)
+        cache.invalidate(STATS)
         
         return JSONResponse({
             "status": "success", 
@@ -192,9 +361,9 @@ async def create_patient(
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/patients")
+@router.get("/api/patients")
 async def get_patients(db: Session = Depends(get_db)):
-    patients = db.query(Patient).all()
+    patients = db.query(*PATIENT_LIST_COLUMNS).all()
     return [{
         "id": p.id,
         "first_name": p.first_name,
@@ -204,7 +373,51 @@ async def get_patients(db: Session = Depends(get_db)):
         "status": p.status
     } for p in patients]
 
-@app.put("/api/patients/{patient_id}/basic")
+@router.get("/api/patients/picker")
+async def patient_picker(q: str = "", limit: int = 20, cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    """Страница пациентов для формы записи: только id, имя и возраст"""
+    try:
+        rows, next_cursor = pick_patients(db, q=q.strip(), limit=max(1, min(limit, 100)), cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": [{
+            "id": r.id,
+            "name": f"{r.last_name} {r.first_name}",
+            "age": calculate_age(r.birth_date)
+        } for r in rows],
+        "next_cursor": next_cursor
+    }
+
+@router.get("/api/patients/{patient_id}/duplicates")
+async def get_patient_duplicates(patient_id: int, db: Session = Depends(get_db)):
+    """Возможные дубли карточки (те же блоки и оценка, что при создании)"""
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return {"candidates": dedupe.find_candidates(
+        db, patient.first_name, patient.last_name, patient.birth_date, gender=patient.gender,
+        phone=patient.phone, parent_phone=patient.parent_phone, exclude_id=patient_id
+    )}
+
+@router.post("/api/patients/{patient_id}/merge")
+async def merge_patient(patient_id: int, duplicate_id: int = Form(...), db: Session = Depends(get_db)):
+    """Слияние дубля duplicate_id в карточку patient_id; дубль удаляется"""
+    try:
+        moved = dedupe.merge_patients(db, patient_id, duplicate_id)
+        db.commit()
+    except dedupe.DedupeError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    vaccinations.refresh_due(db, patient_ids=[patient_id])
+    cache.invalidate(STATS)
+    return {"status": "success", "patient_id": patient_id, "moved": moved}
+
+@router.put("/api/patients/{patient_id}/basic")
 async def update_patient_basic(
     patient_id: int,
     first_name: str = Form(...),
@@ -226,7 +439,7 @@ async def update_patient_basic(
         raise HTTPException(status_code=500, detail=str(e))
 
 # Записи
-@app.post("/api/appointments")
+@router.post("/api/appointments")
 async def create_appointment(
     patient_id: int = Form(...),
     date: str = Form(...),
@@ -243,6 +456,7 @@ async def create_appointment(
         patient = db.query(Patient).filter(Patient.id == patient_id).first()
         if not patient:
             raise HTTPException(status_code=404, detail="Patient not found")
+        scheduling.reserve_slot(db, appointment_date, appointment_time)
         
         appointment = Appointment(
             patient_id=patient_id,
@@ -257,21 +471,27 @@ async def create_appointment(
         db.add(appointment)
         db.commit()
         db.refresh(appointment)
+        cache.invalidate(STATS, AVAILABILITY)
+        publish_schedule(db, Appointment.id == appointment.id)
         
         return JSONResponse({
             "status": "success", 
-            "appointment_id": appointment.id
+            "appointment_id": appointment.id,
+            "appointment": appointment_row(appointment, patient)
         })
         
+    except scheduling.SlotConflictError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "conflicts": e.conflicts})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=f"Invalid date or time format: {str(e)}")
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/appointments")
+@router.get("/api/appointments")
 async def get_appointments(db: Session = Depends(get_db)):
-    appointments = db.query(Appointment).all()
+    appointments = db.query(*APPOINTMENT_LIST_COLUMNS).all()
     return [{
         "id": a.id,
         "patient_id": a.patient_id,
@@ -281,56 +501,271 @@ async def get_appointments(db: Session = Depends(get_db)):
         "status": a.status
     } for a in appointments]
 
+@router.get("/api/appointments/stream")
+async def appointments_stream(request: Request, date: str):
+    """SSE-поток изменений расписания на дату (события upsert, remove, reset).
+
+    204 — живое обновление недоступно (несколько воркеров без общего канала),
+    EventSource на такой ответ не переподключается.
+    """
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if not schedule_broker.enabled:
+        return Response(status_code=204)
+    return StreamingResponse(
+        schedule_broker.stream(request, day),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/api/appointments/bulk")
+async def bulk_update_appointments(
+    action: str = Form(...),
+    ids: str = Form(""),
+    date_from: Optional[str] = Form(None),
+    date_to: Optional[str] = Form(None),
+    time_from: Optional[str] = Form(None),
+    time_to: Optional[str] = Form(None),
+    new_date: Optional[str] = Form(None),
+    new_time: Optional[str] = Form(None),
+    shift_days: int = Form(0),
+    shift_minutes: int = Form(0),
+    notify: bool = Form(True),
+    db: Session = Depends(get_db)
+):
+    """Подтвердить, отменить, перенести или сдвинуть набор записей.
+
+    Набор задается списком ids через запятую или диапазоном дат/времени.
+    Родителям уходит одно сообщение на семью со всеми изменениями.
+    """
+    try:
+        conditions = scheduling.appointment_filter(
+            ids=[int(i) for i in ids.split(",") if i.strip()],
+            date_from=datetime.strptime(date_from, "%Y-%m-%d").date() if date_from else None,
+            date_to=datetime.strptime(date_to, "%Y-%m-%d").date() if date_to else None,
+            time_from=datetime.strptime(time_from, "%H:%M").time() if time_from else None,
+            time_to=datetime.strptime(time_to, "%H:%M").time() if time_to else None
+        )
+        changes = scheduling.apply_bulk_action(
+            db, action, conditions,
+            new_date=datetime.strptime(new_date, "%Y-%m-%d").date() if new_date else None,
+            new_time=datetime.strptime(new_time, "%H:%M").time() if new_time else None,
+            shift_days=shift_days,
+            shift_minutes=shift_minutes
+        )
+        families = notify_families(db, changes) if notify else 0
+        db.commit()
+    except scheduling.SlotConflictError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "conflicts": e.conflicts})
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if changes:
+        cache.invalidate(STATS, AVAILABILITY)
+        publish_schedule(
+            db, Appointment.id.in_([c["id"] for c in changes]), moved_from=moved_appointments(changes)
+        )
+    return {
+        "status": "success",
+        "changed": len(changes),
+        "notified_families": families,
+        "diff": scheduling.compact_diff(changes)
+    }
+
+# Серии записей
+def series_data(db: Session, series: AppointmentSeries):
+    appointments = db.query(Appointment.id, Appointment.date, Appointment.time, Appointment.status) \
+        .filter(Appointment.series_id == series.id).order_by(Appointment.date).all()
+    return {
+        "id": series.id,
+        "patient_id": series.patient_id,
+        "type": series.type,
+        "start_date": series.start_date.isoformat(),
+        "time": series.time.strftime('%H:%M'),
+        "interval_weeks": series.interval_weeks,
+        "count": series.count,
+        "comment": series.comment,
+        "status": series.status,
+        "appointments": [{
+            "id": a.id,
+            "date": a.date.isoformat(),
+            "time": a.time.strftime('%H:%M'),
+            "status": a.status
+        } for a in appointments]
+    }
+
+@router.post("/api/appointment-series")
+async def create_appointment_series(
+    patient_id: int = Form(...),
+    start_date: str = Form(...),
+    time: str = Form(...),
+    type: str = Form("consultation"),
+    interval_weeks: int = Form(1),
+    count: int = Form(...),
+    notes: str = Form(""),
+    skip_conflicts: bool = Form(False),
+    db: Session = Depends(get_db)
+):
+    """Серия записей в один слот каждые interval_weeks недель, count раз"""
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    try:
+        series, dates, skipped = scheduling.create_series(
+            db,
+            patient_id=patient_id,
+            start_date=datetime.strptime(start_date, "%Y-%m-%d").date(),
+            slot_time=datetime.strptime(time, "%H:%M").time(),
+            appointment_type=type,
+            interval_weeks=interval_weeks,
+            count=count,
+            comment=notes,
+            skip_conflicts=skip_conflicts
+        )
+        db.commit()
+    except scheduling.SlotConflictError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "conflicts": e.conflicts})
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    cache.invalidate(STATS, AVAILABILITY)
+    publish_schedule(db, Appointment.series_id == series.id)
+    return JSONResponse({
+        "status": "success",
+        "series_id": series.id,
+        "created": [d.isoformat() for d in dates],
+        "skipped": [d.isoformat() for d in skipped]
+    })
+
+@router.get("/api/appointment-series/{series_id}")
+async def get_appointment_series(series_id: int, db: Session = Depends(get_db)):
+    series = db.query(AppointmentSeries).filter(AppointmentSeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+    return series_data(db, series)
+
+@router.put("/api/appointment-series/{series_id}")
+async def update_appointment_series(
+    series_id: int,
+    time: Optional[str] = Form(None),
+    type: Optional[str] = Form(None),
+    notes: Optional[str] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """Изменение всех будущих записей серии"""
+    series = db.query(AppointmentSeries).filter(AppointmentSeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+    if series.status == "cancelled":
+        raise HTTPException(status_code=400, detail="Series is cancelled")
+    
+    try:
+        conditions = scheduling.future_series_filter(series_id)
+        changes = []
+        if time:
+            new_time = datetime.strptime(time, "%H:%M").time()
+            changes = scheduling.apply_bulk_action(db, "reschedule", conditions, new_time=new_time)
+            series.time = new_time
+        values = {}
+        if type:
+            values["type"] = series.type = type
+        if notes is not None:
+            values["comment"] = series.comment = notes
+        if values:
+            scheduling.update_series_fields(db, conditions, values)
+        families = notify_families(db, changes)
+        db.commit()
+    except scheduling.SlotConflictError as e:
+        db.rollback()
+        raise HTTPException(status_code=409, detail={"message": str(e), "conflicts": e.conflicts})
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    cache.invalidate(AVAILABILITY)
+    publish_schedule(db, *scheduling.future_series_filter(series_id))
+    return {"status": "success", "notified_families": families, "diff": scheduling.compact_diff(changes)}
+
+@router.post("/api/appointment-series/{series_id}/cancel")
+async def cancel_appointment_series(series_id: int, db: Session = Depends(get_db)):
+    """Отмена серии: все будущие незавершенные записи отменяются одним UPDATE"""
+    series = db.query(AppointmentSeries).filter(AppointmentSeries.id == series_id).first()
+    if not series:
+        raise HTTPException(status_code=404, detail="Series not found")
+    
+    try:
+        changes = scheduling.apply_bulk_action(db, "cancel", scheduling.future_series_filter(series_id))
+        series.status = "cancelled"
+        families = notify_families(db, changes)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    cache.invalidate(STATS, AVAILABILITY)
+    publish_schedule(db, Appointment.id.in_([c["id"] for c in changes]))
+    return {"status": "success", "notified_families": families, "diff": scheduling.compact_diff(changes)}
+
 # Медицинские записи и шаблоны
-@app.get("/visit-result/{appointment_id}", response_class=HTMLResponse)
+@router.get("/visit-result/{appointment_id}", response_class=HTMLResponse)
 async def visit_result_page(request: Request, appointment_id: int, db: Session = Depends(get_db)):
     appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
     if not appointment:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
     patient = db.query(Patient).filter(Patient.id == appointment.patient_id).first()
-    templates_list = db.query(MedicalTemplate).all()
     
     return templates.TemplateResponse("visit_result.html", {
         "request": request,
         "appointment": appointment,
         "patient": patient,
-        "templates": templates_list
+        "templates": get_templates_data(db)
     })
 
-@app.get("/api/medical-templates")
+@router.get("/api/medical-templates")
 async def get_medical_templates(db: Session = Depends(get_db)):
-    templates = db.query(MedicalTemplate).all()
-    return {"templates": [{"id": t.id, "name": t.name, "diagnosis": t.diagnosis, "prescriptions": t.prescriptions} for t in templates]}
+    return {"templates": get_templates_data(db)}
 
-@app.post("/api/medical-records")
-async def create_medical_record(
-    appointment_id: int = Form(...),
-    complaints: str = Form(""),
-    examination: str = Form("{}"),
-    diagnosis: str = Form("{}"),
-    prescriptions: str = Form("[]"),
-    recommendations: str = Form(""),
-    next_visit_date: Optional[str] = Form(None),
-    next_visit_time: Optional[str] = Form(None),
-    next_visit_type: Optional[str] = Form(None),
-    create_next_appointment: bool = Form(False),
-    payment_amount: float = Form(0),
-    payment_status: str = Form("pending"),
-    payment_method: str = Form("cash"),
-    send_to_parents: bool = Form(False),
-    template_id: Optional[int] = Form(None),
-    db: Session = Depends(get_db)
-):
+def save_medical_record(db: Session, data: MedicalRecordIn) -> dict:
+    """Сохраняет итоги визита: запись, оплату, измерения, следующий визит, уведомление.
+
+    Возвращает тело ответа MedicalRecordCreated; если повторные визиты не
+    удалось создать, итоги все равно сохраняются, а причина уходит в warning.
+    """
+    appointment_id = data.appointment_id
+    appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    if not appointment:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+
+    next_visit_time = datetime.strptime(data.next_visit_time, "%H:%M").time() if data.next_visit_time else None
     try:
         # Создаем медицинскую запись
         medical_record = MedicalRecord(
             appointment_id=appointment_id,
-            complaints=complaints,
-            examination=json.loads(examination),
-            diagnosis=json.loads(diagnosis),
-            prescriptions=json.loads(prescriptions),
-            recommendations=recommendations,
+            # Внешний ключ на секционированную appointments — по (id, archived, date)
+            appointment_archived=appointment.archived,
+            appointment_date=appointment.date,
+            complaints=data.complaints,
+            examination=data.examination.model_dump(),
+            diagnosis=data.diagnosis.model_dump(),
+            prescriptions=data.prescriptions.model_dump(),
+            recommendations=data.recommendations,
             created_at=datetime.now()
         )
         
@@ -340,54 +775,564 @@ async def create_medical_record(
         # Создаем запись об оплате
         payment = Payment(
             medical_record_id=medical_record.id,
-            amount=payment_amount,
-            status=payment_status,
-            method=payment_method
+            amount=ledger.to_money(data.payment_amount),
+            status=data.payment_status,
+            method=data.payment_method
         )
         db.add(payment)
         
         # Обновляем статус записи на "завершено"
-        appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
         if appointment:
             appointment.status = "completed"
+            
+            # Начисление за визит и оплата — в журнал, в той же транзакции
+            if data.payment_amount > 0:
+                ledger.post(db, appointment.patient_id, "charge", data.payment_amount, medical_record_id=medical_record.id)
+                if data.payment_status == "paid":
+                    ledger.post(
+                        db, appointment.patient_id, "payment", data.payment_amount,
+                        method=data.payment_method, medical_record_id=medical_record.id
+                    )
+            
+            # Выносим вес, рост и температуру в ряд измерений
+            if appointment.patient and appointment.patient.birth_date:
+                measurement = growth.measurement_from_examination(
+                    appointment.patient, medical_record.examination, appointment.date, medical_record.id
+                )
+                if measurement:
+                    db.add(measurement)
         
-        # Создаем следующую запись если нужно
-        if create_next_appointment and next_visit_date and next_visit_time:
+        # Создаем следующую запись (или серию повторных визитов) если нужно
+        next_appointment = next_series = warning = None
+        create_next = data.create_next_appointment and data.next_visit_date and next_visit_time
+        if create_next and data.next_visit_repeat_count > 1:
+            try:
+                next_series, _, _ = scheduling.create_series(
+                    db,
+                    patient_id=appointment.patient_id,
+                    start_date=data.next_visit_date,
+                    slot_time=next_visit_time,
+                    appointment_type=data.next_visit_type or "control",
+                    interval_weeks=data.next_visit_interval_weeks,
+                    count=data.next_visit_repeat_count,
+                    status="confirmed",
+                    skip_conflicts=True
+                )
+            except scheduling.SchedulingError as e:
+                # Ошибка проверяется до вставки: итоги визита сохраняем, серию врач назначит вручную
+                warning = f"Повторные визиты не созданы: {e}"
+        elif create_next:
             next_appointment = Appointment(
                 patient_id=appointment.patient_id,
-                date=datetime.strptime(next_visit_date, "%Y-%m-%d").date(),
+                date=data.next_visit_date,
                 time=next_visit_time,
-                type=next_visit_type or "control",
+                type=data.next_visit_type or "control",
                 status="confirmed",
                 created_at=datetime.now()
             )
             db.add(next_appointment)
         
+        if data.send_to_parents and appointment:
+            notify_visit_summary(db, medical_record.id, appointment.patient_id, appointment.date)
+        
         db.commit()
+        cache.invalidate(STATS, AVAILABILITY)
+        publish_schedule(db, Appointment.id == appointment_id)
+        if next_appointment:
+            publish_schedule(db, Appointment.id == next_appointment.id)
+        if next_series:
+            publish_schedule(db, Appointment.series_id == next_series.id)
+        # PDF итогов готовится сразу: к печати и к отправке ботом он уже будет в кэше
+        summary = visit_pdf.visit_summary(db, medical_record.id)
+        if summary:
+            visit_pdf.prerender(summary)
         
-        return JSONResponse({"status": "success", "medical_record_id": medical_record.id})
+        return {"status": "success", "medical_record_id": medical_record.id, "warning": warning}
         
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
-# Родители для бота
-@app.get("/api/parents")
-async def get_parents(db: Session = Depends(get_db)):
-    parents = db.query(Parent).all()
+@router.post("/api/medical-records")
+async def create_medical_record(
+    appointment_id: int = Form(...),
+    complaints: str = Form(""),
+    examination: str = Form("{}"),
+    diagnosis: str = Form("{}"),
+    prescriptions: str = Form("[]"),
+    recommendations: str = Form(""),
+    next_visit_date: Optional[str] = Form(None),
+    next_visit_time: Optional[str] = Form(None),
+    next_visit_type: Optional[str] = Form(None),
+    create_next_appointment: bool = Form(False),
+    next_visit_repeat_count: int = Form(1),
+    next_visit_interval_weeks: int = Form(1),
+    payment_amount: Decimal = Form(Decimal("0")),
+    payment_status: str = Form("pending"),
+    payment_method: str = Form("cash"),
+    send_to_parents: bool = Form(False),
+    template_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """Форма визита: осмотр, диагноз и назначения приходят JSON-строками в полях"""
+    try:
+        prescriptions_data = json.loads(prescriptions)
+        # Старый формат назначений — просто список из шаблона
+        if isinstance(prescriptions_data, list):
+            prescriptions_data = {"template": prescriptions_data}
+        data = MedicalRecordIn(
+            appointment_id=appointment_id,
+            complaints=complaints,
+            examination=json.loads(examination),
+            diagnosis=json.loads(diagnosis),
+            prescriptions=prescriptions_data,
+            recommendations=recommendations,
+            next_visit_date=next_visit_date or None,
+            next_visit_time=next_visit_time or None,
+            next_visit_type=next_visit_type or None,
+            create_next_appointment=create_next_appointment,
+            next_visit_repeat_count=next_visit_repeat_count,
+            next_visit_interval_weeks=next_visit_interval_weeks,
+            payment_amount=payment_amount,
+            payment_status=payment_status,
+            payment_method=payment_method,
+            send_to_parents=send_to_parents,
+            template_id=template_id
+        )
+    except ValueError as e:
+        # Сюда же попадает ValidationError pydantic
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    return JSONResponse(save_medical_record(db, data))
+
+@router.get("/api/medical-records/{record_id}/pdf")
+async def medical_record_pdf(request: Request, record_id: int, db: Session = Depends(get_db)):
+    """PDF итогов визита; повторные запросы отдаются из кэша, ETag — версия записи"""
+    summary = visit_pdf.visit_summary(db, record_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Medical record not found")
+    etag = f'"{visit_pdf.summary_version(summary)}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        path = await visit_pdf.ensure_pdf(summary)
+    except visit_pdf.RendererUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail="PDF renderer is not available")
+    return FileResponse(
+        path, media_type="application/pdf", filename=f"visit-{record_id}.pdf",
+        content_disposition_type="inline", headers={"ETag": etag}
+    )
+
+@router.get("/api/visits/pdf")
+async def visits_pdf(day: Optional[date] = None, db: Session = Depends(get_db)):
+    """Все PDF итогов за день (по умолчанию сегодня) одним ZIP; рендеринг идет параллельно"""
+    day = day or date.today()
+    summaries = visit_pdf.visits_for_date(db, day)
+    if not summaries:
+        raise HTTPException(status_code=404, detail="No visits with medical records for this date")
+    try:
+        paths = await visit_pdf.ensure_many(summaries)
+    except visit_pdf.RendererUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=503, detail="PDF renderer is not available")
+    
+    def build_zip():
+        archive = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as bundle:
+            for summary, path in zip(summaries, paths):
+                bundle.write(path, f"{summary['visit'][-5:].replace(':', '-')} {summary['patient']}.pdf")
+        archive.seek(0)
+        return archive
+    
+    archive = await run_in_threadpool(build_zip)
+    
+    def chunks():
+        with archive:
+            while chunk := archive.read(256 * 1024):
+                yield chunk
+    
+    return StreamingResponse(chunks(), media_type="application/zip", headers={
+        "Content-Disposition": f'attachment; filename="visits-{day.isoformat()}.zip"'
+    })
+
+@router.get("/api/patients/{patient_id}/growth")
+async def get_patient_growth(patient_id: int, db: Session = Depends(get_db)):
+    """Ряды веса и роста с z-оценками ВОЗ и центильными кривыми для графика"""
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return growth.growth_chart(db, patient)
+
+# Взаиморасчеты
+@router.get("/api/patients/{patient_id}/ledger")
+async def get_patient_ledger(patient_id: int, limit: int = 50, db: Session = Depends(get_db)):
+    transactions = db.query(LedgerTransaction).filter(LedgerTransaction.patient_id == patient_id) \
+        .order_by(LedgerTransaction.created_at.desc()).limit(min(limit, 500)).all()
+    return {
+        "balance": str(ledger.get_balance(db, patient_id)),
+        "transactions": [{
+            "id": t.id,
+            "kind": t.kind,
+            "amount": str(t.amount),
+            "method": t.method,
+            "medical_record_id": t.medical_record_id,
+            "comment": t.comment,
+            "created_at": t.created_at.isoformat() if t.created_at else None
+        } for t in transactions]
+    }
+
+@router.post("/api/patients/{patient_id}/ledger")
+async def create_ledger_transaction(
+    patient_id: int,
+    kind: str = Form(...),
+    amount: Decimal = Form(...),
+    method: Optional[str] = Form(None),
+    medical_record_id: Optional[int] = Form(None),
+    comment: str = Form(""),
+    db: Session = Depends(get_db)
+):
+    """Частичная оплата, возврат, скидка или доначисление"""
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    try:
+        transaction = ledger.post(
+            db, patient_id, kind, amount,
+            method=method, medical_record_id=medical_record_id, comment=comment
+        )
+        db.commit()
+        return JSONResponse({
+            "status": "success",
+            "transaction_id": transaction.id,
+            "balance": str(ledger.get_balance(db, patient_id))
+        })
+    except ledger.LedgerError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/reports/debtors")
+async def get_debtors(limit: int = 100, offset: int = 0, db: Session = Depends(get_read_db)):
+    """Кто нам должен (по материализованным балансам)"""
+    rows = ledger.debtors(db, limit=min(limit, 500), offset=offset)
     return [{
-        "id": p.id,
-        "first_name": p.first_name,
-        "last_name": p.last_name,
-        "phone": p.phone,
-        "password": p.password
-    } for p in parents]
+        "patient_id": r.patient_id,
+        "patient_name": f"{r.last_name} {r.first_name}",
+        "phone": r.phone,
+        "balance": str(r.balance),
+        "updated_at": r.updated_at.isoformat() if r.updated_at else None
+    } for r in rows]
+
+# Вложения
+def attachment_data(attachment: Attachment):
+    return {
+        "id": attachment.id,
+        "patient_id": attachment.patient_id,
+        "medical_record_id": attachment.medical_record_id,
+        "filename": attachment.filename,
+        "content_type": attachment.content_type,
+        "size": attachment.size,
+        "preview_status": attachment.preview_status,
+        "created_at": attachment.created_at.isoformat() if attachment.created_at else None,
+        "url": f"/api/attachments/{attachment.id}",
+        "preview_url": f"/api/attachments/{attachment.id}/preview" if attachment.preview_status == "ready" else None
+    }
+
+async def save_attachment(request: Request, db: Session, patient_id: int, medical_record_id: Optional[int], filename: str):
+    """Тело запроса — сам файл; пишется в хранилище потоком, без буферизации в памяти"""
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > attachments.ATTACHMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="File too large")
+    try:
+        sha256, size = await attachments.store_stream(request.stream())
+    except attachments.AttachmentTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty file")
+    
+    content_type = request.headers.get("content-type", "application/octet-stream").split(";")[0].strip()
+    try:
+        attachment = Attachment(
+            patient_id=patient_id,
+            medical_record_id=medical_record_id,
+            sha256=sha256,
+            size=size,
+            content_type=content_type[:100],
+            filename=os.path.basename(filename)[:255] or "file",
+            preview_status="pending",
+            created_at=datetime.now()
+        )
+        db.add(attachment)
+        db.commit()
+        db.refresh(attachment)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    attachments.schedule_preview(sha256, content_type)
+    return attachment_data(attachment)
+
+@router.post("/api/patients/{patient_id}/attachments")
+async def upload_patient_attachment(request: Request, patient_id: int, filename: str = "file", db: Session = Depends(get_db)):
+    if not db.query(Patient.id).filter(Patient.id == patient_id).first():
+        raise HTTPException(status_code=404, detail="Patient not found")
+    return await save_attachment(request, db, patient_id, None, filename)
+
+@router.post("/api/medical-records/{record_id}/attachments")
+async def upload_medical_record_attachment(request: Request, record_id: int, filename: str = "file", db: Session = Depends(get_db)):
+    row = db.query(Appointment.patient_id).join(MedicalRecord, MedicalRecord.appointment_id == Appointment.id) \
+        .filter(MedicalRecord.id == record_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Medical record not found")
+    return await save_attachment(request, db, row.patient_id, record_id, filename)
+
+@router.get("/api/patients/{patient_id}/attachments")
+async def get_patient_attachments(patient_id: int, db: Session = Depends(get_db)):
+    items = db.query(Attachment).filter(Attachment.patient_id == patient_id) \
+        .order_by(Attachment.created_at.desc()).all()
+    return [attachment_data(a) for a in items]
+
+@router.get("/api/attachments/{attachment_id}")
+async def download_attachment(request: Request, attachment_id: int, db: Session = Depends(get_db)):
+    attachment = db.query(Attachment).filter(Attachment.id == attachment_id).first()
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return attachments.RangeFileResponse(attachment, request.headers.get("range"))
+
+@router.get("/api/attachments/{attachment_id}/preview")
+async def attachment_preview(attachment_id: int, db: Session = Depends(get_db)):
+    attachment = db.query(Attachment).filter(Attachment.id == attachment_id).first()
+    if not attachment or attachment.preview_status != "ready":
+        raise HTTPException(status_code=404, detail="Preview not found")
+    return FileResponse(
+        attachments.preview_path(attachment.sha256), media_type="image/jpeg",
+        headers={"X-Content-Type-Options": "nosniff"}
+    )
+
+# Прививки
+@router.get("/api/vaccinations/worklist")
+async def get_vaccination_worklist(
+    status: str = "overdue,due",
+    limit: int = 100,
+    offset: int = 0,
+    db: Session = Depends(get_read_db)
+):
+    """Рабочий список врача по прививкам (из пакетного расчета)"""
+    rows = vaccinations.worklist(db, statuses=status.split(","), limit=min(limit, 500), offset=offset)
+    return [{
+        "patient_id": r.patient_id,
+        "patient_name": f"{r.last_name} {r.first_name}",
+        "patient_age": calculate_age(r.birth_date),
+        "phone": r.phone,
+        "vaccine": r.vaccine,
+        "vaccine_name": vaccinations.VACCINE_NAMES.get(r.vaccine, r.vaccine),
+        "dose_number": r.dose_number,
+        "due_on": r.due_on.isoformat(),
+        "status": r.status
+    } for r in rows]
+
+@router.get("/api/patients/{patient_id}/vaccinations")
+async def get_patient_vaccinations(patient_id: int, db: Session = Depends(get_db)):
+    administered = db.query(Vaccination).filter(Vaccination.patient_id == patient_id) \
+        .order_by(Vaccination.administered_on).all()
+    due = db.query(VaccinationDue).filter(VaccinationDue.patient_id == patient_id) \
+        .order_by(VaccinationDue.due_on).all()
+    return {
+        "administered": [{
+            "id": v.id,
+            "vaccine": v.vaccine,
+            "vaccine_name": vaccinations.VACCINE_NAMES.get(v.vaccine, v.vaccine),
+            "dose_number": v.dose_number,
+            "administered_on": v.administered_on.isoformat(),
+            "drug_name": v.drug_name
+        } for v in administered],
+        "due": [{
+            "vaccine": d.vaccine,
+            "vaccine_name": vaccinations.VACCINE_NAMES.get(d.vaccine, d.vaccine),
+            "dose_number": d.dose_number,
+            "due_on": d.due_on.isoformat(),
+            "status": d.status
+        } for d in due]
+    }
+
+@router.post("/api/patients/{patient_id}/vaccinations")
+async def create_vaccination(
+    patient_id: int,
+    vaccine: str = Form(...),
+    administered_on: str = Form(...),
+    dose_number: Optional[int] = Form(None),
+    drug_name: str = Form(""),
+    notes: str = Form(""),
+    medical_record_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    if vaccine not in vaccinations.CALENDAR:
+        raise HTTPException(status_code=400, detail=f"Unknown vaccine: {vaccine}")
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+    
+    try:
+        if dose_number is None:
+            dose_number = db.query(Vaccination).filter(
+                Vaccination.patient_id == patient_id, Vaccination.vaccine == vaccine
+            ).count() + 1
+        
+        vaccination = Vaccination(
+            patient_id=patient_id,
+            vaccine=vaccine,
+            dose_number=dose_number,
+            administered_on=datetime.strptime(administered_on, "%Y-%m-%d").date(),
+            drug_name=drug_name,
+            notes=notes,
+            medical_record_id=medical_record_id,
+            created_at=datetime.now()
+        )
+        db.add(vaccination)
+        db.commit()
+        
+        # Сроки пересчитываются только для этого пациента
+        vaccinations.refresh_due(db, patient_ids=[patient_id])
+        
+        return JSONResponse({"status": "success", "vaccination_id": vaccination.id})
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Клинический поиск
+@router.get("/api/clinical-search")
+async def clinical_search(
+    diagnosis: Optional[str] = None,
+    medication: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    limit: int = 100,
+    offset: int = 0,
+    db: Session = Depends(get_read_db)
+):
+    """Поиск визитов по коду диагноза (МКБ или префикс), препарату и периоду"""
+    if not diagnosis and not medication:
+        raise HTTPException(status_code=400, detail="Укажите diagnosis или medication")
+    
+    rows, total = search_medical_records(
+        db, diagnosis=diagnosis, medication=medication,
+        date_from=date_from, date_to=date_to,
+        limit=min(limit, 500), offset=offset
+    )
+    return {
+        "total": total,
+        "results": [{
+            "medical_record_id": r.id,
+            "visit_date": r.visit_date.isoformat() if r.visit_date else None,
+            "patient_id": r.patient_id,
+            "patient_name": f"{r.last_name} {r.first_name}",
+            "patient_age": calculate_age(r.birth_date),
+            "diagnosis": (r.diagnosis or {}).get("main"),
+            "diagnosis_text": (r.diagnosis or {}).get("mainText"),
+            "medications": medication_names(r.prescriptions)
+        } for r in rows]
+    }
+
+# ========== JSON-API v2 ==========
+
+@api_v2.post("/medical-records", response_model=MedicalRecordCreated)
+async def create_medical_record_v2(data: MedicalRecordIn, db: Session = Depends(get_db)):
+    """Итоги визита одним JSON-документом (структуры формы visit_result.js)"""
+    return ORJSONResponse(save_medical_record(db, data))
+
+# Списки отдаются готовым ORJSONResponse: FastAPI не прогоняет их через
+# jsonable_encoder и response_model, а orjson сам сериализует даты.
+# response_model остается для схемы OpenAPI.
+
+@api_v2.get("/patients", response_model=List[PatientItem])
+async def get_patients_v2(db: Session = Depends(get_db)):
+    rows = db.query(*PATIENT_LIST_COLUMNS).order_by(Patient.id).all()
+    return ORJSONResponse([row._asdict() for row in rows])
+
+@api_v2.get("/appointments", response_model=List[AppointmentItem])
+async def get_appointments_v2(date: Optional[str] = None, db: Session = Depends(get_db)):
+    query = db.query(*APPOINTMENT_LIST_COLUMNS)
+    if date:
+        try:
+            query = query.filter(Appointment.date == datetime.strptime(date, "%Y-%m-%d").date())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+    rows = query.order_by(Appointment.date, Appointment.time, Appointment.id).all()
+    return ORJSONResponse([{
+        "id": r.id,
+        "patient_id": r.patient_id,
+        "date": r.date,
+        "time": r.time.strftime('%H:%M'),
+        "type": r.type,
+        "status": r.status
+    } for r in rows])
 
 # Системные эндпоинты
-@app.get("/api/health")
+@router.get("/api/health")
+@router.get("/live")
 async def health_check():
+    """Liveness: процесс жив и обслуживает event loop, зависимости не проверяются"""
     return {"status": "ok", "message": "Pediatric CRM is running"}
 
+@router.get("/ready")
+async def readiness_check():
+    """Readiness: БД и бот доступны (результат кэшируется)"""
+    result = await run_in_threadpool(health.readiness)
+    return JSONResponse(result, status_code=200 if result["status"] == "ready" else 503)
+
+# ========== ФАБРИКА ПРИЛОЖЕНИЯ ==========
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Прогрев пула БД, шаблонов и манифеста статики до приема трафика"""
+    started = time.perf_counter()
+    try:
+        connections = await run_in_threadpool(health.warm_db_pool)
+        logger.info(f"Пул БД прогрет: {connections} соединений")
+    except Exception as e:
+        # Приложение поднимается, /ready покажет недоступность БД
+        logger.error(f"Не удалось прогреть пул БД: {e}")
+    compiled = health.warm_templates(templates)
+    growth.load_tables()
+    static_manifest.update(health.build_static_manifest(STATIC_DIR))
+    app.state.startup_seconds = time.perf_counter() - started
+    logger.info(
+        f"Старт за {app.state.startup_seconds:.3f} с: {compiled} шаблонов, "
+        f"{len(static_manifest)} статических файлов"
+    )
+    audit_flusher = asyncio.create_task(audit.run_flusher())
+    live_listener = asyncio.create_task(schedule_broker.run())
+    yield
+    attachments.shutdown()
+    visit_pdf.shutdown()
+    for task in (audit_flusher, live_listener):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+def create_app() -> FastAPI:
+    setup_logging("web")
+    app = FastAPI(lifespan=lifespan)
+    app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+    app.middleware("http")(query_stats_middleware)
+    app.add_middleware(IdempotencyMiddleware)
+    # Добавлен последним — внешний: лишние запросы отсекаются до идемпотентности и БД
+    app.add_middleware(RateLimitMiddleware)
+    app.include_router(router)
+    app.include_router(api_v2)
+    return app
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,17 +1,33 @@
-from sqlalchemy import Column, Integer, String, DateTime, Date, Time, Float, Text, Boolean, JSON, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Date, Time, Float, Numeric, Text, Boolean, JSON, ForeignKey, Index, false, text
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
+from .database import DATABASE_URL
+
 Base = declarative_base()
 
+# JSONB на Postgres (индексируется GIN), обычный JSON на остальных СУБД
+JSONVariant = JSON().with_variant(JSONB(), "postgresql")
+# Секционированные таблицы — только на Postgres (миграции 0011, 0012)
+POSTGRES = make_url(DATABASE_URL).get_backend_name() == "postgresql"
+
 class Patient(Base):
     __tablename__ = "patients"
+    __table_args__ = (
+        # Выбор пациента по началу фамилии и имени — см. миграцию 0018
+        Index(
+            "ix_patients_picker_key", "last_name_key", "first_name_key", "id",
+            postgresql_ops={"last_name_key": "text_pattern_ops", "first_name_key": "text_pattern_ops"}
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     first_name = Column(String(100), nullable=False)
     last_name = Column(String(100), nullable=False)
-    birth_date = Column(Date, nullable=False)
+    birth_date = Column(Date, nullable=False, index=True)
     gender = Column(String(10), nullable=False)
     phone = Column(String(20), nullable=False)
     parent_name = Column(String(200))
@@ -27,40 +43,88 @@ class Patient(Base):
     development_notes = Column(Text)
     status = Column(String(20), default="new")  # new, confirmed, archived
     created_at = Column(DateTime, default=datetime.now)
+    # Ключи блоков для поиска дублей; заполняются событиями app.dedupe
+    phone_key = Column(String(20), index=True)  # телефон только цифрами, 7XXXXXXXXXX
+    parent_phone_key = Column(String(20), index=True)
+    name_key = Column(String(64), index=True)  # фонетический ключ «фамилия имя»
+    # Ключи выбора пациента (нижний регистр, е вместо ё); заполняются событиями app.patient_picker,
+    # индекс ix_patients_picker_key
+    last_name_key = Column(String(100))
+    first_name_key = Column(String(100))
     
     appointments = relationship("Appointment", back_populates="patient")
 
 class Appointment(Base):
+    """На Postgres секционирована: LIST (archived) -> appointments_hot по месяцам date
+    и appointments_cold для архива (миграция 0012, app.archive). Первичный ключ в БД —
+    (id, archived, date); для ORM идентичность по id."""
     __tablename__ = "appointments"
+    __table_args__ = (
+        Index("ix_appointments_date_time", "date", "time"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
-    patient_id = Column(Integer, ForeignKey("patients.id"))
+    patient_id = Column(Integer, ForeignKey("patients.id"), index=True)
+    series_id = Column(Integer, ForeignKey("appointment_series.id"), index=True)
     date = Column(Date, nullable=False)
     time = Column(Time, nullable=False)
     type = Column(String(50), nullable=False)  # primary, repeat, vaccination, consultation
     status = Column(String(20), default="new")  # new, confirmed, completed, cancelled
     comment = Column(Text)
     created_at = Column(DateTime, default=datetime.now)
+    archived = Column(Boolean, nullable=False, default=False, server_default=false())  # в холодной секции
     
     patient = relationship("Patient", back_populates="appointments")
-    medical_record = relationship("MedicalRecord", back_populates="appointment", uselist=False)
+    medical_record = relationship(
+        "MedicalRecord", back_populates="appointment", uselist=False,
+        primaryjoin="Appointment.id == foreign(MedicalRecord.appointment_id)"
+    )
+    series = relationship("AppointmentSeries", back_populates="appointments")
+
+class AppointmentSeries(Base):
+    """Повторяющиеся записи: курс лечения, физиотерапия, контрольные визиты"""
+    __tablename__ = "appointment_series"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False, index=True)
+    type = Column(String(50), nullable=False)
+    start_date = Column(Date, nullable=False)
+    time = Column(Time, nullable=False)
+    interval_weeks = Column(Integer, nullable=False, default=1)
+    count = Column(Integer, nullable=False)
+    comment = Column(Text)
+    status = Column(String(20), default="active")  # active, cancelled
+    created_at = Column(DateTime, default=datetime.now)
+    
+    appointments = relationship("Appointment", back_populates="series")
 
 class MedicalRecord(Base):
     __tablename__ = "medical_records"
     
     id = Column(Integer, primary_key=True, index=True)
-    appointment_id = Column(Integer, ForeignKey("appointments.id"), unique=True)
+    appointment_id = Column(Integer, unique=True)
+    # Копия ключа секционированной appointments: на Postgres составной внешний ключ
+    # (appointment_id, appointment_archived, appointment_date) ON UPDATE CASCADE, см. миграцию 0012
+    appointment_archived = Column(Boolean)
+    appointment_date = Column(Date)
     complaints = Column(Text)
-    examination = Column(JSON)  # {temp: 36.6, weight: 20.5, height: 110, condition: "satisfactory", ...}
-    diagnosis = Column(JSON)  # {main: "J06.9", additional: []}
-    prescriptions = Column(JSON)  # список назначений
+    # Индексы по diagnosis/prescriptions — выражения и GIN, см. миграцию 0004
+    examination = Column(JSONVariant)  # {temperature: "36.6", weight: "20.5", height: "110", condition: "satisfactory", ...}
+    diagnosis = Column(JSONVariant)  # {main: "J06.9", mainText: "...", additional: [], severity: ""}
+    prescriptions = Column(JSONVariant)  # {template: [...], manual: [{medication, dosage, schedule}], duration, diet}
+    # Названия препаратов в нижнем регистре по одному на строку (app.clinical_search);
+    # trigram-индекс на Postgres — см. миграцию 0021
+    medications_key = Column(Text)
     recommendations = Column(Text)
     next_visit_date = Column(Date)
     next_visit_time = Column(Time)
     next_visit_type = Column(String(50))
     created_at = Column(DateTime, default=datetime.now)
     
-    appointment = relationship("Appointment", back_populates="medical_record")
+    appointment = relationship(
+        "Appointment", back_populates="medical_record",
+        primaryjoin="foreign(MedicalRecord.appointment_id) == Appointment.id"
+    )
     payment = relationship("Payment", back_populates="medical_record", uselist=False)
 
 class Payment(Base):
@@ -68,7 +132,7 @@ class Payment(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     medical_record_id = Column(Integer, ForeignKey("medical_records.id"), unique=True)
-    amount = Column(Float, default=0)
+    amount = Column(Numeric(12, 2), default=0)  # стоимость визита; движение денег — в ledger_*
     status = Column(String(20), default="pending")  # pending, paid, cancelled
     method = Column(String(20), default="cash")  # cash, card, transfer
     created_at = Column(DateTime, default=datetime.now)
@@ -92,12 +156,185 @@ class Parent(Base):
     password = Column(String(100), nullable=False)
     first_name = Column(String(100))
     last_name = Column(String(100))
+    telegram_chat_id = Column(String(32))  # сохраняется при авторизации в боте
     created_at = Column(DateTime, default=datetime.now)
 
 class ParentChild(Base):
     __tablename__ = "parent_children"
+    __table_args__ = (
+        Index("ux_parent_children_parent_patient", "parent_id", "patient_id", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("parents.id"), index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+class GrowthMeasurement(Base):
+    __tablename__ = "growth_measurements"
+    __table_args__ = (
+        Index("ix_growth_measurements_patient_measured_on", "patient_id", "measured_on"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    medical_record_id = Column(Integer, ForeignKey("medical_records.id"), unique=True)
+    measured_on = Column(Date, nullable=False)
+    age_days = Column(Integer, nullable=False)
+    weight_kg = Column(Float)
+    height_cm = Column(Float)
+    temperature_c = Column(Float)
+    # z-оценки ВОЗ, пересчитываются пакетно (app.growth.flag_outliers)
+    weight_z = Column(Float)
+    height_z = Column(Float)
+    is_outlier = Column(Boolean, default=False, index=True)
+    created_at = Column(DateTime, default=datetime.now)
+
+class Vaccination(Base):
+    __tablename__ = "vaccinations"
+    __table_args__ = (
+        Index("ix_vaccinations_patient_vaccine", "patient_id", "vaccine"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    vaccine = Column(String(20), nullable=False)  # код из app.vaccinations.CALENDAR
+    dose_number = Column(Integer, nullable=False)  # 1, 2, 3... (ревакцинации продолжают счет)
+    administered_on = Column(Date, nullable=False)
+    medical_record_id = Column(Integer, ForeignKey("medical_records.id"))
+    drug_name = Column(String(100))
+    notes = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+
+class VaccinationDue(Base):
+    __tablename__ = "vaccinations_due"
+    __table_args__ = (
+        Index("ix_vaccinations_due_status_due_on", "status", "due_on"),
+        Index("uq_vaccinations_due_patient_vaccine", "patient_id", "vaccine", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+    vaccine = Column(String(20), nullable=False)
+    dose_number = Column(Integer, nullable=False)
+    due_on = Column(Date, nullable=False)
+    status = Column(String(20), nullable=False)  # upcoming, due, overdue
+    computed_at = Column(DateTime, default=datetime.now)
+
+class LedgerTransaction(Base):
+    __tablename__ = "ledger_transactions"
     
     id = Column(Integer, primary_key=True, index=True)
-    parent_id = Column(Integer, ForeignKey("parents.id"))
-    patient_id = Column(Integer, ForeignKey("patients.id"))
-    created_at = Column(DateTime, default=datetime.now)
\ No newline at end of file
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False, index=True)
+    medical_record_id = Column(Integer, ForeignKey("medical_records.id"), index=True)
+    kind = Column(String(20), nullable=False)  # charge, payment, refund, adjustment
+    amount = Column(Numeric(12, 2), nullable=False)  # всегда положительная
+    method = Column(String(20))  # cash, card, transfer — для payment/refund
+    comment = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    
+    entries = relationship("LedgerEntry", back_populates="transaction")
+
+class LedgerEntry(Base):
+    __tablename__ = "ledger_entries"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    transaction_id = Column(Integer, ForeignKey("ledger_transactions.id"), nullable=False, index=True)
+    account = Column(String(30), nullable=False)  # receivable, revenue, cash, card, transfer
+    amount = Column(Numeric(12, 2), nullable=False)  # дебет > 0, кредит < 0; сумма по транзакции = 0
+    
+    transaction = relationship("LedgerTransaction", back_populates="entries")
+
+class PatientBalance(Base):
+    __tablename__ = "patient_balances"
+    
+    patient_id = Column(Integer, ForeignKey("patients.id"), primary_key=True)
+    balance = Column(Numeric(12, 2), nullable=False, default=0, index=True)  # > 0 — долг пациента
+    updated_at = Column(DateTime, default=datetime.now)
+
+class ParentNotification(Base):
+    """Исходящие сообщения родителям; доставляет бот (app.telegram_bot.deliver_notifications)"""
+    __tablename__ = "parent_notifications"
+    __table_args__ = (
+        # Очередь: неотправленные и не отвергнутые окончательно, по времени следующей попытки
+        Index(
+            "ix_parent_notifications_pending", "next_attempt_at", "id",
+            postgresql_where=text("sent_at IS NULL AND failed_at IS NULL"),
+            sqlite_where=text("sent_at IS NULL AND failed_at IS NULL")
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    parent_id = Column(Integer, ForeignKey("parents.id"), nullable=False)
+    text = Column(Text, nullable=False)
+    medical_record_id = Column(Integer, ForeignKey("medical_records.id"))  # приложить PDF итогов визита
+    created_at = Column(DateTime, default=datetime.now)
+    sent_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_error = Column(Text)
+    next_attempt_at = Column(DateTime, default=datetime.now)  # раньше этого времени не отправлять
+    failed_at = Column(DateTime)  # доставка невозможна, повторов не будет
+
+class IdempotencyKey(Base):
+    """Результаты POST-запросов с заголовком Idempotency-Key (см. app.idempotency)"""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String(128), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 метода, пути и тела запроса
+    status_code = Column(Integer)  # NULL — запрос еще выполняется
+    content_type = Column(String(100))
+    response_body = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+class AuditLog(Base):
+    """Журнал изменений; на Postgres секционирован по месяцам (см. app.audit).
+    Там первичный ключ (id, ts) — ключ секционированной таблицы обязан включать ts;
+    на SQLite ключ — только id, иначе невозможен автоинкремент."""
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        Index("ix_audit_log_entity_entity_id_ts", "entity", "entity_id", "ts"),
+        {"postgresql_partition_by": "RANGE (ts)"},
+    )
+    
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    ts = Column(DateTime, primary_key=POSTGRES, nullable=False, default=datetime.now)
+    entity = Column(String(50), nullable=False)
+    entity_id = Column(Integer)
+    action = Column(String(10), nullable=False)  # insert, update, delete
+    actor = Column(String(100))
+    changes = Column(JSONVariant)  # {поле: [было, стало]}
+
+class Attachment(Base):
+    """Вложение к пациенту или визиту; содержимое — в хранилище по SHA-256 (app.attachments)"""
+    __tablename__ = "attachments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False, index=True)
+    medical_record_id = Column(Integer, ForeignKey("medical_records.id"), index=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    size = Column(BigInteger, nullable=False)
+    content_type = Column(String(100))
+    filename = Column(String(255))
+    preview_status = Column(String(20), default="pending")  # pending, ready, none, failed
+    created_at = Column(DateTime, default=datetime.now)
+
+class PatientSummary(Base):
+    """Сводка для списка и карточки пациента; ведется app.patient_summary при записи"""
+    __tablename__ = "patient_summary"
+    __table_args__ = (
+        # Сортировка списка по последнему визиту, пациенты без визитов в конце — см. миграцию 0016
+        Index(
+            "ix_patient_summary_last_visit_date",
+            text("last_visit_date DESC NULLS LAST") if POSTGRES else "last_visit_date"
+        ),
+    )
+    
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True)
+    last_visit_date = Column(Date)  # последний завершенный визит
+    next_visit_date = Column(Date, index=True)  # ближайший предстоящий визит
+    next_visit_time = Column(Time)
+    visits_count = Column(Integer, nullable=False, default=0, index=True)  # завершенных визитов
+    balance = Column(Numeric(12, 2), nullable=False, default=0, index=True)  # копия patient_balances
+    last_diagnosis = Column(String(255))
+    updated_at = Column(DateTime, default=datetime.now)
@@ -0,0 +1,68 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy.orm import Session
+
+from .models import Patient, ParentChild, ParentNotification
+
+STATUS_NAMES = {
+    "new": "новая",
+    "confirmed": "подтверждена",
+    "completed": "завершена",
+    "cancelled": "отменена",
+}
+
+def describe_change(change: dict, patient_name: str) -> str:
+    """Строка об одной измененной записи для сообщения родителю"""
+    before, after = change["before"], change["after"]
+    when = f"{before['date'].strftime('%d.%m.%Y')} {before['time'].strftime('%H:%M')}"
+    if after.get("status") == "cancelled":
+        return f"• {patient_name}: {when} — запись отменена"
+    if "date" in after or "time" in after:
+        new_date = after.get("date", before["date"]).strftime('%d.%m.%Y')
+        new_time = after.get("time", before["time"]).strftime('%H:%M')
+        return f"• {patient_name}: {when} → перенесено на {new_date} {new_time}"
+    return f"• {patient_name}: {when} — {STATUS_NAMES.get(after.get('status'), after.get('status'))}"
+
+def notify_families(db: Session, changes: list, title: str = "Изменения в ваших записях:"):
+    """Ставит в очередь по одному сообщению на семью со всеми ее изменениями.
+
+    changes — элементы с patient_id, before и after (см. scheduling.apply_bulk_action).
+    Сообщения пишутся в parent_notifications в текущей транзакции.
+    """
+    if not changes:
+        return 0
+    patient_ids = {change["patient_id"] for change in changes}
+    rows = db.query(ParentChild.parent_id, Patient.id, Patient.first_name, Patient.last_name) \
+        .join(Patient, ParentChild.patient_id == Patient.id) \
+        .filter(ParentChild.patient_id.in_(patient_ids)).all()
+
+    names = {row.id: f"{row.last_name} {row.first_name}" for row in rows}
+    parents_by_patient = defaultdict(set)
+    for row in rows:
+        parents_by_patient[row.id].add(row.parent_id)
+
+    lines_by_parent = defaultdict(list)
+    for change in sorted(changes, key=lambda c: (c["before"]["date"], c["before"]["time"])):
+        for parent_id in parents_by_patient.get(change["patient_id"], ()):
+            lines_by_parent[parent_id].append(describe_change(change, names[change["patient_id"]]))
+
+    now = datetime.now()
+    db.bulk_insert_mappings(ParentNotification, [
+        {"parent_id": parent_id, "text": "\n".join([title] + lines), "created_at": now}
+        for parent_id, lines in lines_by_parent.items()
+    ])
+    return len(lines_by_parent)
+
+def notify_visit_summary(db: Session, medical_record_id: int, patient_id: int, visit_date):
+    """Ставит в очередь итоги визита (PDF приложит бот) всем родителям пациента"""
+    rows = db.query(ParentChild.parent_id, Patient.first_name) \
+        .join(Patient, ParentChild.patient_id == Patient.id) \
+        .filter(ParentChild.patient_id == patient_id).all()
+    now = datetime.now()
+    db.bulk_insert_mappings(ParentNotification, [{
+        "parent_id": row.parent_id,
+        "text": f"Итоги визита {row.first_name} от {visit_date.strftime('%d.%m.%Y')}",
+        "medical_record_id": medical_record_id,
+        "created_at": now
+    } for row in rows])
+    return len(rows)
@@ -0,0 +1,45 @@
+"""Месячные секции секционированных таблиц Postgres (audit_log, appointments_hot)"""
+from datetime import date
+
+from sqlalchemy import text
+
+def month_start(day: date, offset: int = 0) -> date:
+    """Первое число месяца day, сдвинутого на offset месяцев"""
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def partition_name(table: str, start: date) -> str:
+    return f"{table}_{start.strftime('y%Ym%m')}"
+
+def ensure_monthly_partitions(connection, table: str, column: str, first: date, last: date, default: str = None) -> list:
+    """Создает недостающие секции table с месяца first по месяц last включительно.
+
+    Строки нужного месяца, успевшие попасть в DEFAULT-секцию default, переносятся
+    в новую секцию (иначе Postgres откажется ее создавать). Не на Postgres ничего
+    не делает. Возвращает имена созданных секций.
+    """
+    if connection.dialect.name != "postgresql":
+        return []
+    created = []
+    start = month_start(first)
+    while start <= last:
+        end = month_start(start, 1)
+        name = partition_name(table, start)
+        if connection.execute(text("SELECT to_regclass(:name) IS NULL"), {"name": name}).scalar():
+            bounds = {"start": start, "end": end}
+            if default:
+                connection.execute(text(f"CREATE TEMP TABLE _partition_rows (LIKE {table}) ON COMMIT DROP"))
+                connection.execute(text(
+                    f"WITH moved AS (DELETE FROM {default} WHERE {column} >= :start AND {column} < :end RETURNING *) "
+                    "INSERT INTO _partition_rows SELECT * FROM moved"
+                ), bounds)
+            connection.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            if default:
+                connection.execute(text(f"INSERT INTO {table} SELECT * FROM _partition_rows"))
+                connection.execute(text("DROP TABLE _partition_rows"))
+            created.append(name)
+        start = end
+    return created
@@ -0,0 +1,68 @@
+"""Выбор пациента в форме записи: поиск по началу фамилии (и имени) с keyset-пагинацией"""
+import json
+import base64
+from typing import Optional
+from sqlalchemy import event, or_, tuple_
+from sqlalchemy.orm import Session
+
+from .models import Patient
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def search_key(value: Optional[str]) -> str:
+    """Ключ поиска считается в Python: lower() в SQLite не знает кириллицы"""
+    return (value or "").strip().lower().replace("ё", "е")
+
+@event.listens_for(Patient, "before_insert")
+@event.listens_for(Patient, "before_update")
+def _set_keys(mapper, connection, patient):
+    patient.last_name_key = search_key(patient.last_name)
+    patient.first_name_key = search_key(patient.first_name)
+
+def _like_prefix(value: str) -> str:
+    escaped = search_key(value).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{escaped}%"
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(values), ensure_ascii=False).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        last_name, first_name, patient_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return last_name, first_name, int(patient_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def pick_patients(db: Session, q: str = "", limit: int = 20, cursor: Optional[str] = None):
+    """Страница пациентов по запросу «Фамилия [Имя]»; возвращает строки и курсор следующей.
+
+    Поиск идет по хранимым ключам last_name_key/first_name_key. На Postgres
+    сортировка идет в порядке COLLATE "C", совпадающем с индексом
+    ix_patients_picker_key (text_pattern_ops, см. миграцию 0018): и префиксный
+    LIKE, и ORDER BY ... LIMIT обслуживаются одним индексом без сортировки.
+    """
+    last_key = Patient.last_name_key
+    first_key = Patient.first_name_key
+    if _is_postgres(db):
+        last_key, first_key = last_key.collate("C"), first_key.collate("C")
+
+    query = db.query(
+        Patient.id, Patient.last_name, Patient.first_name, Patient.birth_date,
+        last_key.label("last_key"), first_key.label("first_key")
+    ).filter(or_(Patient.status.is_(None), Patient.status != "archived"))
+
+    terms = q.split()
+    if terms:
+        query = query.filter(last_key.like(_like_prefix(terms[0]), escape="\\"))
+    if len(terms) > 1:
+        query = query.filter(first_key.like(_like_prefix(terms[1]), escape="\\"))
+    if cursor:
+        query = query.filter(tuple_(last_key, first_key, Patient.id) > tuple_(*decode_cursor(cursor)))
+
+    rows = query.order_by(last_key, first_key, Patient.id).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor((rows[-1].last_key, rows[-1].first_key, rows[-1].id))
+    return rows, next_cursor
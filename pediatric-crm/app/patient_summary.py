@@ -0,0 +1,179 @@
+"""Сводка по пациенту: последний и ближайший визит, число визитов, баланс,
+последний диагноз — одной строкой patient_summary на пациента.
+
+Строка пересчитывается при записи, а не при чтении: события сессии
+(after_flush) собирают затронутых пациентов, а перед коммитом их строки
+пересчитываются в той же транзакции. Массовые Core-операции над записями
+(серии, пакетные действия) помечают пациентов сами через mark_dirty.
+
+«Ближайший визит» стареет вместе с календарем: раз в сутки нужен
+rebuild(stale_only=True) — см. rebuild_patient_summary.py --stale.
+"""
+import os
+from datetime import date, datetime
+from itertools import chain
+
+from sqlalchemy import select, delete, event, func, inspect
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .models import Patient, Appointment, MedicalRecord, LedgerTransaction, PatientBalance, PatientSummary
+
+SUMMARY_REBUILD_BATCH = int(os.getenv("SUMMARY_REBUILD_BATCH", "1000"))
+LAST_DIAGNOSIS_LENGTH = 255
+
+# Визит состоялся / визит еще предстоит
+VISITED_STATUSES = ("completed",)
+UPCOMING_STATUSES = ("new", "confirmed")
+
+# Пишется через Core: ORM-события сессии на свои же строки не срабатывают
+SUMMARY_TABLE = PatientSummary.__table__
+
+_PATIENTS_KEY = "summary_patients"
+_APPOINTMENTS_KEY = "summary_appointments"
+
+# ========== ПЕРЕСЧЕТ ==========
+
+def _dialect_name(db) -> str:
+    # Session или Connection (из миграции)
+    return db.dialect.name if hasattr(db, "dialect") else db.get_bind().dialect.name
+
+def compute(db, patient_ids: list, today: date = None) -> list:
+    """Строки patient_summary для существующих пациентов из patient_ids"""
+    today = today or date.today()
+    existing = db.execute(select(Patient.id).where(Patient.id.in_(patient_ids))).scalars().all()
+    rows = {patient_id: {
+        "patient_id": patient_id,
+        "last_visit_date": None,
+        "next_visit_date": None,
+        "next_visit_time": None,
+        "visits_count": 0,
+        "balance": 0,
+        "last_diagnosis": None,
+        "updated_at": datetime.now(),
+    } for patient_id in existing}
+    if not rows:
+        return []
+    ids = list(rows)
+
+    visits = select(
+        Appointment.patient_id, func.max(Appointment.date), func.count(Appointment.id)
+    ).where(Appointment.patient_id.in_(ids), Appointment.status.in_(VISITED_STATUSES)) \
+        .group_by(Appointment.patient_id)
+    for patient_id, last_date, count in db.execute(visits):
+        rows[patient_id].update(last_visit_date=last_date, visits_count=count)
+
+    upcoming = select(
+        Appointment.patient_id, Appointment.date, Appointment.time,
+        func.row_number().over(
+            partition_by=Appointment.patient_id, order_by=(Appointment.date, Appointment.time)
+        ).label("n")
+    ).where(
+        Appointment.patient_id.in_(ids),
+        Appointment.date >= today,
+        Appointment.status.in_(UPCOMING_STATUSES)
+    ).subquery()
+    for row in db.execute(select(upcoming).where(upcoming.c.n == 1)):
+        rows[row.patient_id].update(next_visit_date=row.date, next_visit_time=row.time)
+
+    diagnoses = select(
+        Appointment.patient_id,
+        MedicalRecord.diagnosis["main"].as_string().label("code"),
+        MedicalRecord.diagnosis["mainText"].as_string().label("text"),
+        func.row_number().over(
+            partition_by=Appointment.patient_id,
+            order_by=(Appointment.date.desc(), Appointment.time.desc(), MedicalRecord.id.desc())
+        ).label("n")
+    ).join(Appointment, MedicalRecord.appointment_id == Appointment.id) \
+        .where(Appointment.patient_id.in_(ids)).subquery()
+    for row in db.execute(select(diagnoses).where(diagnoses.c.n == 1)):
+        text = " ".join(filter(None, [row.code, row.text]))
+        rows[row.patient_id]["last_diagnosis"] = text[:LAST_DIAGNOSIS_LENGTH] or None
+
+    balances = select(PatientBalance.patient_id, PatientBalance.balance).where(PatientBalance.patient_id.in_(ids))
+    for patient_id, balance in db.execute(balances):
+        rows[patient_id]["balance"] = balance
+
+    return list(rows.values())
+
+def refresh(db, patient_ids) -> int:
+    """Пересчитывает строки сводки пациентов; коммит — на стороне вызывающего"""
+    patient_ids = sorted(set(filter(None, patient_ids)))
+    if not patient_ids:
+        return 0
+    rows = compute(db, patient_ids)
+    # Удаленные пациенты — строки больше не нужны
+    gone = set(patient_ids) - {row["patient_id"] for row in rows}
+    if gone:
+        db.execute(delete(SUMMARY_TABLE).where(SUMMARY_TABLE.c.patient_id.in_(gone)))
+    if not rows:
+        return 0
+
+    insert = pg_insert if _dialect_name(db) == "postgresql" else sqlite_insert
+    statement = insert(SUMMARY_TABLE)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[SUMMARY_TABLE.c.patient_id],
+        set_={column: statement.excluded[column] for column in rows[0] if column != "patient_id"}
+    ), rows)
+    return len(rows)
+
+def rebuild(db, stale_only: bool = False, batch_size: int = SUMMARY_REBUILD_BATCH) -> int:
+    """Полный пересчет пачками по id пациента; stale_only — только строки с прошедшим
+    «ближайшим визитом». Каждая пачка коммитится, если db — сессия."""
+    refreshed = 0
+    last_id = 0
+    while True:
+        if stale_only:
+            query = select(PatientSummary.patient_id).where(
+                PatientSummary.patient_id > last_id, PatientSummary.next_visit_date < date.today()
+            ).order_by(PatientSummary.patient_id)
+        else:
+            query = select(Patient.id).where(Patient.id > last_id).order_by(Patient.id)
+        ids = db.execute(query.limit(batch_size)).scalars().all()
+        if not ids:
+            return refreshed
+        refreshed += refresh(db, ids)
+        if isinstance(db, Session):
+            db.commit()
+        last_id = ids[-1]
+
+# ========== СОБЫТИЯ СЕССИИ ==========
+
+def mark_dirty(db: Session, patient_ids):
+    """Для изменений в обход ORM: пересчитать сводку пациентов при коммите"""
+    db.info.setdefault(_PATIENTS_KEY, set()).update(patient_ids)
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    patients = session.info.setdefault(_PATIENTS_KEY, set())
+    appointments = session.info.setdefault(_APPOINTMENTS_KEY, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Appointment):
+            patients.add(obj.patient_id)
+            # Запись перенесли на другого пациента — пересчитать и прежнего
+            patients.update(inspect(obj).attrs.patient_id.history.deleted or ())
+        elif isinstance(obj, LedgerTransaction):
+            patients.add(obj.patient_id)
+        elif isinstance(obj, MedicalRecord):
+            appointments.add(obj.appointment_id)
+        elif isinstance(obj, Patient) and obj in session.new:
+            patients.add(obj.id)
+
+@event.listens_for(Session, "before_commit")
+def _refresh_before_commit(session):
+    # Коммит сам сбросит изменения в БД, но затронутых пациентов нужно знать заранее
+    session.flush()
+    patients = session.info.pop(_PATIENTS_KEY, set())
+    appointments = session.info.pop(_APPOINTMENTS_KEY, set())
+    appointments.discard(None)
+    if appointments:
+        patients.update(session.execute(
+            select(Appointment.patient_id).where(Appointment.id.in_(appointments))
+        ).scalars())
+    refresh(session, patients)
+
+@event.listens_for(Session, "after_rollback")
+def _discard(session):
+    session.info.pop(_PATIENTS_KEY, None)
+    session.info.pop(_APPOINTMENTS_KEY, None)
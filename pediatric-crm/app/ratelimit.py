@@ -0,0 +1,230 @@
+"""Ограничение частоты и параллельности запросов к API.
+
+Частота — token bucket на пару (клиент, правило): ведро емкостью burst
+пополняется на rate токенов в секунду, каждый запрос забирает токен.
+Если ведро пусто, клиент получает 429 и Retry-After — через сколько
+появится токен. Ведра хранятся в памяти процесса (RATE_LIMIT_BACKEND=memory)
+или в Redis, общем для всех воркеров (redis).
+
+Параллельность — семафор на дорогой маршрут (PDF, отчеты, поиск). Запросы
+сверх лимита ждут в очереди ограниченной длины не дольше
+CONCURRENCY_QUEUE_TIMEOUT, а при полной очереди или по таймауту получают 429.
+Тяжелые запросы не занимают все потоки и соединения БД, поэтому страницы
+врача продолжают открываться.
+"""
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+
+from .cache import CACHE_REDIS_URL, CACHE_PREFIX
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "True").lower() in ("1", "true", "yes")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DEFAULT_RATE = float(os.getenv("RATE_LIMIT_DEFAULT_RATE", "10"))
+RATE_LIMIT_DEFAULT_BURST = float(os.getenv("RATE_LIMIT_DEFAULT_BURST", "40"))
+# Сколько ведер держать в памяти (защита от перебора адресов)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Адреса обратных прокси (nginx), от которых принимаются X-Real-IP / X-Forwarded-For, через запятую.
+# По умолчанию — локальный nginx; от остальных клиентов заголовки игнорируются, подделать их нельзя.
+# Без этого все запросы через прокси делили бы одно ведро адреса прокси
+RATE_LIMIT_TRUSTED_PROXIES = {
+    ip.strip() for ip in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1,::1").split(",") if ip.strip()
+}
+# Адреса без ограничения частоты (например, компьютер врача), через запятую
+RATE_LIMIT_EXEMPT = {ip.strip() for ip in os.getenv("RATE_LIMIT_EXEMPT", "").split(",") if ip.strip()}
+CONCURRENCY_QUEUE_TIMEOUT = float(os.getenv("CONCURRENCY_QUEUE_TIMEOUT", "10"))
+CONCURRENCY_RETRY_AFTER = int(os.getenv("CONCURRENCY_RETRY_AFTER", "5"))
+
+# (префикс пути, запросов в секунду, емкость ведра); действует первое совпадение
+RATE_LIMITS = [
+    ("/api/health", None, None),
+    ("/api/patients", 5, 30),
+    ("/api/appointments", 5, 30),
+    ("/api/", RATE_LIMIT_DEFAULT_RATE, RATE_LIMIT_DEFAULT_BURST),
+]
+
+# (шаблон пути, одновременно выполняется, мест в очереди)
+CONCURRENCY_LIMITS = [
+    (re.compile(r"^/api/visits/pdf$"), 1, 2),
+    (re.compile(r"^/api/medical-records/\d+/pdf$"), 2, 8),
+    (re.compile(r"^/api/reports/"), 2, 4),
+    (re.compile(r"^/reports$"), 2, 4),
+    (re.compile(r"^/api/clinical-search$"), 2, 8),
+]
+
+# ========== ЧАСТОТА ==========
+
+class MemoryBuckets:
+    """Ведра в памяти процесса; вызывается только из цикла событий, блокировка не нужна"""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        """0 — токен выдан, иначе через сколько секунд он появится"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            tokens, wait = tokens - 1, 0.0
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+# Тот же алгоритм атомарно на стороне Redis; ключ живет, пока ведро не наполнится
+TOKEN_BUCKET_SCRIPT = """
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+class RedisBuckets:
+    """Ведра в Redis: лимит общий для всех воркеров gunicorn"""
+
+    def __init__(self, url=CACHE_REDIS_URL):
+        from redis import asyncio as aioredis
+
+        self._redis = aioredis.Redis.from_url(url)
+        self._script = self._redis.register_script(TOKEN_BUCKET_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            wait = await self._script(keys=[f"{CACHE_PREFIX}:rl:{key}"], args=[rate, burst, time.time()])
+        except Exception as e:
+            # Недоступный Redis не должен останавливать прием: пропускаем запрос
+            logger.warning(f"Ограничитель частоты недоступен: {e}")
+            return 0.0
+        return float(wait)
+
+def build_buckets():
+    if RATE_LIMIT_BACKEND == "redis":
+        try:
+            return RedisBuckets()
+        except ImportError:
+            logger.error("RATE_LIMIT_BACKEND=redis, но пакет redis не установлен; используем память процесса")
+    return MemoryBuckets()
+
+def rate_rule(path: str):
+    for prefix, rate, burst in RATE_LIMITS:
+        if path.startswith(prefix):
+            return prefix, rate, burst
+    return None, None, None
+
+_proxy_warned = False
+
+def client_address(scope) -> str:
+    global _proxy_warned
+    client = scope.get("client")
+    peer = client[0] if client else "-"
+    if peer not in RATE_LIMIT_TRUSTED_PROXIES:
+        return peer
+    headers = dict(scope["headers"])
+    real_ip = headers.get(b"x-real-ip")
+    if real_ip:
+        return real_ip.decode("latin-1").strip()
+    forwarded = headers.get(b"x-forwarded-for")
+    if forwarded:
+        # Крайний правый адрес добавил наш nginx, остальные клиент мог подделать
+        return forwarded.decode("latin-1").split(",")[-1].strip()
+    if not _proxy_warned:
+        _proxy_warned = True
+        logger.warning(
+            f"Запрос от прокси {peer} без X-Real-IP: все клиенты делят одно ведро, "
+            "добавьте в nginx proxy_set_header X-Real-IP $remote_addr"
+        )
+    return peer
+
+# ========== ПАРАЛЛЕЛЬНОСТЬ ==========
+
+class ConcurrencyLimiter:
+    """Семафор с ограниченной очередью ожидания"""
+
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.waiting = 0
+        self._semaphore = None
+
+    async def acquire(self, timeout: float) -> bool:
+        # Семафор создается в цикле событий воркера
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            return False
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    def release(self):
+        self._semaphore.release()
+
+# ========== MIDDLEWARE ==========
+
+async def _too_many_requests(send, retry_after: float, detail: str):
+    body = json.dumps({"detail": detail}, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class RateLimitMiddleware:
+    """ASGI-middleware: частота по клиенту и маршруту, затем лимит параллельности"""
+
+    def __init__(self, app):
+        self.app = app
+        self.buckets = build_buckets()
+        self.limiters = [(pattern, ConcurrencyLimiter(limit, queue)) for pattern, limit, queue in CONCURRENCY_LIMITS]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+
+        prefix, rate, burst = rate_rule(path)
+        if rate:
+            client = client_address(scope)
+            if client not in RATE_LIMIT_EXEMPT:
+                wait = await self.buckets.take(f"{client}:{prefix}", rate, burst)
+                if wait > 0:
+                    logger.debug(f"429 для {client} на {path}: ведро {prefix} пусто")
+                    return await _too_many_requests(send, wait, "Слишком много запросов, повторите позже")
+
+        limiter = next((limiter for pattern, limiter in self.limiters if pattern.match(path)), None)
+        if limiter is None:
+            return await self.app(scope, receive, send)
+        if not await limiter.acquire(CONCURRENCY_QUEUE_TIMEOUT):
+            return await _too_many_requests(send, CONCURRENCY_RETRY_AFTER, "Сервер занят, повторите позже")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,306 @@
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from .models import Appointment, AppointmentSeries
+from .cache import cache, AVAILABILITY
+from . import patient_summary
+from . import audit
+
+# Статусы, при которых слот считается занятым
+BUSY_STATUSES = ("new", "confirmed", "completed")
+# Пространство ключей pg_advisory_xact_lock для дат расписания
+SCHEDULE_LOCK_NAMESPACE = 4201
+
+def get_booked_times(db: Session, day: date):
+    """Занятые слоты на дату в формате ЧЧ:ММ (кэшируется до следующей записи)"""
+    def load():
+        rows = db.query(Appointment.time).filter(
+            Appointment.date == day,
+            Appointment.status.in_(BUSY_STATUSES)
+        ).all()
+        return sorted({row.time.strftime('%H:%M') for row in rows})
+
+    return cache.get_or_set(AVAILABILITY, day.isoformat(), load)
+
+# ========== МАССОВЫЕ ОПЕРАЦИИ С ЗАПИСЯМИ ==========
+
+# Из каких статусов разрешено каждое действие
+BULK_ACTIONS = {
+    "confirm": ("new",),
+    "cancel": ("new", "confirmed"),
+    "reschedule": ("new", "confirmed"),
+    "shift": ("new", "confirmed"),
+}
+
+class SchedulingError(ValueError):
+    pass
+
+class SlotConflictError(SchedulingError):
+    def __init__(self, conflicts):
+        super().__init__("Целевые слоты заняты")
+        self.conflicts = conflicts
+
+def appointment_filter(ids=None, date_from=None, date_to=None, time_from=None, time_to=None):
+    """Условия выбора записей: по списку id или по диапазону дат/времени"""
+    conditions = []
+    if ids:
+        conditions.append(Appointment.id.in_(ids))
+    if date_from:
+        conditions.append(Appointment.date >= date_from)
+    if date_to:
+        conditions.append(Appointment.date <= date_to)
+    if time_from:
+        conditions.append(Appointment.time >= time_from)
+    if time_to:
+        conditions.append(Appointment.time <= time_to)
+    if not ids and not (date_from or date_to):
+        raise SchedulingError("Укажите ids или диапазон дат")
+    return conditions
+
+def lock_dates(db: Session, dates):
+    """Блокирует даты расписания до конца транзакции (Postgres).
+
+    Проверка «слот свободен» и запись идут разными запросами, и без блокировки
+    две одновременные серии или переносы могли занять один слот. Даты
+    блокируются по возрастанию, чтобы встречные транзакции не ждали друг друга
+    по кругу. На SQLite (разработка и тесты) блокировка не ставится.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for day in sorted(set(dates)):
+        db.execute(select(func.pg_advisory_xact_lock(SCHEDULE_LOCK_NAMESPACE, day.toordinal())))
+
+def _check_free(db: Session, moves: dict):
+    """moves: id -> (date, time). Проверяет, что целевые слоты свободны, одним запросом.
+
+    Ключ None — новая запись, которой еще нет в базе.
+    """
+    targets = {}
+    for appointment_id, slot in moves.items():
+        if slot in targets:
+            raise SlotConflictError([{"date": slot[0].isoformat(), "time": slot[1].strftime('%H:%M')}])
+        targets[slot] = appointment_id
+
+    busy = db.query(Appointment.date, Appointment.time).filter(
+        Appointment.date.in_({slot[0] for slot in targets}),
+        Appointment.status.in_(BUSY_STATUSES),
+        ~Appointment.id.in_([appointment_id for appointment_id in moves if appointment_id is not None])
+    ).all()
+    conflicts = [{"date": d.isoformat(), "time": t.strftime('%H:%M')} for d, t in busy if (d, t) in targets]
+    if conflicts:
+        raise SlotConflictError(conflicts)
+
+def reserve_slot(db: Session, day: date, slot_time: time):
+    """Проверяет перед созданием записи, что слот свободен; держит блокировку даты
+    до конца транзакции. Список занятых слотов в кэше может быть устаревшим,
+    поэтому решает только эта проверка по базе."""
+    lock_dates(db, [day])
+    _check_free(db, {None: (day, slot_time)})
+
+def apply_bulk_action(
+    db: Session,
+    action: str,
+    conditions: list,
+    new_date: Optional[date] = None,
+    new_time: Optional[time] = None,
+    shift_days: int = 0,
+    shift_minutes: int = 0
+):
+    """Меняет набор записей одним UPDATE и возвращает список изменений.
+
+    Каждый элемент: {"id", "patient_id", "before": {date, time, status},
+    "after": {только измененные поля}}. Коммит — на стороне вызывающего.
+    """
+    if action not in BULK_ACTIONS:
+        raise SchedulingError(f"Unknown action: {action}")
+    if action == "reschedule" and not (new_date or new_time):
+        raise SchedulingError("Для переноса укажите new_date или new_time")
+    if action == "shift" and not (shift_days or shift_minutes):
+        raise SchedulingError("Для сдвига укажите shift_days или shift_minutes")
+
+    rows = db.query(
+        Appointment.id, Appointment.patient_id, Appointment.date, Appointment.time, Appointment.status
+    ).filter(*conditions, Appointment.status.in_(BULK_ACTIONS[action])) \
+     .order_by(Appointment.date, Appointment.time).with_for_update().all()
+    if not rows:
+        return []
+    ids = [row.id for row in rows]
+
+    changes = []
+    for row in rows:
+        before = {"date": row.date, "time": row.time, "status": row.status}
+        if action == "confirm":
+            after = {"status": "confirmed"}
+        elif action == "cancel":
+            after = {"status": "cancelled"}
+        elif action == "reschedule":
+            after = {"date": new_date or row.date, "time": new_time or row.time}
+        else:
+            moved = datetime.combine(row.date, row.time) + timedelta(days=shift_days, minutes=shift_minutes)
+            if moved.date() != row.date + timedelta(days=shift_days):
+                raise SchedulingError(f"Сдвиг переносит запись {row.id} через полночь")
+            after = {"date": moved.date(), "time": moved.time()}
+        after = {key: value for key, value in after.items() if before[key] != value}
+        changes.append({"id": row.id, "patient_id": row.patient_id, "before": before, "after": after})
+
+    if action in ("reschedule", "shift"):
+        moves = {
+            c["id"]: (c["after"].get("date", c["before"]["date"]), c["after"].get("time", c["before"]["time"]))
+            for c in changes
+        }
+        lock_dates(db, [slot[0] for slot in moves.values()])
+        _check_free(db, moves)
+
+    statement = update(Appointment).where(Appointment.id.in_(ids)).execution_options(synchronize_session=False)
+    if action == "confirm":
+        db.execute(statement.values(status="confirmed"))
+    elif action == "cancel":
+        db.execute(statement.values(status="cancelled"))
+    elif action == "reschedule":
+        values = {}
+        if new_date:
+            values["date"] = new_date
+        if new_time:
+            values["time"] = new_time
+        db.execute(statement.values(**values))
+    elif db.get_bind().dialect.name == "postgresql":
+        db.execute(statement.values(
+            date=Appointment.date + shift_days,
+            time=Appointment.time + timedelta(minutes=shift_minutes)
+        ))
+    else:
+        db.bulk_update_mappings(Appointment, [
+            {"id": c["id"], **c["after"]} for c in changes if c["after"]
+        ])
+
+    patient_summary.mark_dirty(db, {c["patient_id"] for c in changes})
+    changes = [c for c in changes if c["after"]]
+    # Массовый UPDATE минует after_flush — пишем журнал сами
+    for c in changes:
+        audit.record(db, "appointment", c["id"], "update", {
+            key: [c["before"][key], value] for key, value in c["after"].items()
+        })
+    return changes
+
+def update_series_fields(db: Session, conditions: list, values: dict):
+    """Меняет тип/комментарий у будущих записей серии одним UPDATE и пишет журнал"""
+    rows = db.query(Appointment.id, Appointment.type, Appointment.comment).filter(
+        *conditions, Appointment.status.in_(BULK_ACTIONS["reschedule"])
+    ).with_for_update().all()
+    if not rows:
+        return 0
+    db.execute(
+        update(Appointment).where(Appointment.id.in_([row.id for row in rows]))
+        .values(**values).execution_options(synchronize_session=False)
+    )
+    for row in rows:
+        changed = {key: [getattr(row, key), value] for key, value in values.items() if getattr(row, key) != value}
+        if changed:
+            audit.record(db, "appointment", row.id, "update", changed)
+    return len(rows)
+
+def compact_diff(changes: list) -> list:
+    """Изменения в виде {"id": 1, "status": ["new", "cancelled"], ...}"""
+    def fmt(value):
+        if isinstance(value, time):
+            return value.strftime('%H:%M')
+        if isinstance(value, date):
+            return value.isoformat()
+        return value
+
+    return [
+        dict({"id": c["id"]}, **{key: [fmt(c["before"][key]), fmt(value)] for key, value in c["after"].items()})
+        for c in changes
+    ]
+
+# ========== СЕРИИ ЗАПИСЕЙ ==========
+
+MAX_SERIES_OCCURRENCES = 52
+
+def expand_series_dates(start_date: date, interval_weeks: int, count: int):
+    """Даты повторений серии: каждые interval_weeks недель, count раз"""
+    if not 1 <= count <= MAX_SERIES_OCCURRENCES:
+        raise SchedulingError(f"Число повторений должно быть от 1 до {MAX_SERIES_OCCURRENCES}")
+    if interval_weeks < 1:
+        raise SchedulingError("Интервал должен быть не меньше недели")
+    return [start_date + timedelta(weeks=interval_weeks * i) for i in range(count)]
+
+def busy_slots(db: Session, dates, slot_time: time, exclude_ids=()):
+    """Какие из дат уже заняты в это время — одним запросом на все даты"""
+    query = db.query(Appointment.date).filter(
+        Appointment.date.in_(dates),
+        Appointment.time == slot_time,
+        Appointment.status.in_(BUSY_STATUSES)
+    )
+    if exclude_ids:
+        query = query.filter(~Appointment.id.in_(exclude_ids))
+    return sorted({row.date for row in query.all()})
+
+def create_series(
+    db: Session,
+    patient_id: int,
+    start_date: date,
+    slot_time: time,
+    appointment_type: str,
+    interval_weeks: int = 1,
+    count: int = 1,
+    comment: str = "",
+    status: str = "new",
+    skip_conflicts: bool = False
+):
+    """Создает серию и все ее записи одним многострочным INSERT.
+
+    Занятые даты либо пропускаются (skip_conflicts), либо вызывают
+    SlotConflictError. Коммит — на стороне вызывающего.
+    """
+    dates = expand_series_dates(start_date, interval_weeks, count)
+    lock_dates(db, dates)
+    busy = busy_slots(db, dates, slot_time)
+    if busy and not skip_conflicts:
+        raise SlotConflictError([{"date": d.isoformat(), "time": slot_time.strftime('%H:%M')} for d in busy])
+    dates = [d for d in dates if d not in set(busy)]
+    if not dates:
+        raise SchedulingError("Все даты серии заняты")
+
+    now = datetime.now()
+    series = AppointmentSeries(
+        patient_id=patient_id,
+        type=appointment_type,
+        start_date=start_date,
+        time=slot_time,
+        interval_weeks=interval_weeks,
+        count=count,
+        comment=comment,
+        status="active",
+        created_at=now
+    )
+    db.add(series)
+    db.flush()
+
+    rows = [{
+        "patient_id": patient_id,
+        "series_id": series.id,
+        "date": d,
+        "time": slot_time,
+        "type": appointment_type,
+        "status": status,
+        "comment": comment,
+        "created_at": now
+    } for d in dates]
+    db.execute(insert(Appointment).values(rows))
+    patient_summary.mark_dirty(db, [patient_id])
+
+    # Многострочный INSERT минует after_flush — пишем журнал сами
+    created = db.query(Appointment.id, Appointment.date).filter(Appointment.series_id == series.id).all()
+    by_date = {row["date"]: row for row in rows}
+    for appointment_id, appointment_date in created:
+        audit.record(db, "appointment", appointment_id, "insert", {
+            key: [None, value] for key, value in by_date[appointment_date].items() if value is not None
+        })
+    return series, dates, busy
+
+def future_series_filter(series_id: int, from_date: Optional[date] = None):
+    """Условия для будущих записей серии (прошедшие и завершенные не трогаем)"""
+    return [Appointment.series_id == series_id, Appointment.date >= (from_date or date.today())]
@@ -0,0 +1,86 @@
+"""Модели запросов и ответов JSON-API (/api/v2).
+
+Структуры осмотра, диагноза и назначений повторяют то, что собирает форма
+визита (static/js/visit_result.js): getExaminationData, getDiagnosisData,
+getPrescriptionsData. Значения осмотра — строки, как в полях формы; числа
+от внешних клиентов приводятся к строке.
+"""
+from datetime import date as Date
+from decimal import Decimal
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+
+class Examination(BaseModel):
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+
+    temperature: str = ""
+    weight: str = ""
+    height: str = ""
+    condition: str = ""
+    skin: str = ""
+    breathing: str = ""
+    wheezing: str = ""
+    heart: str = ""
+    abdomen: str = ""
+    throat: str = ""
+    notes: str = ""
+
+class Diagnosis(BaseModel):
+    # Имя mainText — как в форме и в уже сохраненных записях
+    main: str = ""
+    mainText: str = ""
+    additional: List[str] = []
+    severity: str = ""
+
+class ManualPrescription(BaseModel):
+    medication: str
+    dosage: str = ""
+    schedule: str = ""
+
+class Prescriptions(BaseModel):
+    template: List[str] = []
+    manual: List[ManualPrescription] = []
+    duration: str = ""
+    diet: Optional[str] = None
+
+class MedicalRecordIn(BaseModel):
+    """Итоги визита: те же поля, что у формы POST /api/medical-records"""
+    appointment_id: int
+    complaints: str = ""
+    examination: Examination = Examination()
+    diagnosis: Diagnosis = Diagnosis()
+    prescriptions: Prescriptions = Prescriptions()
+    recommendations: str = ""
+    next_visit_date: Optional[Date] = None
+    next_visit_time: Optional[str] = Field(None, pattern=r"^\d{2}:\d{2}$")
+    next_visit_type: Optional[str] = None
+    create_next_appointment: bool = False
+    next_visit_repeat_count: int = Field(1, ge=1)
+    next_visit_interval_weeks: int = Field(1, ge=1)
+    payment_amount: Decimal = Field(Decimal("0"), ge=0)
+    payment_status: str = "pending"
+    payment_method: str = "cash"
+    send_to_parents: bool = False
+    template_id: Optional[int] = None
+
+class MedicalRecordCreated(BaseModel):
+    status: str = "success"
+    medical_record_id: int
+    warning: Optional[str] = None  # итоги сохранены, но повторные визиты не созданы
+
+class PatientItem(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    birth_date: Optional[Date] = None
+    phone: Optional[str] = None
+    status: Optional[str] = None
+
+class AppointmentItem(BaseModel):
+    id: int
+    patient_id: int
+    date: Date
+    time: str
+    type: Optional[str] = None
+    status: Optional[str] = None
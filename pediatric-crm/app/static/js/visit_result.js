@@ -309,6 +309,32 @@ function updatePaymentSummary() {
     console.log('Payment updated:', { amount, status, method });
 }
 
+// Ключ идемпотентности: один на сохранение визита, повторы отправки
+// (в том числе после обрыва сети) получают исходный результат
+let submitIdempotencyKey = null;
+
+function newIdempotencyKey() {
+    return window.crypto && crypto.randomUUID
+        ? crypto.randomUUID()
+        : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
+async function postWithRetry(url, body, key, attempts = 3) {
+    for (let attempt = 1; ; attempt++) {
+        try {
+            return await fetch(url, {
+                method: 'POST',
+                headers: {'Idempotency-Key': key, 'Content-Type': 'application/json'},
+                body: body
+            });
+        } catch (error) {
+            // Сетевая ошибка: повторяем с тем же ключом
+            if (attempt >= attempts) throw error;
+            await new Promise(resolve => setTimeout(resolve, 500 * attempt));
+        }
+    }
+}
+
 // Основные функции формы
 async function submitForm() {
     if (!validateForm()) {
@@ -316,42 +342,46 @@ async function submitForm() {
         return;
     }
     
-    const formData = new FormData();
-    const appointmentId = document.getElementById('appointmentId').value;
-    
-    // Сбор данных формы
-    formData.append('appointment_id', appointmentId);
-    formData.append('complaints', document.getElementById('complaints').value);
-    formData.append('examination', JSON.stringify(getExaminationData()));
-    formData.append('diagnosis', JSON.stringify(getDiagnosisData()));
-    formData.append('prescriptions', JSON.stringify(getPrescriptionsData()));
-    formData.append('recommendations', document.getElementById('recommendations').value);
-    formData.append('payment_amount', document.getElementById('paymentAmount').value);
-    formData.append('payment_status', document.getElementById('paymentStatus').value);
-    formData.append('payment_method', document.getElementById('paymentMethod').value);
-    formData.append('send_to_parents', document.getElementById('sendToParents').checked);
+    // Сбор данных формы: JSON-документ по модели MedicalRecordIn (app/schemas.py)
+    const payload = {
+        appointment_id: Number(document.getElementById('appointmentId').value),
+        complaints: document.getElementById('complaints').value,
+        examination: getExaminationData(),
+        diagnosis: getDiagnosisData(),
+        prescriptions: getPrescriptionsData(),
+        recommendations: document.getElementById('recommendations').value,
+        payment_amount: document.getElementById('paymentAmount').value || '0',
+        payment_status: document.getElementById('paymentStatus').value,
+        payment_method: document.getElementById('paymentMethod').value,
+        send_to_parents: document.getElementById('sendToParents').checked
+    };
     
     if (document.getElementById('scheduleNextVisit').checked) {
-        formData.append('next_visit_date', document.getElementById('nextVisitDate').value);
-        formData.append('next_visit_time', document.getElementById('nextVisitTime').value);
-        formData.append('next_visit_type', document.getElementById('nextVisitType').value);
-        formData.append('create_next_appointment', true);
+        payload.next_visit_date = document.getElementById('nextVisitDate').value || null;
+        payload.next_visit_time = document.getElementById('nextVisitTime').value || null;
+        payload.next_visit_type = document.getElementById('nextVisitType').value || null;
+        payload.create_next_appointment = true;
     }
     
     try {
-        const response = await fetch('/api/medical-records', {
-            method: 'POST',
-            body: formData
-        });
+        if (!submitIdempotencyKey) {
+            submitIdempotencyKey = newIdempotencyKey();
+        }
+        const response = await postWithRetry('/api/v2/medical-records', JSON.stringify(payload), submitIdempotencyKey);
         
         const result = await response.json();
         
         if (result.status === 'success') {
-            alert('Данные визита успешно сохранены!');
+            submitIdempotencyKey = null;
+            alert('Данные визита успешно сохранены!' + (result.warning ? '\n\n' + result.warning : ''));
             localStorage.removeItem('visitFormData'); // Очистка сохраненных данных
             window.location.href = `/appointments`; // Перенаправление к расписанию
         } else {
-            throw new Error(result.message || 'Ошибка сохранения');
+            // detail — текст HTTPException или список ошибок проверки модели
+            const detail = Array.isArray(result.detail)
+                ? result.detail.map(error => `${error.loc.join('.')}: ${error.msg}`).join('; ')
+                : result.detail;
+            throw new Error(result.message || detail || 'Ошибка сохранения');
         }
     } catch (error) {
         console.error('Ошибка сохранения:', error);
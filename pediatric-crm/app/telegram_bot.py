@@ -2,23 +2,40 @@ import os
 import logging
 import aiohttp
 import json
+import time
+import uuid
+import asyncio
+import functools
+from collections import OrderedDict
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden, BadRequest
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 from sqlalchemy.orm import Session
 from datetime import datetime, date, timedelta
-from app.database import SessionLocal
-from app.models import Patient, Parent, Appointment
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+from app.database import track_queries
+from app.models import Appointment, MedicalRecord
+from app.notifications import notify_visit_summary
+from app import audit
+from app import bot_repository
+from app.logging_config import setup_logging, request_id, chat_id
+
 logger = logging.getLogger(__name__)
 
 # Токен бота из переменных окружения
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 API_URL = os.getenv("API_URL", "https://doc-popov.ru")
+# Файл-heartbeat для проверки готовности (/ready в веб-приложении)
+BOT_HEARTBEAT_FILE = os.getenv("BOT_HEARTBEAT_FILE", "bot.heartbeat")
+BOT_HEARTBEAT_INTERVAL = float(os.getenv("BOT_HEARTBEAT_INTERVAL", "30"))
+# Как часто забирать уведомления родителям из очереди
+BOT_OUTBOX_INTERVAL = float(os.getenv("BOT_OUTBOX_INTERVAL", "10"))
+# Сколько file_id отправленных PDF помнить (повторная отправка без загрузки файла)
+BOT_PDF_CACHE_SIZE = int(os.getenv("BOT_PDF_CACHE_SIZE", "1000"))
+# Предел длины текстового сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+# История визитов: сколько страниц помнить на чат и как долго (размер страницы — в bot_repository)
+HISTORY_CACHE_PAGES = int(os.getenv("HISTORY_CACHE_PAGES", "10"))
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "300"))
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
@@ -75,17 +92,17 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         logger.info(f"Пользователь {user_id} ввел пароль для телефона {phone}")
         
-        db = SessionLocal()
         try:
-            parent = db.query(Parent).filter(Parent.phone == phone, Parent.password == password).first()
+            # Заодно запоминаем чат для уведомлений
+            parent = await bot_repository.authenticate_parent(phone, password, str(update.message.chat_id))
             if parent:
                 context.user_data['authenticated'] = True
-                context.user_data['parent_id'] = parent.id
-                context.user_data['parent_name'] = f"{parent.first_name} {parent.last_name}"
+                context.user_data['parent_id'] = parent['id']
+                context.user_data['parent_name'] = f"{parent['first_name']} {parent['last_name']}"
                 context.user_data['awaiting_password'] = False
                 
-                logger.info(f"Успешная авторизация пользователя {user_id} как {parent.first_name}")
-                await update.message.reply_text(f"✅ Успешная авторизация! Добро пожаловать, {parent.first_name}!")
+                logger.info(f"Успешная авторизация пользователя {user_id} как {parent['first_name']}")
+                await update.message.reply_text(f"✅ Успешная авторизация! Добро пожаловать, {parent['first_name']}!")
                 await show_main_menu(update, context)
             else:
                 logger.warning(f"Неудачная попытка авторизации для телефона {phone}")
@@ -98,8 +115,6 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Ошибка при авторизации пользователя {user_id}: {e}")
             await update.message.reply_text("❌ Произошла ошибка при авторизации. Попробуйте позже.")
-        finally:
-            db.close()
     
     # Если пользователь в процессе записи на прием
     elif context.user_data.get('making_appointment'):
@@ -166,6 +181,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif action == "history":
         await show_history(query, context)
     
+    # История визитов ребенка: history_<id ребенка>_<номер страницы>
+    elif action.startswith("history_"):
+        _, child_id, page = action.split('_')
+        await show_child_history(query, context, int(child_id), int(page))
+    
     elif action == "settings":
         await show_settings(query, context)
     
@@ -190,12 +210,11 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def show_my_children(query, context):
     """Показать список детей"""
-    db = SessionLocal()
     try:
         parent_id = context.user_data.get('parent_id')
         
         # Получаем детей из базы данных
-        children = db.query(Patient).all()  # TODO: Добавить связь с родителем
+        children = await bot_repository.linked_children(parent_id)
         
         if not children:
             keyboard = [
@@ -219,15 +238,12 @@ async def show_my_children(query, context):
     except Exception as e:
         logger.error(f"Ошибка при получении списка детей: {e}")
         await query.edit_message_text("❌ Ошибка при загрузке данных")
-    finally:
-        db.close()
 
 async def start_appointment_flow(query, context):
     """Начало процесса записи на прием"""
-    db = SessionLocal()
     try:
         # Получаем список детей
-        children = db.query(Patient).all()
+        children = await bot_repository.linked_children(context.user_data.get('parent_id'))
         
         if not children:
             await query.edit_message_text("❌ Нет пациентов для записи. Сначала добавьте ребенка.")
@@ -259,16 +275,13 @@ async def start_appointment_flow(query, context):
     except Exception as e:
         logger.error(f"Ошибка при начале записи: {e}")
         await query.edit_message_text("❌ Ошибка при загрузке списка пациентов")
-    finally:
-        db.close()
 
 async def handle_child_selection(query, context):
     """Обработка выбора ребенка"""
     child_id = int(query.data.split('_')[2])
     
-    db = SessionLocal()
     try:
-        child = db.query(Patient).filter(Patient.id == child_id).first()
+        child = await bot_repository.child_by_id(context.user_data.get('parent_id'), child_id)
         if not child:
             await query.edit_message_text("❌ Ребенок не найден")
             return
@@ -298,8 +311,6 @@ async def handle_child_selection(query, context):
     except Exception as e:
         logger.error(f"Ошибка при выборе ребенка: {e}")
         await query.edit_message_text("❌ Ошибка при выборе ребенка")
-    finally:
-        db.close()
 
 async def handle_type_selection(query, context):
     """Обработка выбора типа приема"""
@@ -360,6 +371,13 @@ async def handle_date_selection(query, context):
         "14:00", "14:30", "15:00", "15:30", "16:00", "16:30", "17:00"
     ]
     
+    # Убираем уже занятые слоты
+    try:
+        booked = set(await bot_repository.booked_times(datetime.strptime(selected_date, '%Y-%m-%d').date()))
+        time_slots = [slot for slot in time_slots if slot not in booked]
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке занятых слотов: {e}")
+    
     keyboard = []
     row = []
     for i, time_slot in enumerate(time_slots):
@@ -443,7 +461,18 @@ async def complete_appointment(update, context, selected_time=None):
             form_data.add_field('type', appointment_data['type'])
             form_data.add_field('notes', 'Запись создана через бота')
             
-            async with session.post(f'{API_URL}/api/appointments', data=form_data) as response:
+            # Случайный ключ на попытку записи: повторное нажатие того же слота не создаст
+            # вторую запись, а новая запись на этот слот после отмены получит новый ключ.
+            # Ключи удаляются вместе с appointment_data по завершении записи.
+            slot = f"{appointment_data['child_id']}-{appointment_data['type']}-{appointment_data['date']}-{selected_time}"
+            idempotency_key = appointment_data.setdefault('idempotency_keys', {}).setdefault(
+                slot, f"bot-{uuid.uuid4().hex}"
+            )
+            async with session.post(
+                f'{API_URL}/api/appointments',
+                data=form_data,
+                headers={'Idempotency-Key': idempotency_key}
+            ) as response:
                 result = await response.json()
                 
                 if response.status == 200:
@@ -476,6 +505,13 @@ async def complete_appointment(update, context, selected_time=None):
                         await context.bot.send_message(chat_id=chat_id, text=success_message)
                         
                     await show_main_menu(update, context)
+                elif response.status == 409:
+                    error_message = "❌ Это время только что заняли. Выберите, пожалуйста, другое время."
+                    
+                    if hasattr(update, 'callback_query'):
+                        await update.callback_query.edit_message_text(error_message)
+                    else:
+                        await context.bot.send_message(chat_id=chat_id, text=error_message)
                 else:
                     error_msg = result.get('detail', 'Неизвестная ошибка')
                     error_message = f"❌ Ошибка при создании записи: {error_msg}"
@@ -495,12 +531,79 @@ async def complete_appointment(update, context, selected_time=None):
             await context.bot.send_message(chat_id=chat_id, text=error_message)
 
 async def show_history(query, context):
-    """Показать историю посещений"""
+    """Показать историю посещений: выбор ребенка (или сразу история единственного)"""
+    try:
+        children = await bot_repository.linked_children(context.user_data.get('parent_id'))
+    except Exception as e:
+        logger.error(f"Ошибка при получении списка детей для истории: {e}")
+        await query.edit_message_text("❌ Ошибка при загрузке данных")
+        return
+    
+    if len(children) == 1:
+        await show_child_history(query, context, children[0].id, 0)
+        return
+    
     keyboard = [
-        [InlineKeyboardButton("🔙 НАЗАД", callback_data="back_to_menu")]
+        [InlineKeyboardButton(f"{child.last_name} {child.first_name}", callback_data=f"history_{child.id}_0")]
+        for child in children
     ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text("📋 Функция истории посещений будет доступна в ближайшее время.", reply_markup=reply_markup)
+    keyboard.append([InlineKeyboardButton("🔙 НАЗАД", callback_data="back_to_menu")])
+    text = "📋 Чью историю посещений показать?" if children else "У вас пока нет привязанных детей."
+    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+
+def format_history_page(rows, page: int) -> str:
+    if not rows:
+        return "📋 Прошедших визитов пока нет." if page == 0 else "📋 Больше визитов нет."
+    lines = [f"📋 ИСТОРИЯ ПОСЕЩЕНИЙ (стр. {page + 1})\n"]
+    for row in rows:
+        lines.append(f"📅 {row.date.strftime('%d.%m.%Y')} {row.time.strftime('%H:%M')} — {row.type}")
+        diagnosis = " ".join(filter(None, [row.diagnosis_code, row.diagnosis_text]))
+        if diagnosis:
+            lines.append(f"🩺 Диагноз: {diagnosis}")
+        if row.recommendations:
+            lines.append(f"💡 {row.recommendations}")
+        lines.append("")
+    return "\n".join(lines)
+
+async def show_child_history(query, context, child_id: int, page: int):
+    """Страница истории визитов ребенка; листание берет страницы из кэша чата"""
+    # Кэш на чат: (ребенок, страница) -> (время, строки, есть следующая); курсоры страниц храним отдельно
+    pages = context.chat_data.setdefault('history_pages', OrderedDict())
+    cursors = context.chat_data.setdefault('history_cursors', {})
+    key = (child_id, page)
+    
+    cached = pages.get(key)
+    if cached and time.monotonic() - cached[0] < HISTORY_CACHE_TTL:
+        pages.move_to_end(key)
+        _, rows, has_next = cached
+    else:
+        if page > 0 and key not in cursors:
+            # Курсор потерян (перезапуск бота) — начинаем с первой страницы
+            page, key = 0, (child_id, 0)
+        try:
+            rows, has_next = await bot_repository.history_page(
+                context.user_data.get('parent_id'), child_id, cursors.get(key)
+            )
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке истории визитов: {e}")
+            await query.edit_message_text("❌ Ошибка при загрузке данных")
+            return
+        pages[key] = (time.monotonic(), rows, has_next)
+        while len(pages) > HISTORY_CACHE_PAGES:
+            pages.popitem(last=False)
+    
+    if has_next and rows:
+        last = rows[-1]
+        cursors[(child_id, page + 1)] = (last.date, last.time, last.id)
+    
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("⬅️ НОВЕЕ", callback_data=f"history_{child_id}_{page - 1}"))
+    if has_next:
+        navigation.append(InlineKeyboardButton("СТАРШЕ ➡️", callback_data=f"history_{child_id}_{page + 1}"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("🔙 НАЗАД", callback_data="back_to_menu")])
+    await query.edit_message_text(format_history_page(rows, page), reply_markup=InlineKeyboardMarkup(keyboard))
 
 async def show_settings(query, context):
     """Показать настройки"""
@@ -525,13 +628,127 @@ def get_weekday_name(weekday):
     return days[weekday]
 
 async def send_visit_results_to_parents(medical_record_id: int, db: Session):
-    """Отправка результатов визита родителям через бота"""
-    # TODO: Реализовать отправку результатов
-    logger.info(f"Отправка результатов визита {medical_record_id} родителям")
+    """Отправка результатов визита родителям через бота (через очередь parent_notifications)"""
+    row = db.query(Appointment.patient_id, Appointment.date) \
+        .join(MedicalRecord, MedicalRecord.appointment_id == Appointment.id) \
+        .filter(MedicalRecord.id == medical_record_id).first()
+    if not row:
+        return False
+    notify_visit_summary(db, medical_record_id, row.patient_id, row.date)
+    db.commit()
+    logger.info(f"Отправка результатов визита {medical_record_id} родителям поставлена в очередь")
     return True
 
+def instrumented(handler):
+    """Оборачивает обработчик бота подсчетом SQL-запросов"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        user = update.effective_user
+        audit.current_actor.set(f"bot:{user.id if user else '-'}")
+        # Попадают во все записи лога обработчика, включая запросы к БД в пуле потоков
+        chat = update.effective_chat
+        chat_id.set(str(chat.id) if chat else "-")
+        request_id.set(f"upd-{update.update_id}")
+        with track_queries(f"bot:{handler.__name__}") as stats:
+            await handler(update, context)
+        logger.debug(f"bot:{handler.__name__}: {stats.count} SQL-запросов, {stats.total_ms:.1f} мс")
+    return wrapper
+
+async def write_heartbeat():
+    """Периодически обновляет файл-heartbeat, пока работает цикл событий бота"""
+    while True:
+        try:
+            with open(BOT_HEARTBEAT_FILE, "w") as f:
+                f.write(str(time.time()))
+        except OSError as e:
+            logger.error(f"Не удалось записать heartbeat: {e}")
+        await asyncio.sleep(BOT_HEARTBEAT_INTERVAL)
+
+# medical_record_id -> (ETag версии PDF, file_id в Telegram)
+_visit_pdf_file_ids = OrderedDict()
+
+async def send_visit_summary_text(bot, chat_id: int, medical_record_id: int, caption: str):
+    """Итоги визита сообщением, когда PDF получить не удалось"""
+    summary = await bot_repository.visit_summary_text(medical_record_id)
+    text = f"{caption}\n\n{summary}" if summary else caption
+    if len(text) > TELEGRAM_MESSAGE_LIMIT:
+        text = text[:TELEGRAM_MESSAGE_LIMIT - 1] + "…"
+    await bot.send_message(chat_id=chat_id, text=text)
+
+async def send_visit_pdf(bot, chat_id: int, medical_record_id: int, caption: str):
+    """Отправляет PDF итогов визита; уже загруженная в Telegram версия уходит по file_id.
+
+    Если API не отдал PDF (рендерер недоступен, запись удалена, сервер не
+    отвечает), родитель получает те же итоги текстом.
+    """
+    cached = _visit_pdf_file_ids.get(medical_record_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{API_URL}/api/medical-records/{medical_record_id}/pdf", headers=headers) as response:
+                status = response.status
+                if status == 304:
+                    document, etag = cached[1], cached[0]
+                elif status == 200:
+                    document, etag = await response.read(), response.headers.get("ETag")
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = repr(e)
+    if status not in (200, 304):
+        logger.warning(f"PDF записи {medical_record_id} не получен ({status}), итоги уходят текстом")
+        await send_visit_summary_text(bot, chat_id, medical_record_id, caption)
+        return
+
+    if isinstance(document, bytes):
+        message = await bot.send_document(
+            chat_id=chat_id, document=document, filename=f"visit-{medical_record_id}.pdf", caption=caption
+        )
+    else:
+        message = await bot.send_document(chat_id=chat_id, document=document, caption=caption)
+    if etag:
+        _visit_pdf_file_ids[medical_record_id] = (etag, message.document.file_id)
+        _visit_pdf_file_ids.move_to_end(medical_record_id)
+        while len(_visit_pdf_file_ids) > BOT_PDF_CACHE_SIZE:
+            _visit_pdf_file_ids.popitem(last=False)
+
+async def deliver_pending(bot) -> int:
+    """Один проход очереди parent_notifications; возвращает число отправленных"""
+    sent = []
+    for notification in await bot_repository.pending_notifications():
+        chat_id.set(str(notification.chat_id))
+        request_id.set(f"notification-{notification.id}")
+        try:
+            if notification.medical_record_id:
+                await send_visit_pdf(bot, int(notification.chat_id), notification.medical_record_id, notification.text)
+            else:
+                await bot.send_message(chat_id=int(notification.chat_id), text=notification.text)
+            sent.append(notification.id)
+        except (Forbidden, BadRequest) as e:
+            # Бот заблокирован, чат удален или сообщение отвергнуто — повтор не поможет
+            logger.warning(f"Уведомление {notification.id} не может быть доставлено: {e}")
+            await bot_repository.mark_notification_failed(notification, str(e), permanent=True)
+        except Exception as e:
+            logger.error(f"Не удалось отправить уведомление {notification.id}: {e}")
+            await bot_repository.mark_notification_failed(notification, str(e))
+    await bot_repository.mark_notifications_sent(sent)
+    return len(sent)
+
+async def deliver_notifications(application: Application):
+    """Отправляет родителям сообщения из очереди parent_notifications"""
+    while True:
+        try:
+            await deliver_pending(application.bot)
+        except Exception as e:
+            logger.error(f"Ошибка при доставке уведомлений: {e}")
+        await asyncio.sleep(BOT_OUTBOX_INTERVAL)
+
+async def post_init(application: Application):
+    application.create_task(write_heartbeat())
+    application.create_task(deliver_notifications(application))
+    application.create_task(audit.run_flusher())
+
 def run_bot():
     """Запуск бота"""
+    setup_logging("bot")
     if not BOT_TOKEN:
         logger.error("❌ BOT_TOKEN не установлен")
         return
@@ -542,12 +759,12 @@ def run_bot():
     logger.info(f"🌐 API URL: {API_URL}")
 
     try:
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
 
         # Регистрируем обработчики
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CallbackQueryHandler(button_handler))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+        application.add_handler(CommandHandler("start", instrumented(start)))
+        application.add_handler(CallbackQueryHandler(instrumented(button_handler)))
+        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrumented(handle_message)))
 
         # Запускаем бота
         logger.info("✅ Бот запущен и готов к работе!")
@@ -0,0 +1,209 @@
+"""Национальный календарь прививок и пакетный расчет «кому пора прививаться».
+
+Расчет векторный: для всех пациентов сразу по каждой вакцине берется число
+сделанных доз и дата последней, следующая доза получает срок
+max(дата рождения + возраст по календарю, последняя доза + мин. интервал).
+Результаты хранятся в vaccinations_due и обновляются инкрементально:
+пишутся только изменившиеся строки.
+"""
+import os
+import logging
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from .models import Patient, Parent, ParentChild, Vaccination, VaccinationDue
+
+logger = logging.getLogger(__name__)
+
+# Через сколько дней после срока прививка считается просроченной
+VACCINATION_OVERDUE_DAYS = int(os.getenv("VACCINATION_OVERDUE_DAYS", "30"))
+
+# months/days — возраст по календарю, min_interval — дней после предыдущей дозы,
+# max_age_months — после этого возраста дозу не планируем
+Dose = namedtuple("Dose", "months days min_interval max_age_months", defaults=(0, 0, None))
+
+# Национальный календарь профилактических прививок (приказ Минздрава № 1122н)
+CALENDAR = {
+    "hepb": [Dose(0, 0), Dose(1, 0, 28), Dose(6, 0, 56)],
+    "bcg": [Dose(0, 3, max_age_months=12 * 7)],
+    "pneumo": [Dose(2, 0, max_age_months=60), Dose(4, 15, 56, 60), Dose(15, 0, 120, 60)],
+    "dtp": [Dose(3, 0), Dose(4, 15, 45), Dose(6, 0, 45), Dose(18, 0, 365), Dose(12 * 6, 0, 365), Dose(12 * 14, 0, 365)],
+    "polio": [Dose(3, 0), Dose(4, 15, 45), Dose(6, 0, 45), Dose(18, 0, 60), Dose(20, 0, 60), Dose(12 * 6, 0, 60)],
+    "hib": [Dose(3, 0, max_age_months=60), Dose(4, 15, 45, 60), Dose(6, 0, 45, 60), Dose(18, 0, 365, 60)],
+    "mmr": [Dose(12, 0), Dose(12 * 6, 0, 28)],
+}
+
+VACCINE_NAMES = {
+    "hepb": "Гепатит B",
+    "bcg": "Туберкулез (БЦЖ)",
+    "pneumo": "Пневмококковая инфекция",
+    "dtp": "Дифтерия, коклюш, столбняк",
+    "polio": "Полиомиелит",
+    "hib": "Гемофильная инфекция",
+    "mmr": "Корь, краснуха, паротит",
+}
+
+NAT = np.datetime64("NaT", "D")
+
+# ========== РАСЧЕТ СРОКОВ ==========
+
+def add_age(birth_dates: np.ndarray, months: int, days: int = 0) -> np.ndarray:
+    """birth + months месяцев (с обрезкой до конца месяца) + days дней"""
+    month_start = birth_dates.astype("datetime64[M]")
+    day_of_month = (birth_dates - month_start.astype("datetime64[D]")).astype(int)
+    target_month = month_start + months
+    month_length = ((target_month + 1).astype("datetime64[D]") - target_month.astype("datetime64[D]")).astype(int)
+    return target_month.astype("datetime64[D]") + np.minimum(day_of_month, month_length - 1) + days
+
+def compute_due(birth_dates: np.ndarray, counts: dict, last_dates: dict, today: date):
+    """Следующая доза по каждой вакцине для массива пациентов.
+
+    counts/last_dates: vaccine -> массивы той же длины, что birth_dates;
+    counts — номер последней сделанной дозы.
+    Возвращает vaccine -> (индексы пациентов, номера доз, сроки).
+    """
+    today64 = np.datetime64(today, "D")
+    result = {}
+    for vaccine, schedule in CALENDAR.items():
+        count = counts.get(vaccine, np.zeros(len(birth_dates), dtype=int))
+        last = last_dates.get(vaccine, np.full(len(birth_dates), NAT))
+        indexes, doses, due_dates = [], [], []
+        for number, dose in enumerate(schedule):
+            selected = np.nonzero(count == number)[0]
+            if not len(selected):
+                continue
+            due = add_age(birth_dates[selected], dose.months, dose.days)
+            if number > 0 and dose.min_interval:
+                after_previous = last[selected] + dose.min_interval
+                due = np.where(np.isnat(after_previous), due, np.maximum(due, after_previous))
+            if dose.max_age_months is not None:
+                keep = add_age(birth_dates[selected], dose.max_age_months) > today64
+                selected, due = selected[keep], due[keep]
+            indexes.append(selected)
+            doses.append(np.full(len(selected), number + 1))
+            due_dates.append(due)
+        if indexes:
+            result[vaccine] = (np.concatenate(indexes), np.concatenate(doses), np.concatenate(due_dates))
+    return result
+
+def due_status(due_on: np.ndarray, today: date) -> np.ndarray:
+    today64 = np.datetime64(today, "D")
+    return np.where(
+        due_on > today64, "upcoming",
+        np.where(due_on + VACCINATION_OVERDUE_DAYS < today64, "overdue", "due")
+    )
+
+# ========== ПЕРЕСЧЕТ И ХРАНЕНИЕ ==========
+
+def refresh_due(db: Session, patient_ids: Optional[list] = None, today: Optional[date] = None):
+    """Пересчитывает vaccinations_due для всех пациентов или только для patient_ids"""
+    today = today or date.today()
+
+    patients_query = db.query(Patient.id, Patient.birth_date) \
+        .filter(or_(Patient.status.is_(None), Patient.status != "archived"))
+    doses_query = db.query(
+        Vaccination.patient_id,
+        Vaccination.vaccine,
+        # Номер последней дозы, а не число строк: доза, сделанная в другой клинике
+        # и не внесенная, или введенная повторно запись не сдвигают календарь
+        func.max(Vaccination.dose_number),
+        func.max(Vaccination.administered_on)
+    ).group_by(Vaccination.patient_id, Vaccination.vaccine)
+    existing_query = db.query(
+        VaccinationDue.id, VaccinationDue.patient_id, VaccinationDue.vaccine,
+        VaccinationDue.dose_number, VaccinationDue.due_on, VaccinationDue.status
+    )
+    if patient_ids is not None:
+        patients_query = patients_query.filter(Patient.id.in_(patient_ids))
+        doses_query = doses_query.filter(Vaccination.patient_id.in_(patient_ids))
+        existing_query = existing_query.filter(VaccinationDue.patient_id.in_(patient_ids))
+
+    patients = patients_query.order_by(Patient.id).all()
+    ids = np.array([p.id for p in patients], dtype=np.int64)
+    birth_dates = np.array([p.birth_date for p in patients], dtype="datetime64[D]")
+
+    counts, last_dates = {}, {}
+    for patient_id, vaccine, count, last_on in doses_query.all():
+        if vaccine not in CALENDAR:
+            continue
+        position = np.searchsorted(ids, patient_id)
+        if position >= len(ids) or ids[position] != patient_id:
+            continue
+        counts.setdefault(vaccine, np.zeros(len(ids), dtype=int))[position] = count
+        last_dates.setdefault(vaccine, np.full(len(ids), NAT))[position] = np.datetime64(last_on, "D")
+
+    computed = {}
+    for vaccine, (indexes, doses, due_dates) in compute_due(birth_dates, counts, last_dates, today).items():
+        statuses = due_status(due_dates, today)
+        for patient_id, dose, due_on, status in zip(
+            ids[indexes].tolist(), doses.tolist(), due_dates.astype(object).tolist(), statuses.tolist()
+        ):
+            computed[(patient_id, vaccine)] = (dose, due_on, status)
+
+    existing = {(row.patient_id, row.vaccine): row for row in existing_query.all()}
+    now = datetime.now()
+    inserts, updates = [], []
+    for key, (dose, due_on, status) in computed.items():
+        row = existing.pop(key, None)
+        if row is None:
+            inserts.append({
+                "patient_id": key[0], "vaccine": key[1], "dose_number": dose,
+                "due_on": due_on, "status": status, "computed_at": now
+            })
+        elif (row.dose_number, row.due_on, row.status) != (dose, due_on, status):
+            updates.append({"id": row.id, "dose_number": dose, "due_on": due_on, "status": status, "computed_at": now})
+    stale_ids = [row.id for row in existing.values()]
+
+    if inserts:
+        db.bulk_insert_mappings(VaccinationDue, inserts)
+    if updates:
+        db.bulk_update_mappings(VaccinationDue, updates)
+    for start in range(0, len(stale_ids), 1000):
+        db.query(VaccinationDue).filter(
+            VaccinationDue.id.in_(stale_ids[start:start + 1000])
+        ).delete(synchronize_session=False)
+    db.commit()
+
+    return {"patients": len(ids), "inserted": len(inserts), "updated": len(updates), "deleted": len(stale_ids)}
+
+# ========== ВЫБОРКИ ==========
+
+def worklist(db: Session, statuses=("overdue", "due"), limit: int = 100, offset: int = 0):
+    """Рабочий список врача: пациенты, которым пора или уже поздно прививаться"""
+    return db.query(
+        VaccinationDue.patient_id,
+        VaccinationDue.vaccine,
+        VaccinationDue.dose_number,
+        VaccinationDue.due_on,
+        VaccinationDue.status,
+        Patient.first_name,
+        Patient.last_name,
+        Patient.birth_date,
+        Patient.phone
+    ).join(Patient, VaccinationDue.patient_id == Patient.id) \
+     .filter(VaccinationDue.status.in_(statuses)) \
+     .order_by(VaccinationDue.due_on) \
+     .limit(limit).offset(offset).all()
+
+def reminder_candidates(db: Session, days_ahead: int = 3, today: Optional[date] = None):
+    """Данные для напоминаний в боте: прививки со сроком в ближайшие days_ahead дней"""
+    today = today or date.today()
+    return db.query(
+        Parent.id.label("parent_id"),
+        Parent.phone.label("parent_phone"),
+        Patient.id.label("patient_id"),
+        Patient.first_name,
+        Patient.last_name,
+        VaccinationDue.vaccine,
+        VaccinationDue.dose_number,
+        VaccinationDue.due_on
+    ).join(Patient, VaccinationDue.patient_id == Patient.id) \
+     .join(ParentChild, ParentChild.patient_id == Patient.id) \
+     .join(Parent, ParentChild.parent_id == Parent.id) \
+     .filter(VaccinationDue.due_on.between(today, today + timedelta(days=days_ahead))) \
+     .order_by(Parent.id, VaccinationDue.due_on).all()
@@ -0,0 +1,253 @@
+"""PDF с итогами визита для родителей: печать в кабинете и отправка ботом.
+
+PDF строится reportlab в пуле процессов и хранится в PDF_CACHE_DIR под
+именем <id записи>-<версия>.pdf. Версия — хэш содержимого сводки и версии
+макета, поэтому правка записи дает новый файл, а повторные скачивания и
+отправки ботом берут готовый. Предыдущие версии записи удаляются после
+рендеринга новой.
+"""
+import os
+import glob
+import json
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .models import Patient, Appointment, MedicalRecord
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", os.path.join(BASE_DIR, "pdf_cache"))
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+# TTF-шрифт с кириллицей (встроенные шрифты PDF ее не содержат)
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+# Менять при изменении макета: старые файлы перестанут совпадать по версии
+LAYOUT_VERSION = "1"
+
+EXAMINATION_LABELS = {
+    "temperature": "Температура",
+    "weight": "Вес",
+    "height": "Рост",
+    "condition": "Общее состояние",
+    "skin": "Кожные покровы",
+    "breathing": "Дыхание",
+    "wheezing": "Хрипы",
+    "heart": "Сердце",
+    "abdomen": "Живот",
+    "throat": "Зев",
+    "notes": "Примечания",
+}
+
+VISIT_TYPES = {
+    "primary": "первичный прием",
+    "repeat": "повторный прием",
+    "control": "контрольный визит",
+    "vaccination": "прививка",
+    "consultation": "консультация",
+}
+
+class RendererUnavailable(RuntimeError):
+    """Нет reportlab или шрифта PDF_FONT_PATH — PDF не построить до исправления сервера"""
+
+# ========== ДАННЫЕ ==========
+
+def visit_summary(db: Session, record_id: int) -> Optional[dict]:
+    """Сводка визита простыми типами (передается в процесс рендеринга)"""
+    row = db.query(MedicalRecord, Appointment, Patient) \
+        .join(Appointment, MedicalRecord.appointment_id == Appointment.id) \
+        .join(Patient, Appointment.patient_id == Patient.id) \
+        .filter(MedicalRecord.id == record_id).first()
+    if not row:
+        return None
+    record, appointment, patient = row
+    return summary_from_rows(record, appointment, patient)
+
+def visits_for_date(db: Session, day) -> list:
+    """Сводки всех визитов с заполненной медицинской записью за день"""
+    rows = db.query(MedicalRecord, Appointment, Patient) \
+        .join(Appointment, MedicalRecord.appointment_id == Appointment.id) \
+        .join(Patient, Appointment.patient_id == Patient.id) \
+        .filter(Appointment.date == day).order_by(Appointment.time).all()
+    return [summary_from_rows(*row) for row in rows]
+
+def summary_from_rows(record: MedicalRecord, appointment: Appointment, patient: Patient) -> dict:
+    examination = record.examination or {}
+    diagnosis = record.diagnosis or {}
+    prescriptions = record.prescriptions or {}
+    if isinstance(prescriptions, list):
+        prescriptions = {"template": prescriptions}
+
+    return {
+        "record_id": record.id,
+        "patient": f"{patient.last_name} {patient.first_name}",
+        "birth_date": patient.birth_date.strftime('%d.%m.%Y') if patient.birth_date else "",
+        "visit": f"{appointment.date.strftime('%d.%m.%Y')} {appointment.time.strftime('%H:%M')}",
+        "complaints": record.complaints or "",
+        "examination": [
+            (label, str(examination[key])) for key, label in EXAMINATION_LABELS.items() if examination.get(key)
+        ],
+        "diagnosis": " ".join(filter(None, [diagnosis.get("main"), diagnosis.get("mainText")])),
+        "additional_diagnoses": [str(item) for item in diagnosis.get("additional") or [] if item],
+        "prescriptions": [str(item) for item in prescriptions.get("template") or []] + [
+            " — ".join(filter(None, [item.get("medication"), item.get("dosage"), item.get("schedule")]))
+            for item in prescriptions.get("manual") or [] if isinstance(item, dict)
+        ],
+        "duration": str(prescriptions.get("duration") or ""),
+        "diet": str(prescriptions.get("diet") or ""),
+        "recommendations": record.recommendations or "",
+        "next_visit": " ".join(filter(None, [
+            record.next_visit_date.strftime('%d.%m.%Y') if record.next_visit_date else "",
+            record.next_visit_time.strftime('%H:%M') if record.next_visit_time else "",
+            VISIT_TYPES.get(record.next_visit_type, record.next_visit_type or "") if record.next_visit_date else "",
+        ])),
+    }
+
+def summary_version(summary: dict) -> str:
+    payload = json.dumps(summary, ensure_ascii=False, sort_keys=True) + LAYOUT_VERSION
+    return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+def pdf_path(record_id: int, version: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, f"{record_id}-{version}.pdf")
+
+def summary_sections(summary: dict) -> list:
+    """Непустые разделы сводки: (заголовок, текст, пункты списка)"""
+    sections = [
+        ("Жалобы", summary["complaints"], []),
+        ("Осмотр", "", [f"{label}: {value}" for label, value in summary["examination"]]),
+        ("Диагноз", summary["diagnosis"], summary["additional_diagnoses"]),
+        ("Назначения", "", summary["prescriptions"] + [
+            line for line in (
+                f"Длительность: {summary['duration']}" if summary["duration"] else "",
+                f"Диета: {summary['diet']}" if summary["diet"] else "",
+            ) if line
+        ]),
+        ("Рекомендации", summary["recommendations"], []),
+        ("Следующий визит", summary["next_visit"], []),
+    ]
+    return [section for section in sections if section[1] or section[2]]
+
+def summary_text(summary: dict) -> str:
+    """Сводка обычным текстом — для сообщения, когда PDF построить не удалось"""
+    lines = [
+        "Итоги визита",
+        f"Пациент: {summary['patient']}, д.р. {summary['birth_date']}",
+        f"Дата визита: {summary['visit']}",
+    ]
+    for name, value, items in summary_sections(summary):
+        lines.append("")
+        lines.append(f"{name}:")
+        if value:
+            lines.append(value)
+        lines.extend(f"• {item}" for item in items)
+    return "\n".join(lines)
+
+# ========== РЕНДЕРИНГ ==========
+
+def render_pdf(summary: dict, target: str) -> str:
+    """Рисует PDF сводки (выполняется в отдельном процессе) и удаляет прежние версии записи"""
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import mm
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont, TTFError
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable
+    except ImportError as e:
+        raise RendererUnavailable(f"reportlab не установлен: {e}")
+    from xml.sax.saxutils import escape
+
+    if "VisitFont" not in pdfmetrics.getRegisteredFontNames():
+        try:
+            pdfmetrics.registerFont(TTFont("VisitFont", PDF_FONT_PATH))
+        except TTFError as e:
+            raise RendererUnavailable(f"Не удалось загрузить шрифт PDF_FONT_PATH={PDF_FONT_PATH}: {e}")
+    styles = getSampleStyleSheet()
+    body = ParagraphStyle("VisitBody", parent=styles["BodyText"], fontName="VisitFont", fontSize=10, leading=13)
+    heading = ParagraphStyle("VisitHeading", parent=body, fontSize=12, leading=16, spaceBefore=8)
+    title = ParagraphStyle("VisitTitle", parent=body, fontSize=15, leading=20)
+
+    def text(value):
+        return escape(value).replace("\n", "<br/>")
+
+    story = [
+        Paragraph("Итоги визита", title),
+        Paragraph(f"Пациент: {text(summary['patient'])}, д.р. {text(summary['birth_date'])}", body),
+        Paragraph(f"Дата визита: {text(summary['visit'])}", body),
+    ]
+
+    for name, value, items in summary_sections(summary):
+        story.append(Paragraph(name, heading))
+        if value:
+            story.append(Paragraph(text(value), body))
+        if items:
+            story.append(ListFlowable([Paragraph(text(item), body) for item in items], bulletType="bullet"))
+    story.append(Spacer(1, 10 * mm))
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_target = f"{target}.{os.getpid()}.tmp"
+    SimpleDocTemplate(
+        tmp_target, pagesize=A4, title=f"Итоги визита {summary['visit']}",
+        leftMargin=18 * mm, rightMargin=18 * mm, topMargin=15 * mm, bottomMargin=15 * mm
+    ).build(story)
+    os.replace(tmp_target, target)
+    remove_old_versions(summary["record_id"], target)
+    return target
+
+def remove_old_versions(record_id: int, keep: str):
+    for path in glob.glob(os.path.join(PDF_CACHE_DIR, f"{record_id}-*.pdf")):
+        if path != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+_executor = None
+_inflight = {}
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _executor
+
+async def ensure_pdf(summary: dict) -> str:
+    """Путь к готовому PDF; рендерит в пуле процессов, если версии еще нет в кэше.
+
+    Одновременные запросы одной версии ждут один и тот же рендеринг.
+    """
+    path = pdf_path(summary["record_id"], summary_version(summary))
+    if os.path.exists(path):
+        return path
+    future = _inflight.get(path)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = asyncio.ensure_future(loop.run_in_executor(_get_executor(), render_pdf, summary, path))
+        _inflight[path] = future
+        future.add_done_callback(lambda _: _inflight.pop(path, None))
+    return await asyncio.shield(future)
+
+async def ensure_many(summaries: list) -> list:
+    """Рендерит сводки параллельно (по числу процессов пула); порядок сохраняется"""
+    return await asyncio.gather(*(ensure_pdf(summary) for summary in summaries))
+
+_background = set()
+
+def prerender(summary: dict):
+    """Фоновый рендеринг сразу после сохранения записи; ошибки только логируются"""
+    async def run():
+        try:
+            await ensure_pdf(summary)
+        except Exception as e:
+            logger.error(f"Не удалось построить PDF записи {summary['record_id']}: {e}")
+    task = asyncio.ensure_future(run())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+def shutdown():
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+import argparse
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.archive import ARCHIVE_AFTER_YEARS, archive_appointments
+
+def run_archive(years: int):
+    """Ежемесячный перенос старых визитов в холодную секцию и обслуживание секций"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = archive_appointments(db, years=years)
+        elapsed = time.perf_counter() - started
+        print(
+            f"✅ Граница архива: {result['cutoff']}, в архив: {result['archived']}, "
+            f"из архива: {result['restored']}, новых секций: {len(result['created_partitions'])}, "
+            f"удалено пустых: {len(result['dropped_partitions'])} за {elapsed:.2f} с"
+        )
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при архивировании визитов: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Архивирование визитов старше N лет")
+    parser.add_argument("--years", type=int, default=ARCHIVE_AFTER_YEARS)
+    run_archive(parser.parse_args().years)
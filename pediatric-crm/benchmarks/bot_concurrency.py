@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Проверка, что обработчики бота не блокируют цикл событий.
+
+Запускает много одновременных поддельных нажатий кнопок (список детей,
+выбор ребенка, история) и параллельно меряет задержку цикла событий:
+таймер просыпается каждые TICK_MS, опоздание — время, когда цикл был занят.
+Пока запросы к БД идут в пуле потоков, опоздания остаются малыми при любой
+нагрузке.
+
+Запуск из каталога pediatric-crm: python benchmarks/bot_concurrency.py [нажатий] [родитель]
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import telegram_bot, bot_repository
+
+TICK_MS = 10
+# Допустимое опоздание таймера: больше — значит, цикл событий кто-то держал
+MAX_LAG_MS = float(os.getenv("BOT_MAX_LOOP_LAG_MS", "100"))
+
+class FakeQuery:
+    """Колбэк-запрос Telegram, запоминающий ответы вместо отправки"""
+
+    def __init__(self, data: str, user_id: int):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.replies = []
+
+    async def answer(self):
+        pass
+
+    async def edit_message_text(self, text, reply_markup=None):
+        self.replies.append(text)
+
+def fake_update(data: str, user_id: int, parent_id: int):
+    query = FakeQuery(data, user_id)
+    update = SimpleNamespace(callback_query=query, effective_user=query.from_user)
+    context = SimpleNamespace(
+        user_data={'authenticated': True, 'parent_id': parent_id, 'appointment_data': {}},
+        chat_data={},
+        bot=None
+    )
+    return update, context
+
+async def measure_lag(stop: asyncio.Event, lags: list):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK_MS / 1000)
+        lags.append((loop.time() - started) * 1000 - TICK_MS)
+
+async def press(data: str, user_id: int, parent_id: int):
+    update, context = fake_update(data, user_id, parent_id)
+    started = time.perf_counter()
+    await telegram_bot.button_handler(update, context)
+    return (time.perf_counter() - started) * 1000, update.callback_query.replies
+
+async def run(presses: int, parent_id: int):
+    children = await bot_repository.linked_children(parent_id)
+    if not children:
+        print(f"❌ К родителю {parent_id} не привязаны дети — нечего запрашивать")
+        return False
+    actions = ["my_children", "history"] + [
+        action for child in children[:20]
+        for action in (f"select_child_{child.id}", f"history_{child.id}_0")
+    ]
+
+    stop = asyncio.Event()
+    lags = []
+    lag_task = asyncio.ensure_future(measure_lag(stop, lags))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        press(actions[i % len(actions)], 100000 + i, parent_id) for i in range(presses)
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await lag_task
+
+    durations = [duration for duration, _ in results]
+    errors = sum(1 for _, replies in results if any(reply.startswith("❌") for reply in replies))
+    print(f"Нажатий: {presses}, потоков БД: {bot_repository.BOT_DB_THREADS}, за {elapsed:.2f} с")
+    print(f"  ответ     медиана {statistics.median(durations):8.1f} мс   макс {max(durations):8.1f} мс")
+    print(f"  задержка  медиана {statistics.median(lags):8.1f} мс   макс {max(lags):8.1f} мс")
+
+    ok = True
+    if errors:
+        print(f"❌ Ошибок в ответах: {errors}")
+        ok = False
+    if max(lags) > MAX_LAG_MS:
+        print(f"❌ Цикл событий блокировался дольше {MAX_LAG_MS:.0f} мс")
+        ok = False
+    if ok:
+        print("✅ Цикл событий не блокировался")
+    return ok
+
+if __name__ == "__main__":
+    presses = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    parent_id = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    sys.exit(0 if asyncio.run(run(presses, parent_id)) else 1)
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Замер холодного старта: импорт app.main и прогрев в lifespan.
+
+Каждый прогон — отдельный процесс, чтобы не мешал кэш модулей.
+Запуск из каталога pediatric-crm: python benchmarks/cold_start.py [прогонов]
+"""
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE_SCRIPT = """
+import time, json, asyncio
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+
+async def run_lifespan():
+    async with app.router.lifespan_context(app):
+        pass
+
+asyncio.run(run_lifespan())
+ready = time.perf_counter()
+print(json.dumps({"import": imported - started, "lifespan": ready - imported, "total": ready - started}))
+"""
+
+def measure_once():
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main(runs: int):
+    results = [measure_once() for _ in range(runs)]
+    print(f"Холодный старт, прогонов: {runs}")
+    for key in ("import", "lifespan", "total"):
+        values = [r[key] * 1000 for r in results]
+        print(f"  {key:<9} медиана {statistics.median(values):8.1f} мс   макс {max(values):8.1f} мс")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
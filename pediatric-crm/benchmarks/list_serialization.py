@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Сравнение CPU на выдачу больших списков: /api/... против /api/v2/...
+
+Старый путь: полные ORM-объекты, словари вручную, jsonable_encoder и
+json.dumps (так FastAPI отдает возвращенный список). Новый: выборка только
+нужных колонок и ORJSONResponse. Меряется процессорное время, а не общее,
+чтобы ожидание БД не смазывало разницу.
+
+Запуск из каталога pediatric-crm: python benchmarks/list_serialization.py [повторов]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from app.database import SessionLocal
+from app.models import Patient, Appointment
+from app.main import PATIENT_LIST_COLUMNS, APPOINTMENT_LIST_COLUMNS
+
+TARGET_SPEEDUP = 2.0
+
+def old_appointments(db):
+    appointments = db.query(Appointment).all()
+    data = [{
+        "id": a.id,
+        "patient_id": a.patient_id,
+        "date": a.date.isoformat(),
+        "time": a.time.strftime('%H:%M'),
+        "type": a.type,
+        "status": a.status
+    } for a in appointments]
+    return JSONResponse(jsonable_encoder(data)).body
+
+def new_appointments(db):
+    rows = db.query(*APPOINTMENT_LIST_COLUMNS).all()
+    return ORJSONResponse([{
+        "id": r.id,
+        "patient_id": r.patient_id,
+        "date": r.date,
+        "time": r.time.strftime('%H:%M'),
+        "type": r.type,
+        "status": r.status
+    } for r in rows]).body
+
+def old_patients(db):
+    patients = db.query(Patient).all()
+    data = [{
+        "id": p.id,
+        "first_name": p.first_name,
+        "last_name": p.last_name,
+        "birth_date": p.birth_date.isoformat() if p.birth_date else None,
+        "phone": p.phone,
+        "status": p.status
+    } for p in patients]
+    return JSONResponse(jsonable_encoder(data)).body
+
+def new_patients(db):
+    return ORJSONResponse([row._asdict() for row in db.query(*PATIENT_LIST_COLUMNS).all()]).body
+
+def cpu_ms(fn, runs: int):
+    timings = []
+    for _ in range(runs):
+        db = SessionLocal()
+        try:
+            started = time.process_time()
+            body = fn(db)
+            timings.append((time.process_time() - started) * 1000)
+        finally:
+            db.close()
+    return statistics.median(timings), len(body)
+
+def main(runs: int):
+    ok = True
+    for name, old, new in (
+        ("appointments", old_appointments, new_appointments),
+        ("patients", old_patients, new_patients),
+    ):
+        old_ms, old_size = cpu_ms(old, runs)
+        new_ms, new_size = cpu_ms(new, runs)
+        speedup = old_ms / new_ms if new_ms else float("inf")
+        print(f"{name:<13} было {old_ms:8.1f} мс  стало {new_ms:8.1f} мс  x{speedup:.1f}  "
+              f"({old_size} / {new_size} байт)")
+        if speedup < TARGET_SPEEDUP:
+            ok = False
+    if ok:
+        print(f"✅ Ускорение не меньше x{TARGET_SPEEDUP:.0f}")
+    else:
+        print(f"❌ Ускорение меньше x{TARGET_SPEEDUP:.0f} (на маленькой базе заполните ее create_test_data.py)")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if main(int(sys.argv[1]) if len(sys.argv) > 1 else 20) else 1)
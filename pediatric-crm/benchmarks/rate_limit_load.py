@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Нагрузочная проверка ограничителя: интерфейс врача отвечает под злоупотреблением.
+
+Против запущенного сервера сначала меряет задержку страниц врача без нагрузки,
+затем включает «злоупотребляющих» клиентов: они без пауз запрашивают списки
+пациентов, ищут по медицинским записям и заказывают PDF и отчеты. Во время
+нагрузки задержка страниц врача меряется снова. Проверка проходит, если p95
+под нагрузкой не превышает DOCTOR_P95_LIMIT_MS, а лишние запросы получили 429.
+
+Запуск из каталога pediatric-crm при работающем сервере:
+python benchmarks/rate_limit_load.py [секунд] [клиентов]
+"""
+import os
+import sys
+import time
+import asyncio
+import statistics
+from collections import Counter
+
+import aiohttp
+
+BASE_URL = os.getenv("LOAD_BASE_URL", "http://127.0.0.1:8000")
+DOCTOR_P95_LIMIT_MS = float(os.getenv("DOCTOR_P95_LIMIT_MS", "500"))
+DOCTOR_PAGES = ["/", "/appointments"]
+ABUSE_PATHS = [
+    "/api/patients",
+    "/api/clinical-search?medication=амокс",
+    "/api/appointments?date=2026-10-19",
+    "/api/reports/debtors",
+    "/api/visits/pdf?date=2026-10-19",
+]
+
+async def doctor(session, stop: asyncio.Event, latencies: list):
+    """Врач открывает страницы раз в 200 мс"""
+    while not stop.is_set():
+        for page in DOCTOR_PAGES:
+            started = time.perf_counter()
+            async with session.get(BASE_URL + page) as response:
+                await response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.2)
+
+async def abuser(session, stop: asyncio.Event, statuses: Counter, n: int):
+    """Клиент без пауз; X-Forwarded-For учитывается только от адресов RATE_LIMIT_TRUSTED_PROXIES"""
+    headers = {"X-Forwarded-For": f"10.0.0.{n % 250 + 1}"}
+    while not stop.is_set():
+        for path in ABUSE_PATHS:
+            try:
+                async with session.get(BASE_URL + path, headers=headers) as response:
+                    await response.read()
+                    statuses[response.status] += 1
+            except aiohttp.ClientError:
+                statuses["error"] += 1
+
+async def measure(seconds: float, abusers: int):
+    latencies = []
+    statuses = Counter()
+    stop = asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        tasks = [asyncio.create_task(doctor(session, stop, latencies))]
+        tasks += [asyncio.create_task(abuser(session, stop, statuses, n)) for n in range(abusers)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        await asyncio.gather(*tasks)
+    return latencies, statuses
+
+def p95(values):
+    return statistics.quantiles(values, n=20)[-1] if len(values) > 1 else values[0]
+
+async def main(seconds: float, abusers: int):
+    baseline, _ = await measure(seconds / 2, 0)
+    loaded, statuses = await measure(seconds, abusers)
+
+    print(f"Страницы врача без нагрузки: медиана {statistics.median(baseline):.1f} мс, p95 {p95(baseline):.1f} мс")
+    print(f"Страницы врача под нагрузкой: медиана {statistics.median(loaded):.1f} мс, p95 {p95(loaded):.1f} мс")
+    total = sum(statuses.values())
+    print(f"Запросов злоупотребляющих клиентов: {total}, ответы: {dict(statuses)}")
+
+    if statuses[429] == 0:
+        print("❌ Ни одного 429: ограничитель выключен или лимиты слишком велики")
+        sys.exit(1)
+    if p95(loaded) > DOCTOR_P95_LIMIT_MS:
+        print(f"❌ p95 страниц врача выше {DOCTOR_P95_LIMIT_MS:.0f} мс")
+        sys.exit(1)
+    print(f"✅ Интерфейс врача отвечает под нагрузкой, отклонено {statuses[429]} запросов")
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    abusers = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(main(seconds, abusers))
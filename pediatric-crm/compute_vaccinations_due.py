@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.vaccinations import refresh_due
+
+def compute_vaccinations_due():
+    """Ночной пересчет сроков прививок по всей базе пациентов"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = refresh_due(db)
+        elapsed = time.perf_counter() - started
+        print(
+            f"✅ Пациентов: {result['patients']}, добавлено: {result['inserted']}, "
+            f"обновлено: {result['updated']}, удалено: {result['deleted']} за {elapsed:.2f} с"
+        )
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при расчете прививок: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    compute_vaccinations_due()
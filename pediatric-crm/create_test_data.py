@@ -7,6 +7,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.database import SessionLocal
 from app.models import Patient, Parent, Appointment
+from app import patient_picker  # noqa: F401 — события заполняют ключи выбора пациента
 
 def create_test_data():
     db = SessionLocal()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+import argparse
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.dedupe import DEDUPE_THRESHOLD, DEDUPE_MAX_BLOCK, refresh_keys, find_duplicates
+
+def run_dedupe(threshold: float, max_block: int, limit: int):
+    """Пакетный поиск дублей пациентов: пары для проверки и слияния в карточке пациента"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        filled = refresh_keys(db)
+        db.commit()
+        pairs = find_duplicates(db, threshold=threshold, max_block=max_block)
+        elapsed = time.perf_counter() - started
+        for pair in pairs[:limit]:
+            print(
+                f"{pair['score']:.3f}  #{pair['patient_id']} <- #{pair['duplicate_id']}  "
+                f"({', '.join(pair['reasons'])})"
+            )
+        print(f"✅ Пар с оценкой от {threshold}: {len(pairs)}, заполнено ключей: {filled} за {elapsed:.2f} с")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при поиске дублей: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск дублей пациентов")
+    parser.add_argument("--threshold", type=float, default=DEDUPE_THRESHOLD)
+    parser.add_argument("--max-block", type=int, default=DEDUPE_MAX_BLOCK)
+    parser.add_argument("--limit", type=int, default=100, help="сколько пар вывести")
+    args = parser.parse_args()
+    run_dedupe(args.threshold, args.max_block, args.limit)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app import growth
+
+def flag_growth_outliers():
+    """Пересчет z-оценок ВОЗ по всем измерениям и пометка выбросов"""
+    growth.load_tables()
+    missing = growth.missing_tables()
+    if missing:
+        # Без таблиц все z-оценки — NaN, и пересчет молча снял бы все флаги
+        print(f"❌ Нет таблиц LMS в {growth.GROWTH_TABLES_DIR}: {', '.join(missing)}")
+        print("   Подготовьте их: python import_who_tables.py <каталог с файлами ВОЗ>")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        result = growth.flag_outliers(db)
+        elapsed = time.perf_counter() - started
+        print(
+            f"✅ Измерений: {result['measurements']}, выбросов: {result['outliers']}, "
+            f"обновлено строк: {result['updated']} за {elapsed:.2f} с"
+        )
+        if result["out_of_range"]:
+            print(f"ℹ️ Старше 5 лет (вне стандартов ВОЗ, без z-оценок): {result['out_of_range']}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при пересчете: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    flag_growth_outliers()
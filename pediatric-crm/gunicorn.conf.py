@@ -0,0 +1,63 @@
+# Конфигурация production-запуска: gunicorn с воркерами uvicorn.
+# Запуск из каталога pediatric-crm: gunicorn -c gunicorn.conf.py app.main:app
+# Все параметры задаются переменными окружения (.env).
+import os
+import multiprocessing
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("WEB_BIND", "0.0.0.0:8000")
+# За nginx ограничитель частоты (app.ratelimit) берет адрес клиента из X-Real-IP, если
+# запрос пришел с адреса из RATE_LIMIT_TRUSTED_PROXIES (по умолчанию локальный nginx).
+# nginx на другой машине нужно добавить туда, иначе все клиенты делят ведро его адреса
+workers = int(os.getenv("WEB_WORKERS", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Перезапуск воркеров для защиты от утечек памяти
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "200"))
+
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+
+# Приложение импортируется в каждом воркере после fork:
+# пул соединений БД не должен разделяться между процессами
+preload_app = False
+
+accesslog = os.getenv("WEB_ACCESS_LOG", "-")
+errorlog = os.getenv("WEB_ERROR_LOG", "-")
+loglevel = os.getenv("WEB_LOG_LEVEL", "info")
+
+def on_starting(server):
+    # Воркеры наследуют окружение мастера: app.live узнает, сколько их
+    os.environ["WEB_WORKERS"] = str(workers)
+    if workers > 1 and os.getenv("CACHE_BACKEND", "memory") != "redis":
+        server.log.warning(
+            "WEB_WORKERS=%s при CACHE_BACKEND=memory: кэш и его инвалидация "
+            "будут локальны для каждого воркера (занятые слоты не кэшируются вовсе), "
+            "задайте CACHE_BACKEND=redis", workers
+        )
+    if workers > 1 and os.getenv("LIVE_BACKEND", os.getenv("CACHE_BACKEND", "memory")) != "redis":
+        server.log.warning(
+            "WEB_WORKERS=%s при LIVE_BACKEND=memory: живое обновление расписания "
+            "отключено, задайте LIVE_BACKEND=redis (или CACHE_BACKEND=redis)", workers
+        )
+    if workers > 1 and os.getenv("RATE_LIMIT_BACKEND", "memory") != "redis":
+        server.log.warning(
+            "WEB_WORKERS=%s при RATE_LIMIT_BACKEND=memory: у каждого воркера свои ведра, "
+            "фактический лимит в %s раз выше, задайте RATE_LIMIT_BACKEND=redis", workers, workers
+        )
+
+# Несколько воркеров пишут каждый в свой файл лога web-<слот>.log (см. app.logging_config).
+# Слот — наименьший номер, не занятый живыми воркерами: перезапущенный по
+# max_requests воркер продолжает файл предшественника, а не заводит новый
+def pre_fork(server, worker):
+    taken = {getattr(other, "log_slot", None) for other in server.WORKERS.values()}
+    worker.log_slot = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+
+def post_fork(server, worker):
+    if workers > 1:
+        os.environ["LOG_WORKER_SLOT"] = str(worker.log_slot)
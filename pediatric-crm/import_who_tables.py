@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+import sys
+import os
+import csv
+import argparse
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.growth import GROWTH_TABLES_DIR, INDICATORS, SEXES, AGE_RANGE_DAYS
+
+def find_source(source_dir: str, indicator: str, sex: str):
+    """Файл ВОЗ для показателя и пола по имени (wfa-boys-zscore-expanded-tables.txt и т.п.)"""
+    for name in sorted(os.listdir(source_dir)):
+        lowered = name.lower().replace("-", "_")
+        if lowered.startswith(indicator + "_") and sex in lowered and lowered.endswith((".txt", ".csv", ".tsv")):
+            return os.path.join(source_dir, name)
+    return None
+
+def read_lms(path: str):
+    """Строки (Day, L, M, S) из таблицы ВОЗ с любым разделителем; лишние колонки отбрасываются"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters="\t,;")
+        reader = csv.DictReader(f, dialect=dialect)
+        columns = {name.strip().lower(): name for name in reader.fieldnames}
+        if not {"day", "l", "m", "s"} <= set(columns):
+            raise ValueError(f"{path}: нет колонок Day, L, M, S")
+        rows = [
+            (int(float(r[columns["day"]])), float(r[columns["l"]]), float(r[columns["m"]]), float(r[columns["s"]]))
+            for r in reader if r[columns["day"]].strip()
+        ]
+    if [row[0] for row in rows] != list(range(AGE_RANGE_DAYS + 1)):
+        raise ValueError(f"{path}: дни должны идти подряд от 0 до {AGE_RANGE_DAYS}")
+    if any(row[2] <= 0 or row[3] <= 0 for row in rows):
+        raise ValueError(f"{path}: M и S должны быть положительными")
+    return rows
+
+def import_who_tables(source_dir: str, target_dir: str):
+    """Приводит расширенные таблицы ВОЗ к CSV Day,L,M,S, которые читает app.growth"""
+    os.makedirs(target_dir, exist_ok=True)
+    missing = []
+    for indicator in INDICATORS:
+        for sex in SEXES.values():
+            source = find_source(source_dir, indicator, sex)
+            if source is None:
+                missing.append(f"{indicator}_{sex}")
+                continue
+            try:
+                rows = read_lms(source)
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+            target = os.path.join(target_dir, f"{indicator}_{sex}.csv")
+            with open(target, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["Day", "L", "M", "S"])
+                writer.writerows(rows)
+            print(f"✅ {os.path.basename(source)} -> {target}: {len(rows)} строк")
+    if missing:
+        print(f"❌ Не найдены файлы ВОЗ для: {', '.join(missing)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Импорт расширенных таблиц LMS ВОЗ")
+    parser.add_argument("source_dir", help="каталог со скачанными файлами ВОЗ")
+    parser.add_argument("--target-dir", default=GROWTH_TABLES_DIR)
+    args = parser.parse_args()
+    import_who_tables(args.source_dir, args.target_dir)
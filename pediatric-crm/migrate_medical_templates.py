@@ -5,16 +5,13 @@ from datetime import datetime
 # Добавляем путь к проекту
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database import SessionLocal, engine
-from app.models import Base, MedicalTemplate
+from app.database import SessionLocal
+from app.models import MedicalTemplate
+from app.cache import cache, TEMPLATES
 
 def create_medical_templates():
     db = SessionLocal()
     try:
-        # Создаем таблицы
-        Base.metadata.create_all(bind=engine)
-        print("✅ Таблицы созданы успешно")
-
         # Проверяем, есть ли уже шаблоны
         existing_templates = db.query(MedicalTemplate).count()
         if existing_templates > 0:
@@ -74,6 +71,7 @@ def create_medical_templates():
             db.add(template)
 
         db.commit()
+        cache.invalidate(TEMPLATES)
         print("✅ Медицинские шаблоны успешно созданы!")
         
     except Exception as e:
@@ -0,0 +1,76 @@
+"""Утилиты для онлайн-безопасных миграций"""
+from alembic import op
+import sqlalchemy as sa
+
+BATCH_SIZE = 1000
+
+def is_postgres():
+    return op.get_bind().dialect.name == "postgresql"
+
+def create_index_concurrently(name, table, columns, **kw):
+    """CREATE INDEX CONCURRENTLY на Postgres, обычный индекс на остальных СУБД"""
+    if is_postgres():
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+    else:
+        op.create_index(name, table, columns, if_not_exists=True, **kw)
+
+def drop_index_concurrently(name, table):
+    if is_postgres():
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(name, table_name=table, if_exists=True)
+
+def backfill_in_batches(table, columns, transform, types=None, batch_size=BATCH_SIZE):
+    """Построчный бэкфилл с keyset-пагинацией по id.
+
+    transform(row) возвращает словарь новых значений или None, если строку
+    менять не нужно. Каждая пачка коммитится отдельно, чтобы не держать
+    длинную транзакцию и блокировки на всей таблице.
+    """
+    conn = op.get_bind()
+    select = sa.text(
+        f"SELECT id, {', '.join(columns)} FROM {table} "
+        "WHERE id > :last_id ORDER BY id LIMIT :limit"
+    )
+    last_id = 0
+    with op.get_context().autocommit_block():
+        while True:
+            rows = conn.execute(select, {"last_id": last_id, "limit": batch_size}).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            updates = []
+            for row in rows:
+                values = transform(row)
+                if values:
+                    updates.append(dict(values, _id=row.id))
+            if not updates:
+                continue
+
+            keys = [key for key in updates[0] if key != "_id"]
+            statement = sa.text(
+                f"UPDATE {table} SET {', '.join(f'{key} = :{key}' for key in keys)} WHERE id = :_id"
+            )
+            if types:
+                statement = statement.bindparams(
+                    *[sa.bindparam(key, type_=type_) for key, type_ in types.items()]
+                )
+            conn.execute(statement, updates)
+
+def backfill_sql_in_batches(table, set_clause, where_clause="TRUE", batch_size=BATCH_SIZE * 10):
+    """SQL-бэкфилл диапазонами id: UPDATE table SET set_clause по batch_size строк.
+
+    Преобразование выполняется на стороне БД, каждая пачка — отдельная транзакция.
+    """
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text(f"SELECT COALESCE(MAX(id), 0) FROM {table}")).scalar()
+    statement = sa.text(
+        f"UPDATE {table} SET {set_clause} "
+        f"WHERE id > :low AND id <= :high AND ({where_clause})"
+    )
+    with op.get_context().autocommit_block():
+        for low in range(0, max_id, batch_size):
+            conn.execute(statement, {"low": low, "high": low + batch_size})
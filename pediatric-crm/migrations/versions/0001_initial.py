@@ -0,0 +1,117 @@
+"""Исходная схема (соответствует app/models.py на момент перехода на Alembic)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "patients",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("first_name", sa.String(100), nullable=False),
+        sa.Column("last_name", sa.String(100), nullable=False),
+        sa.Column("birth_date", sa.Date(), nullable=False),
+        sa.Column("gender", sa.String(10), nullable=False),
+        sa.Column("phone", sa.String(20), nullable=False),
+        sa.Column("parent_name", sa.String(200)),
+        sa.Column("parent_phone", sa.String(20)),
+        sa.Column("address", sa.Text()),
+        sa.Column("email", sa.String(100)),
+        sa.Column("birth_weight", sa.Integer()),
+        sa.Column("birth_height", sa.Integer()),
+        sa.Column("allergies", sa.Text()),
+        sa.Column("chronic_diseases", sa.Text()),
+        sa.Column("health_group", sa.String(10)),
+        sa.Column("vaccinations", sa.Text()),
+        sa.Column("development_notes", sa.Text()),
+        sa.Column("status", sa.String(20)),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_patients_id", "patients", ["id"])
+
+    op.create_table(
+        "appointments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id")),
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("time", sa.Time(), nullable=False),
+        sa.Column("type", sa.String(50), nullable=False),
+        sa.Column("status", sa.String(20)),
+        sa.Column("comment", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_appointments_id", "appointments", ["id"])
+
+    op.create_table(
+        "medical_records",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("appointment_id", sa.Integer(), sa.ForeignKey("appointments.id"), unique=True),
+        sa.Column("complaints", sa.Text()),
+        sa.Column("examination", sa.JSON()),
+        sa.Column("diagnosis", sa.JSON()),
+        sa.Column("prescriptions", sa.JSON()),
+        sa.Column("recommendations", sa.Text()),
+        sa.Column("next_visit_date", sa.Date()),
+        sa.Column("next_visit_time", sa.Time()),
+        sa.Column("next_visit_type", sa.String(50)),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_medical_records_id", "medical_records", ["id"])
+
+    op.create_table(
+        "payments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("medical_record_id", sa.Integer(), sa.ForeignKey("medical_records.id"), unique=True),
+        sa.Column("amount", sa.Float()),
+        sa.Column("status", sa.String(20)),
+        sa.Column("method", sa.String(20)),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_payments_id", "payments", ["id"])
+
+    op.create_table(
+        "medical_templates",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(100), nullable=False),
+        sa.Column("diagnosis", sa.JSON()),
+        sa.Column("prescriptions", sa.JSON()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_medical_templates_id", "medical_templates", ["id"])
+
+    op.create_table(
+        "parents",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("phone", sa.String(20), nullable=False, unique=True),
+        sa.Column("password", sa.String(100), nullable=False),
+        sa.Column("first_name", sa.String(100)),
+        sa.Column("last_name", sa.String(100)),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_parents_id", "parents", ["id"])
+
+    op.create_table(
+        "parent_children",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("parent_id", sa.Integer(), sa.ForeignKey("parents.id")),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id")),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_parent_children_id", "parent_children", ["id"])
+
+def downgrade():
+    op.drop_table("parent_children")
+    op.drop_table("parents")
+    op.drop_table("medical_templates")
+    op.drop_table("payments")
+    op.drop_table("medical_records")
+    op.drop_table("appointments")
+    op.drop_table("patients")
@@ -0,0 +1,64 @@
+"""Приводит medical_templates к модели после advanced_migration.py
+
+advanced_migration.py создавал medical_templates с текстовым diagnosis и
+набором *_template колонок, без prescriptions. Модель хранит diagnosis как
+JSON {"code", "name"} и prescriptions как JSON-список. Данные переносятся
+пачками, старые колонки остаются до следующего релиза.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill_in_batches
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def _columns(table):
+    return {column["name"]: column for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+def _diagnosis_from_text(value):
+    if not value:
+        return None
+    code, _, name = value.partition(" ")
+    return {"code": code, "name": name}
+
+def upgrade():
+    columns = _columns("medical_templates")
+
+    if "prescriptions" not in columns:
+        op.add_column("medical_templates", sa.Column("prescriptions", sa.JSON()))
+        if "prescriptions_template" in columns:
+            backfill_in_batches(
+                "medical_templates",
+                ["prescriptions_template"],
+                lambda row: {"prescriptions": [line.strip() for line in row.prescriptions_template.splitlines() if line.strip()]}
+                if row.prescriptions_template else None,
+                types={"prescriptions": sa.JSON()},
+            )
+
+    if "diagnosis" in columns and isinstance(columns["diagnosis"]["type"], (sa.Text, sa.String)):
+        op.add_column("medical_templates", sa.Column("diagnosis_json", sa.JSON()))
+        backfill_in_batches(
+            "medical_templates",
+            ["diagnosis"],
+            lambda row: {"diagnosis_json": _diagnosis_from_text(row.diagnosis)} if row.diagnosis else None,
+            types={"diagnosis_json": sa.JSON()},
+        )
+        op.alter_column("medical_templates", "diagnosis", new_column_name="diagnosis_legacy")
+        op.alter_column("medical_templates", "diagnosis_json", new_column_name="diagnosis")
+
+    if "created_at" not in columns:
+        op.add_column("medical_templates", sa.Column("created_at", sa.DateTime()))
+
+def downgrade():
+    columns = _columns("medical_templates")
+    if "diagnosis_legacy" in columns:
+        op.alter_column("medical_templates", "diagnosis", new_column_name="diagnosis_json")
+        op.alter_column("medical_templates", "diagnosis_legacy", new_column_name="diagnosis")
+        op.drop_column("medical_templates", "diagnosis_json")
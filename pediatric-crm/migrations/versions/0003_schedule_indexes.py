@@ -0,0 +1,26 @@
+"""Индексы под экран расписания и выборки по пациенту
+
+Создаются через CREATE INDEX CONCURRENTLY, без блокировки записи.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19
+"""
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    create_index_concurrently("ix_appointments_date_time", "appointments", ["date", "time"])
+    create_index_concurrently("ix_appointments_patient_id", "appointments", ["patient_id"])
+    create_index_concurrently("ix_parent_children_parent_id", "parent_children", ["parent_id"])
+    create_index_concurrently("ix_parent_children_patient_id", "parent_children", ["patient_id"])
+
+def downgrade():
+    drop_index_concurrently("ix_parent_children_patient_id", "parent_children")
+    drop_index_concurrently("ix_parent_children_parent_id", "parent_children")
+    drop_index_concurrently("ix_appointments_patient_id", "appointments")
+    drop_index_concurrently("ix_appointments_date_time", "appointments")
@@ -0,0 +1,100 @@
+"""JSONB для examination/diagnosis/prescriptions и индексы клинического поиска
+
+Перевод JSON -> JSONB без долгой блокировки таблицы: новые колонки
+заполняются пачками, на время переноса их синхронизирует триггер,
+затем колонки меняются местами в одной короткой транзакции.
+
+Индексы:
+- (diagnosis->>'main', created_at) — поиск по коду основного диагноза и периоду;
+- GIN jsonb_path_ops по diagnosis — сопутствующие диагнозы (@>);
+- GIN jsonb_path_ops по prescriptions — точное совпадение препарата (@>);
+- GIN trigram по lower(prescriptions::text) — поиск препарата по подстроке.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from migrations.helpers import (
+    is_postgres, backfill_sql_in_batches, create_index_concurrently, drop_index_concurrently
+)
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+COLUMNS = ("examination", "diagnosis", "prescriptions")
+
+def upgrade():
+    if not is_postgres():
+        return
+
+    for column in COLUMNS:
+        op.add_column("medical_records", sa.Column(f"{column}_jsonb", postgresql.JSONB()))
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION medical_records_jsonb_sync() RETURNS trigger AS $$
+        BEGIN
+            NEW.examination_jsonb := NEW.examination::jsonb;
+            NEW.diagnosis_jsonb := NEW.diagnosis::jsonb;
+            NEW.prescriptions_jsonb := NEW.prescriptions::jsonb;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER medical_records_jsonb_sync
+        BEFORE INSERT OR UPDATE ON medical_records
+        FOR EACH ROW EXECUTE FUNCTION medical_records_jsonb_sync()
+    """)
+
+    backfill_sql_in_batches(
+        "medical_records",
+        ", ".join(f"{column}_jsonb = {column}::jsonb" for column in COLUMNS),
+    )
+
+    # Короткая транзакция: снимаем триггер и меняем колонки местами
+    op.execute("DROP TRIGGER medical_records_jsonb_sync ON medical_records")
+    op.execute("DROP FUNCTION medical_records_jsonb_sync()")
+    for column in COLUMNS:
+        op.drop_column("medical_records", column)
+        op.alter_column("medical_records", f"{column}_jsonb", new_column_name=column)
+
+    with op.get_context().autocommit_block():
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    create_index_concurrently(
+        "ix_medical_records_diagnosis_main", "medical_records",
+        [sa.text("(diagnosis ->> 'main') text_pattern_ops"), sa.text("created_at")],
+    )
+    create_index_concurrently(
+        "ix_medical_records_diagnosis_gin", "medical_records", ["diagnosis"],
+        postgresql_using="gin", postgresql_ops={"diagnosis": "jsonb_path_ops"},
+    )
+    create_index_concurrently(
+        "ix_medical_records_prescriptions_gin", "medical_records", ["prescriptions"],
+        postgresql_using="gin", postgresql_ops={"prescriptions": "jsonb_path_ops"},
+    )
+    create_index_concurrently(
+        "ix_medical_records_prescriptions_trgm", "medical_records",
+        [sa.text("lower(prescriptions::text) gin_trgm_ops")],
+        postgresql_using="gin",
+    )
+
+def downgrade():
+    if not is_postgres():
+        return
+
+    drop_index_concurrently("ix_medical_records_prescriptions_trgm", "medical_records")
+    drop_index_concurrently("ix_medical_records_prescriptions_gin", "medical_records")
+    drop_index_concurrently("ix_medical_records_diagnosis_gin", "medical_records")
+    drop_index_concurrently("ix_medical_records_diagnosis_main", "medical_records")
+    for column in COLUMNS:
+        op.alter_column(
+            "medical_records", column,
+            type_=sa.JSON(), postgresql_using=f"{column}::json",
+        )
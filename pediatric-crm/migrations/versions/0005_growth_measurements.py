@@ -0,0 +1,108 @@
+"""Таблица growth_measurements и перенос веса/роста/температуры из examination
+
+Также удаляет колонки temperature/weight/height/... в medical_records,
+которые добавлял advanced_migration.py и которые никто не читает.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import BATCH_SIZE
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+LEGACY_COLUMNS = ("temperature", "weight", "height", "condition", "skin", "breathing", "heart", "abdomen")
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    try:
+        number = float(str(value).replace(",", ".").strip())
+    except ValueError:
+        return None
+    return number if number > 0 else None
+
+def upgrade():
+    op.create_table(
+        "growth_measurements",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), nullable=False),
+        sa.Column("medical_record_id", sa.Integer(), sa.ForeignKey("medical_records.id"), unique=True),
+        sa.Column("measured_on", sa.Date(), nullable=False),
+        sa.Column("age_days", sa.Integer(), nullable=False),
+        sa.Column("weight_kg", sa.Float()),
+        sa.Column("height_cm", sa.Float()),
+        sa.Column("temperature_c", sa.Float()),
+        sa.Column("weight_z", sa.Float()),
+        sa.Column("height_z", sa.Float()),
+        sa.Column("is_outlier", sa.Boolean(), server_default=sa.false()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_growth_measurements_id", "growth_measurements", ["id"])
+    op.create_index("ix_growth_measurements_is_outlier", "growth_measurements", ["is_outlier"])
+    op.create_index(
+        "ix_growth_measurements_patient_measured_on", "growth_measurements", ["patient_id", "measured_on"]
+    )
+
+    conn = op.get_bind()
+    select = sa.text("""
+        SELECT mr.id, mr.examination, a.date AS visit_date, a.patient_id, p.birth_date
+        FROM medical_records mr
+        JOIN appointments a ON a.id = mr.appointment_id
+        JOIN patients p ON p.id = a.patient_id
+        WHERE mr.id > :last_id
+        ORDER BY mr.id
+        LIMIT :limit
+    """)
+    insert = sa.text("""
+        INSERT INTO growth_measurements
+            (patient_id, medical_record_id, measured_on, age_days, weight_kg, height_cm, temperature_c, is_outlier)
+        VALUES
+            (:patient_id, :medical_record_id, :measured_on, :age_days, :weight_kg, :height_cm, :temperature_c, false)
+    """)
+    last_id = 0
+    with op.get_context().autocommit_block():
+        while True:
+            rows = conn.execute(select, {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            values = []
+            for row in rows:
+                examination = row.examination
+                if isinstance(examination, str):
+                    examination = json.loads(examination)
+                examination = examination or {}
+                weight = _number(examination.get("weight"))
+                height = _number(examination.get("height"))
+                temperature = _number(examination.get("temperature"))
+                if weight is None and height is None and temperature is None:
+                    continue
+                values.append({
+                    "patient_id": row.patient_id,
+                    "medical_record_id": row.id,
+                    "measured_on": row.visit_date,
+                    "age_days": (row.visit_date - row.birth_date).days,
+                    "weight_kg": weight,
+                    "height_cm": height,
+                    "temperature_c": temperature,
+                })
+            if values:
+                conn.execute(insert, values)
+
+    existing = {column["name"] for column in sa.inspect(conn).get_columns("medical_records")}
+    for column in LEGACY_COLUMNS:
+        if column in existing:
+            op.drop_column("medical_records", column)
+
+def downgrade():
+    op.drop_table("growth_measurements")
@@ -0,0 +1,49 @@
+"""Структурированные прививки и рассчитанные сроки (vaccinations, vaccinations_due)
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "vaccinations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), nullable=False),
+        sa.Column("vaccine", sa.String(20), nullable=False),
+        sa.Column("dose_number", sa.Integer(), nullable=False),
+        sa.Column("administered_on", sa.Date(), nullable=False),
+        sa.Column("medical_record_id", sa.Integer(), sa.ForeignKey("medical_records.id")),
+        sa.Column("drug_name", sa.String(100)),
+        sa.Column("notes", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_vaccinations_id", "vaccinations", ["id"])
+    op.create_index("ix_vaccinations_patient_vaccine", "vaccinations", ["patient_id", "vaccine"])
+
+    op.create_table(
+        "vaccinations_due",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), nullable=False),
+        sa.Column("vaccine", sa.String(20), nullable=False),
+        sa.Column("dose_number", sa.Integer(), nullable=False),
+        sa.Column("due_on", sa.Date(), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("computed_at", sa.DateTime()),
+    )
+    op.create_index("ix_vaccinations_due_id", "vaccinations_due", ["id"])
+    op.create_index("ix_vaccinations_due_status_due_on", "vaccinations_due", ["status", "due_on"])
+    op.create_index(
+        "uq_vaccinations_due_patient_vaccine", "vaccinations_due", ["patient_id", "vaccine"], unique=True
+    )
+
+def downgrade():
+    op.drop_table("vaccinations_due")
+    op.drop_table("vaccinations")
@@ -0,0 +1,102 @@
+"""Денежный учет: ledger_transactions, ledger_entries, patient_balances
+
+payments.amount переводится в NUMERIC(12, 2). Существующие оплаты переносятся
+в журнал: начисление на сумму визита и, для оплаченных, платеж; балансы
+пациентов строятся агрегацией проводок по счету receivable.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # На SQLite batch-режим пересоздает таблицу, на PostgreSQL — обычный ALTER
+    with op.batch_alter_table("payments") as batch:
+        batch.alter_column(
+            "amount",
+            type_=sa.Numeric(12, 2),
+            postgresql_using="round(amount::numeric, 2)",
+        )
+
+    op.create_table(
+        "ledger_transactions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), nullable=False),
+        sa.Column("medical_record_id", sa.Integer(), sa.ForeignKey("medical_records.id")),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("amount", sa.Numeric(12, 2), nullable=False),
+        sa.Column("method", sa.String(20)),
+        sa.Column("comment", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_ledger_transactions_id", "ledger_transactions", ["id"])
+    op.create_index("ix_ledger_transactions_patient_id", "ledger_transactions", ["patient_id"])
+    op.create_index("ix_ledger_transactions_medical_record_id", "ledger_transactions", ["medical_record_id"])
+
+    op.create_table(
+        "ledger_entries",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("transaction_id", sa.Integer(), sa.ForeignKey("ledger_transactions.id"), nullable=False),
+        sa.Column("account", sa.String(30), nullable=False),
+        sa.Column("amount", sa.Numeric(12, 2), nullable=False),
+    )
+    op.create_index("ix_ledger_entries_id", "ledger_entries", ["id"])
+    op.create_index("ix_ledger_entries_transaction_id", "ledger_entries", ["transaction_id"])
+
+    op.create_table(
+        "patient_balances",
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), primary_key=True),
+        sa.Column("balance", sa.Numeric(12, 2), nullable=False, server_default="0"),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    op.create_index("ix_patient_balances_balance", "patient_balances", ["balance"])
+
+    # Перенос существующих оплат
+    op.execute("""
+        INSERT INTO ledger_transactions (patient_id, medical_record_id, kind, amount, method, comment, created_at)
+        SELECT a.patient_id, p.medical_record_id, 'charge', p.amount, NULL, 'Перенос из payments', p.created_at
+        FROM payments p
+        JOIN medical_records mr ON mr.id = p.medical_record_id
+        JOIN appointments a ON a.id = mr.appointment_id
+        WHERE p.amount > 0 AND a.patient_id IS NOT NULL
+    """)
+    op.execute("""
+        INSERT INTO ledger_transactions (patient_id, medical_record_id, kind, amount, method, comment, created_at)
+        SELECT a.patient_id, p.medical_record_id, 'payment', p.amount, COALESCE(p.method, 'cash'), 'Перенос из payments', p.created_at
+        FROM payments p
+        JOIN medical_records mr ON mr.id = p.medical_record_id
+        JOIN appointments a ON a.id = mr.appointment_id
+        WHERE p.amount > 0 AND p.status = 'paid' AND a.patient_id IS NOT NULL
+    """)
+    op.execute("""
+        INSERT INTO ledger_entries (transaction_id, account, amount)
+        SELECT id, CASE WHEN kind = 'charge' THEN 'receivable' ELSE method END, amount
+        FROM ledger_transactions
+    """)
+    op.execute("""
+        INSERT INTO ledger_entries (transaction_id, account, amount)
+        SELECT id, CASE WHEN kind = 'charge' THEN 'revenue' ELSE 'receivable' END, -amount
+        FROM ledger_transactions
+    """)
+    op.execute("""
+        INSERT INTO patient_balances (patient_id, balance, updated_at)
+        SELECT t.patient_id, SUM(e.amount), CURRENT_TIMESTAMP
+        FROM ledger_entries e
+        JOIN ledger_transactions t ON t.id = e.transaction_id
+        WHERE e.account = 'receivable'
+        GROUP BY t.patient_id
+    """)
+
+def downgrade():
+    op.drop_table("patient_balances")
+    op.drop_table("ledger_entries")
+    op.drop_table("ledger_transactions")
+    with op.batch_alter_table("payments") as batch:
+        batch.alter_column("amount", type_=sa.Float(), postgresql_using="amount::double precision")
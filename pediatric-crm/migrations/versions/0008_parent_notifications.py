@@ -0,0 +1,31 @@
+"""Telegram chat id родителя и очередь исходящих уведомлений
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("parents", sa.Column("telegram_chat_id", sa.String(32)))
+
+    op.create_table(
+        "parent_notifications",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("parent_id", sa.Integer(), sa.ForeignKey("parents.id"), nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("sent_at", sa.DateTime()),
+    )
+    op.create_index("ix_parent_notifications_id", "parent_notifications", ["id"])
+    op.create_index("ix_parent_notifications_unsent", "parent_notifications", ["sent_at", "id"])
+
+def downgrade():
+    op.drop_table("parent_notifications")
+    op.drop_column("parents", "telegram_chat_id")
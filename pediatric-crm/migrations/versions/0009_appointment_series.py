@@ -0,0 +1,45 @@
+"""Серии повторяющихся записей
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "appointment_series",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), nullable=False),
+        sa.Column("type", sa.String(50), nullable=False),
+        sa.Column("start_date", sa.Date(), nullable=False),
+        sa.Column("time", sa.Time(), nullable=False),
+        sa.Column("interval_weeks", sa.Integer(), nullable=False, server_default="1"),
+        sa.Column("count", sa.Integer(), nullable=False),
+        sa.Column("comment", sa.Text()),
+        sa.Column("status", sa.String(20)),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_appointment_series_id", "appointment_series", ["id"])
+    op.create_index("ix_appointment_series_patient_id", "appointment_series", ["patient_id"])
+
+    # Именованный внешний ключ: на SQLite batch-режим пересоздает таблицу с ограничением
+    with op.batch_alter_table("appointments") as batch:
+        batch.add_column(sa.Column("series_id", sa.Integer()))
+        batch.create_foreign_key("fk_appointments_series_id", "appointment_series", ["series_id"], ["id"])
+    create_index_concurrently("ix_appointments_series_id", "appointments", ["series_id"])
+
+def downgrade():
+    drop_index_concurrently("ix_appointments_series_id", "appointments")
+    with op.batch_alter_table("appointments") as batch:
+        batch.drop_constraint("fk_appointments_series_id", type_="foreignkey")
+        batch.drop_column("series_id")
+    op.drop_table("appointment_series")
@@ -0,0 +1,29 @@
+"""Ключи идемпотентности POST-запросов
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "idempotency_keys",
+        sa.Column("key", sa.String(128), primary_key=True),
+        sa.Column("fingerprint", sa.String(64), nullable=False),
+        sa.Column("status_code", sa.Integer()),
+        sa.Column("content_type", sa.String(100)),
+        sa.Column("response_body", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+    )
+    op.create_index("ix_idempotency_keys_expires_at", "idempotency_keys", ["expires_at"])
+
+def downgrade():
+    op.drop_table("idempotency_keys")
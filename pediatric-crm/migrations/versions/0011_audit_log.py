@@ -0,0 +1,45 @@
+"""Журнал изменений audit_log (на Postgres — секции по месяцам)
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from migrations.helpers import is_postgres
+
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    postgres = is_postgres()
+    if postgres:
+        # Ключ секционированной таблицы обязан включать колонку секционирования
+        primary_key = [sa.PrimaryKeyConstraint("id", "ts")]
+    else:
+        # SQLite умеет автоинкремент только у одиночного первичного ключа
+        primary_key = [sa.PrimaryKeyConstraint("id")]
+    op.create_table(
+        "audit_log",
+        sa.Column("id", sa.BigInteger().with_variant(sa.Integer(), "sqlite"), autoincrement=True),
+        sa.Column("ts", sa.DateTime(), nullable=False),
+        sa.Column("entity", sa.String(50), nullable=False),
+        sa.Column("entity_id", sa.Integer()),
+        sa.Column("action", sa.String(10), nullable=False),
+        sa.Column("actor", sa.String(100)),
+        sa.Column("changes", postgresql.JSONB() if postgres else sa.JSON()),
+        *primary_key,
+        postgresql_partition_by="RANGE (ts)",
+    )
+    # На секционированной таблице индекс создается на всех секциях, в т.ч. будущих
+    op.create_index("ix_audit_log_entity_entity_id_ts", "audit_log", ["entity", "entity_id", "ts"])
+    if postgres:
+        # Месячные секции создает app.audit.ensure_partitions; DEFAULT страхует от пропуска
+        op.execute("CREATE TABLE audit_log_default PARTITION OF audit_log DEFAULT")
+
+def downgrade():
+    op.drop_table("audit_log")
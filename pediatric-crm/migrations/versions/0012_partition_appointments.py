@@ -0,0 +1,224 @@
+"""Секционирование appointments: горячие месяцы и холодный архив
+
+На Postgres appointments пересоздается как LIST (archived):
+appointments_hot (RANGE по date, секция на месяц + DEFAULT) и appointments_cold.
+Визиты старше границы архива сразу попадают в холодную секцию.
+
+Копирование онлайн, без окна обслуживания:
+1. создается appointments_new, на старую таблицу вешается триггер, который
+   повторяет в новой каждую вставку, изменение и удаление;
+2. строки старой таблицы «трогаются» пачками (UPDATE SET id = id через
+   backfill_sql_in_batches) — триггер переносит их в новую таблицу под
+   блокировкой строки, поэтому параллельные изменения не теряются;
+3. в короткой транзакции таблицы меняются местами.
+
+Ключ секционированной таблицы — (id, archived, date), ссылку по одному id
+Postgres не допускает. Поэтому medical_records получает копию ключа визита
+(appointment_archived, appointment_date) и составной внешний ключ
+ON UPDATE CASCADE: при переносе визита в архив или переносе даты копия
+обновляется сама. Перенос строки между секциями с каскадом по внешнему
+ключу работает начиная с Postgres 15.
+
+Условие архива и создание секций заморожены здесь, а не импортируются из
+app: миграция должна делать то же самое и после изменений приложения.
+Откат копирует данные одним INSERT ... SELECT.
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-19
+"""
+import os
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import is_postgres, backfill_sql_in_batches
+
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+COLUMNS = "id, patient_id, series_id, date, time, type, status, comment, created_at"
+ARCHIVE_AFTER_YEARS = int(os.getenv("ARCHIVE_AFTER_YEARS", "3"))
+PARTITIONS_AHEAD = 12
+
+def month_start(day, offset=0):
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def create_hot_partitions(first, last):
+    """Месячные секции appointments_hot с first по last; таблица новая и пустая"""
+    start = month_start(first)
+    while start <= last:
+        end = month_start(start, 1)
+        op.execute(
+            f"CREATE TABLE appointments_hot_{start.strftime('y%Ym%m')} PARTITION OF appointments_hot "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        start = end
+
+def archived_expression(row, cutoff):
+    """Визит в архиве: старше границы или прошедший у пациента со статусом archived"""
+    return (
+        f"COALESCE({row}.date < DATE '{cutoff.isoformat()}' OR ("
+        f"(SELECT status FROM patients WHERE id = {row}.patient_id) = 'archived' "
+        f"AND {row}.date < CURRENT_DATE), FALSE)"
+    )
+
+def upgrade():
+    op.add_column("medical_records", sa.Column("appointment_archived", sa.Boolean()))
+    op.add_column("medical_records", sa.Column("appointment_date", sa.Date()))
+
+    if not is_postgres():
+        op.add_column(
+            "appointments",
+            sa.Column("archived", sa.Boolean(), nullable=False, server_default=sa.false())
+        )
+        backfill_sql_in_batches(
+            "medical_records",
+            "appointment_archived = (SELECT archived FROM appointments a WHERE a.id = medical_records.appointment_id), "
+            "appointment_date = (SELECT date FROM appointments a WHERE a.id = medical_records.appointment_id)",
+            "appointment_id IS NOT NULL"
+        )
+        return
+
+    # ========== НОВАЯ ТАБЛИЦА И ТРИГГЕРЫ ==========
+    op.execute("""
+        CREATE TABLE appointments_new (
+            id INTEGER NOT NULL DEFAULT nextval('appointments_id_seq'),
+            patient_id INTEGER REFERENCES patients (id),
+            series_id INTEGER REFERENCES appointment_series (id),
+            date DATE NOT NULL,
+            time TIME NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            status VARCHAR(20),
+            comment TEXT,
+            created_at TIMESTAMP,
+            archived BOOLEAN NOT NULL DEFAULT FALSE,
+            PRIMARY KEY (id, archived, date)
+        ) PARTITION BY LIST (archived)
+    """)
+    op.execute(
+        "CREATE TABLE appointments_hot PARTITION OF appointments_new "
+        "FOR VALUES IN (FALSE) PARTITION BY RANGE (date)"
+    )
+    op.execute("CREATE TABLE appointments_hot_default PARTITION OF appointments_hot DEFAULT")
+    op.execute("CREATE TABLE appointments_cold PARTITION OF appointments_new FOR VALUES IN (TRUE)")
+
+    cutoff = month_start(date.today(), -12 * ARCHIVE_AFTER_YEARS)
+    create_hot_partitions(cutoff, month_start(date.today(), PARTITIONS_AHEAD))
+
+    # Каждое изменение старой таблицы повторяется в новой и в копии ключа у medical_records
+    op.execute(f"""
+        CREATE FUNCTION appointments_mirror() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM appointments_new WHERE id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO appointments_new ({COLUMNS}, archived)
+                VALUES (NEW.id, NEW.patient_id, NEW.series_id, NEW.date, NEW.time, NEW.type,
+                        NEW.status, NEW.comment, NEW.created_at, {archived_expression('NEW', cutoff)});
+                UPDATE medical_records m SET appointment_archived = n.archived, appointment_date = n.date
+                FROM appointments_new n WHERE n.id = NEW.id AND m.appointment_id = NEW.id;
+            END IF;
+            RETURN NULL;
+        END $$
+    """)
+    op.execute(
+        "CREATE TRIGGER appointments_mirror AFTER INSERT OR UPDATE OR DELETE ON appointments "
+        "FOR EACH ROW EXECUTE FUNCTION appointments_mirror()"
+    )
+    # Новые медицинские записи сразу получают ключ визита из новой таблицы
+    op.execute("""
+        CREATE FUNCTION medical_records_appointment_key() RETURNS trigger LANGUAGE plpgsql AS $$
+        BEGIN
+            SELECT archived, date INTO NEW.appointment_archived, NEW.appointment_date
+            FROM appointments_new WHERE id = NEW.appointment_id;
+            RETURN NEW;
+        END $$
+    """)
+    op.execute(
+        "CREATE TRIGGER medical_records_appointment_key BEFORE INSERT OR UPDATE OF appointment_id "
+        "ON medical_records FOR EACH ROW EXECUTE FUNCTION medical_records_appointment_key()"
+    )
+
+    # ========== КОПИРОВАНИЕ ПАЧКАМИ ==========
+    # Каждая пачка — отдельная транзакция; строки переносит триггер
+    backfill_sql_in_batches("appointments", "id = id")
+
+    # ========== ЗАМЕНА ТАБЛИЦЫ ==========
+    # Порядок как у приложения: сначала medical_records, затем appointments
+    op.execute("LOCK TABLE medical_records, appointments IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TRIGGER medical_records_appointment_key ON medical_records")
+    op.execute("DROP FUNCTION medical_records_appointment_key()")
+    op.execute("DROP TRIGGER appointments_mirror ON appointments")
+    op.execute("DROP FUNCTION appointments_mirror()")
+    # Записи, вставленные одновременно с переносом своего визита
+    op.execute("""
+        UPDATE medical_records m SET appointment_archived = n.archived, appointment_date = n.date
+        FROM appointments_new n
+        WHERE n.id = m.appointment_id AND m.appointment_date IS NULL
+    """)
+
+    op.drop_constraint("medical_records_appointment_id_fkey", "medical_records", type_="foreignkey")
+    op.execute("ALTER SEQUENCE appointments_id_seq OWNED BY NONE")
+    op.execute("DROP TABLE appointments")
+    op.execute("ALTER TABLE appointments_new RENAME TO appointments")
+    op.execute("ALTER SEQUENCE appointments_id_seq OWNED BY appointments.id")
+
+    # MATCH FULL: ключ визита заполняется целиком или не заполняется вовсе
+    op.execute("""
+        ALTER TABLE medical_records ADD CONSTRAINT fk_medical_records_appointment
+        FOREIGN KEY (appointment_id, appointment_archived, appointment_date)
+        REFERENCES appointments (id, archived, date) MATCH FULL ON UPDATE CASCADE NOT VALID
+    """)
+
+    # На секционированной таблице CONCURRENTLY недоступен; индексы создаются на всех секциях
+    op.create_index("ix_appointments_date_time", "appointments", ["date", "time"])
+    op.create_index("ix_appointments_patient_id", "appointments", ["patient_id"])
+    op.create_index("ix_appointments_series_id", "appointments", ["series_id"])
+
+    # Проверка существующих строк без блокировки записи
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE medical_records VALIDATE CONSTRAINT fk_medical_records_appointment")
+
+def downgrade():
+    if not is_postgres():
+        op.drop_column("appointments", "archived")
+        op.drop_column("medical_records", "appointment_date")
+        op.drop_column("medical_records", "appointment_archived")
+        return
+
+    op.drop_constraint("fk_medical_records_appointment", "medical_records", type_="foreignkey")
+    op.execute("ALTER SEQUENCE appointments_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE appointments_plain (
+            id INTEGER PRIMARY KEY DEFAULT nextval('appointments_id_seq'),
+            patient_id INTEGER REFERENCES patients (id),
+            series_id INTEGER REFERENCES appointment_series (id),
+            date DATE NOT NULL,
+            time TIME NOT NULL,
+            type VARCHAR(50) NOT NULL,
+            status VARCHAR(20),
+            comment TEXT,
+            created_at TIMESTAMP
+        )
+    """)
+    op.execute(f"INSERT INTO appointments_plain ({COLUMNS}) SELECT {COLUMNS} FROM appointments")
+    op.execute("DROP TABLE appointments")
+    op.execute("ALTER TABLE appointments_plain RENAME TO appointments")
+    op.execute("ALTER SEQUENCE appointments_id_seq OWNED BY appointments.id")
+
+    op.create_index("ix_appointments_id", "appointments", ["id"])
+    op.create_index("ix_appointments_date_time", "appointments", ["date", "time"])
+    op.create_index("ix_appointments_patient_id", "appointments", ["patient_id"])
+    op.create_index("ix_appointments_series_id", "appointments", ["series_id"])
+    op.create_foreign_key(
+        "medical_records_appointment_id_fkey", "medical_records", "appointments",
+        ["appointment_id"], ["id"]
+    )
+    op.drop_column("medical_records", "appointment_date")
+    op.drop_column("medical_records", "appointment_archived")
@@ -0,0 +1,27 @@
+"""Индекс выбора пациента по началу фамилии и имени
+
+(lower(last_name), lower(first_name), id) с text_pattern_ops на Postgres:
+обслуживает и LIKE 'префикс%', и сортировку страницы (COLLATE "C").
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-19
+"""
+import sqlalchemy as sa
+
+from migrations.helpers import is_postgres, create_index_concurrently, drop_index_concurrently
+
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    ops = " text_pattern_ops" if is_postgres() else ""
+    create_index_concurrently(
+        "ix_patients_name_prefix", "patients",
+        [sa.text(f"lower(last_name){ops}"), sa.text(f"lower(first_name){ops}"), "id"]
+    )
+
+def downgrade():
+    drop_index_concurrently("ix_patients_name_prefix", "patients")
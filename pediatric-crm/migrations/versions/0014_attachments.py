@@ -0,0 +1,34 @@
+"""Вложения к пациентам и медицинским записям
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0014"
+down_revision = "0013"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "attachments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id"), nullable=False),
+        sa.Column("medical_record_id", sa.Integer(), sa.ForeignKey("medical_records.id")),
+        sa.Column("sha256", sa.String(64), nullable=False),
+        sa.Column("size", sa.BigInteger(), nullable=False),
+        sa.Column("content_type", sa.String(100)),
+        sa.Column("filename", sa.String(255)),
+        sa.Column("preview_status", sa.String(20)),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_index("ix_attachments_id", "attachments", ["id"])
+    op.create_index("ix_attachments_patient_id", "attachments", ["patient_id"])
+    op.create_index("ix_attachments_medical_record_id", "attachments", ["medical_record_id"])
+    op.create_index("ix_attachments_sha256", "attachments", ["sha256"])
+
+def downgrade():
+    op.drop_table("attachments")
@@ -0,0 +1,26 @@
+"""Ссылка на медицинскую запись в уведомлениях родителям (PDF итогов визита)
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0015"
+down_revision = "0014"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Именованный внешний ключ в batch-режиме: на SQLite таблица пересоздается
+    with op.batch_alter_table("parent_notifications") as batch:
+        batch.add_column(sa.Column("medical_record_id", sa.Integer()))
+        batch.create_foreign_key(
+            "fk_parent_notifications_medical_record_id", "medical_records", ["medical_record_id"], ["id"]
+        )
+
+def downgrade():
+    with op.batch_alter_table("parent_notifications") as batch:
+        batch.drop_constraint("fk_parent_notifications_medical_record_id", type_="foreignkey")
+        batch.drop_column("medical_record_id")
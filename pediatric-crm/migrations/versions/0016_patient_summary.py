@@ -0,0 +1,80 @@
+"""Сводка по пациенту patient_summary и ее первичное заполнение
+
+Индексы — под сортировки и фильтры списка пациентов. Последний визит
+сортируется по убыванию с пациентами без визитов в конце: на Postgres
+индекс создается сразу в этом порядке (DESC NULLS LAST), в SQLite
+NULL и так меньше любой даты.
+
+Первичное заполнение — замороженный здесь SQL с теми же правилами, что
+app.patient_summary на момент миграции (визит состоялся — completed,
+предстоит — new/confirmed), пачками по id пациента.
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import is_postgres, BATCH_SIZE
+
+revision = "0016"
+down_revision = "0015"
+branch_labels = None
+depends_on = None
+
+def fill_summary():
+    conn = op.get_bind()
+    if is_postgres():
+        code, text = "m.diagnosis ->> 'main'", "m.diagnosis ->> 'mainText'"
+    else:
+        code, text = "json_extract(m.diagnosis, '$.main')", "json_extract(m.diagnosis, '$.mainText')"
+    upcoming = (
+        "FROM appointments a WHERE a.patient_id = p.id AND a.date >= CURRENT_DATE "
+        "AND a.status IN ('new', 'confirmed') ORDER BY a.date, a.time LIMIT 1"
+    )
+    statement = sa.text(f"""
+        INSERT INTO patient_summary (
+            patient_id, last_visit_date, next_visit_date, next_visit_time,
+            visits_count, balance, last_diagnosis, updated_at
+        )
+        SELECT
+            p.id,
+            (SELECT MAX(a.date) FROM appointments a WHERE a.patient_id = p.id AND a.status = 'completed'),
+            (SELECT a.date {upcoming}),
+            (SELECT a.time {upcoming}),
+            (SELECT COUNT(*) FROM appointments a WHERE a.patient_id = p.id AND a.status = 'completed'),
+            COALESCE((SELECT b.balance FROM patient_balances b WHERE b.patient_id = p.id), 0),
+            (SELECT NULLIF(SUBSTR(TRIM(COALESCE({code}, '') || ' ' || COALESCE({text}, '')), 1, 255), '')
+             FROM medical_records m JOIN appointments a ON a.id = m.appointment_id
+             WHERE a.patient_id = p.id ORDER BY a.date DESC, a.time DESC, m.id DESC LIMIT 1),
+            CURRENT_TIMESTAMP
+        FROM patients p
+        WHERE p.id > :low AND p.id <= :high
+    """)
+    max_id = conn.execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM patients")).scalar()
+    for low in range(0, max_id, BATCH_SIZE):
+        conn.execute(statement, {"low": low, "high": low + BATCH_SIZE})
+
+def upgrade():
+    op.create_table(
+        "patient_summary",
+        sa.Column("patient_id", sa.Integer(), sa.ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("last_visit_date", sa.Date()),
+        sa.Column("next_visit_date", sa.Date()),
+        sa.Column("next_visit_time", sa.Time()),
+        sa.Column("visits_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("balance", sa.Numeric(12, 2), nullable=False, server_default="0"),
+        sa.Column("last_diagnosis", sa.String(255)),
+        sa.Column("updated_at", sa.DateTime()),
+    )
+    last_visit = sa.text("last_visit_date DESC NULLS LAST") if is_postgres() else "last_visit_date"
+    op.create_index("ix_patient_summary_last_visit_date", "patient_summary", [last_visit])
+    op.create_index("ix_patient_summary_next_visit_date", "patient_summary", ["next_visit_date"])
+    op.create_index("ix_patient_summary_visits_count", "patient_summary", ["visits_count"])
+    op.create_index("ix_patient_summary_balance", "patient_summary", ["balance"])
+
+    fill_summary()
+
+def downgrade():
+    op.drop_table("patient_summary")
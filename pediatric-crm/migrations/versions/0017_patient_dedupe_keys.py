@@ -0,0 +1,77 @@
+"""Ключи блоков для поиска дублей пациентов
+
+phone_key и parent_phone_key — телефоны только цифрами, name_key —
+фонетический ключ ФИО (см. app.dedupe). Заполняются пачками, индексы
+по ним и по дате рождения строятся без блокировки таблицы.
+
+Revision ID: 0017
+Revises: 0016
+Create Date: 2026-10-19
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill_in_batches, create_index_concurrently, drop_index_concurrently
+
+revision = "0017"
+down_revision = "0016"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_patients_phone_key", "phone_key"),
+    ("ix_patients_parent_phone_key", "parent_phone_key"),
+    ("ix_patients_name_key", "name_key"),
+    ("ix_patients_birth_date", "birth_date"),
+)
+
+_PHONETIC = str.maketrans({
+    "о": "а", "ы": "а", "я": "а",
+    "е": "и", "э": "и", "й": "и",
+    "ю": "у",
+    "б": "п", "в": "ф", "г": "к", "д": "т", "ж": "ш", "з": "с",
+    "ь": None, "ъ": None,
+})
+
+def normalize_phone(phone):
+    digits = re.sub(r"\D", "", phone or "")
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10:
+        digits = "7" + digits
+    return digits if len(digits) >= 6 else None
+
+def phonetic(name):
+    key = re.sub(r"[^a-zа-я]", "", (name or "").lower().replace("ё", "е")).translate(_PHONETIC)
+    return re.sub(r"(.)\1+", r"\1", key)
+
+def name_key(last_name, first_name):
+    key = f"{phonetic(last_name)} {phonetic(first_name)}".strip()
+    return key[:64] or None
+
+def upgrade():
+    op.add_column("patients", sa.Column("phone_key", sa.String(20)))
+    op.add_column("patients", sa.Column("parent_phone_key", sa.String(20)))
+    op.add_column("patients", sa.Column("name_key", sa.String(64)))
+
+    backfill_in_batches(
+        "patients",
+        ["phone", "parent_phone", "last_name", "first_name"],
+        lambda row: {
+            "phone_key": normalize_phone(row.phone),
+            "parent_phone_key": normalize_phone(row.parent_phone),
+            "name_key": name_key(row.last_name, row.first_name),
+        },
+    )
+
+    for name, column in INDEXES:
+        create_index_concurrently(name, "patients", [column])
+
+def downgrade():
+    for name, _ in INDEXES:
+        drop_index_concurrently(name, "patients")
+    op.drop_column("patients", "name_key")
+    op.drop_column("patients", "parent_phone_key")
+    op.drop_column("patients", "phone_key")
@@ -0,0 +1,51 @@
+"""Ключи выбора пациента last_name_key и first_name_key
+
+lower() в SQLite приводит к нижнему регистру только ASCII, поэтому поиск
+по кириллице в выборе пациента не работал. Ключи — фамилия и имя в нижнем
+регистре с е вместо ё — считаются в Python одинаково для обеих СУБД
+(app.patient_picker) и заменяют индекс по выражениям из 0013. Нормализация
+заморожена здесь на момент миграции.
+
+Revision ID: 0018
+Revises: 0017
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import is_postgres, backfill_in_batches, create_index_concurrently, drop_index_concurrently
+
+revision = "0018"
+down_revision = "0017"
+branch_labels = None
+depends_on = None
+
+def search_key(value):
+    return (value or "").strip().lower().replace("ё", "е")
+
+def upgrade():
+    op.add_column("patients", sa.Column("last_name_key", sa.String(100)))
+    op.add_column("patients", sa.Column("first_name_key", sa.String(100)))
+
+    backfill_in_batches(
+        "patients",
+        ["last_name", "first_name"],
+        lambda row: {"last_name_key": search_key(row.last_name), "first_name_key": search_key(row.first_name)},
+    )
+
+    ops = " text_pattern_ops" if is_postgres() else ""
+    create_index_concurrently(
+        "ix_patients_picker_key", "patients",
+        [sa.text(f"last_name_key{ops}"), sa.text(f"first_name_key{ops}"), "id"]
+    )
+    drop_index_concurrently("ix_patients_name_prefix", "patients")
+
+def downgrade():
+    ops = " text_pattern_ops" if is_postgres() else ""
+    create_index_concurrently(
+        "ix_patients_name_prefix", "patients",
+        [sa.text(f"lower(last_name){ops}"), sa.text(f"lower(first_name){ops}"), "id"]
+    )
+    drop_index_concurrently("ix_patients_picker_key", "patients")
+    op.drop_column("patients", "first_name_key")
+    op.drop_column("patients", "last_name_key")
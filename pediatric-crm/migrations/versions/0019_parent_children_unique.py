@@ -0,0 +1,30 @@
+"""Уникальная связь родитель-ребенок
+
+Бот привязывает детей к родителю при авторизации (app.bot_repository);
+уникальный индекс по (parent_id, patient_id) не дает двум одновременным
+авторизациям создать одну связь дважды. Существующие дубли удаляются.
+
+Revision ID: 0019
+Revises: 0018
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+from migrations.helpers import create_index_concurrently, drop_index_concurrently
+
+revision = "0019"
+down_revision = "0018"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute(
+        "DELETE FROM parent_children WHERE id NOT IN "
+        "(SELECT MIN(id) FROM parent_children GROUP BY parent_id, patient_id)"
+    )
+    create_index_concurrently(
+        "ux_parent_children_parent_patient", "parent_children", ["parent_id", "patient_id"], unique=True
+    )
+
+def downgrade():
+    drop_index_concurrently("ux_parent_children_parent_patient", "parent_children")
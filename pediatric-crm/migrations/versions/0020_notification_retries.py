@@ -0,0 +1,45 @@
+"""Повторные попытки доставки уведомлений родителям
+
+attempts, last_error и next_attempt_at: неудачная отправка откладывается с
+экспоненциальной паузой, а безнадежная (бот заблокирован, чат удален,
+исчерпаны попытки) помечается failed_at и больше не выбирается. Очередь
+выбирается по next_attempt_at частичным индексом по неотправленным строкам.
+
+Revision ID: 0020
+Revises: 0019
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import backfill_sql_in_batches, create_index_concurrently, drop_index_concurrently
+
+revision = "0020"
+down_revision = "0019"
+branch_labels = None
+depends_on = None
+
+PENDING = "sent_at IS NULL AND failed_at IS NULL"
+
+def upgrade():
+    op.add_column("parent_notifications", sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("parent_notifications", sa.Column("last_error", sa.Text()))
+    op.add_column("parent_notifications", sa.Column("next_attempt_at", sa.DateTime()))
+    op.add_column("parent_notifications", sa.Column("failed_at", sa.DateTime()))
+
+    backfill_sql_in_batches(
+        "parent_notifications", "next_attempt_at = COALESCE(created_at, CURRENT_TIMESTAMP)", "sent_at IS NULL"
+    )
+    create_index_concurrently(
+        "ix_parent_notifications_pending", "parent_notifications", ["next_attempt_at", "id"],
+        postgresql_where=sa.text(PENDING), sqlite_where=sa.text(PENDING)
+    )
+    drop_index_concurrently("ix_parent_notifications_unsent", "parent_notifications")
+
+def downgrade():
+    create_index_concurrently("ix_parent_notifications_unsent", "parent_notifications", ["sent_at", "id"])
+    drop_index_concurrently("ix_parent_notifications_pending", "parent_notifications")
+    op.drop_column("parent_notifications", "failed_at")
+    op.drop_column("parent_notifications", "next_attempt_at")
+    op.drop_column("parent_notifications", "last_error")
+    op.drop_column("parent_notifications", "attempts")
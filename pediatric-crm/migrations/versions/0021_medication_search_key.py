@@ -0,0 +1,68 @@
+"""Ключ поиска препаратов medical_records.medications_key
+
+lower() в SQLite приводит к нижнему регистру только ASCII, и поиск
+«амокс» не находил «Амоксициллин». Ключ — названия препаратов из назначений
+в нижнем регистре с е вместо ё, по одному на строку; считается в Python
+одинаково для обеих СУБД (app.clinical_search). На Postgres trigram-индекс
+по ключу заменяет индекс по тексту всего документа назначений из 0004.
+Нормализация заморожена здесь на момент миграции.
+
+Revision ID: 0021
+Revises: 0020
+Create Date: 2026-10-19
+"""
+import json
+
+from alembic import op
+import sqlalchemy as sa
+
+from migrations.helpers import is_postgres, backfill_in_batches, create_index_concurrently, drop_index_concurrently
+
+revision = "0021"
+down_revision = "0020"
+branch_labels = None
+depends_on = None
+
+def search_key(value):
+    return (value or "").strip().lower().replace("ё", "е")
+
+def medications_key(prescriptions):
+    if isinstance(prescriptions, str):
+        prescriptions = json.loads(prescriptions)
+    if isinstance(prescriptions, list):
+        prescriptions = {"template": prescriptions}
+    if not isinstance(prescriptions, dict):
+        return None
+    names = [str(name) for name in prescriptions.get("template") or [] if name]
+    names.extend(
+        str(item["medication"]) for item in prescriptions.get("manual") or []
+        if isinstance(item, dict) and item.get("medication")
+    )
+    return "\n".join(search_key(name) for name in names) or None
+
+def upgrade():
+    op.add_column("medical_records", sa.Column("medications_key", sa.Text()))
+
+    backfill_in_batches(
+        "medical_records",
+        ["prescriptions"],
+        lambda row: {"medications_key": key} if (key := medications_key(row.prescriptions)) else None,
+    )
+
+    if is_postgres():
+        create_index_concurrently(
+            "ix_medical_records_medications_trgm", "medical_records",
+            [sa.text("medications_key gin_trgm_ops")],
+            postgresql_using="gin",
+        )
+        drop_index_concurrently("ix_medical_records_prescriptions_trgm", "medical_records")
+
+def downgrade():
+    if is_postgres():
+        create_index_concurrently(
+            "ix_medical_records_prescriptions_trgm", "medical_records",
+            [sa.text("lower(prescriptions::text) gin_trgm_ops")],
+            postgresql_using="gin",
+        )
+        drop_index_concurrently("ix_medical_records_medications_trgm", "medical_records")
+    op.drop_column("medical_records", "medications_key")
@@ -0,0 +1,34 @@
+"""Внешний ключ medical_records.appointment_id на SQLite
+
+На Postgres 0012 заменила внешний ключ по appointment_id составным ключом
+визита, а модель его больше не объявляет. На SQLite старый ключ оставался,
+и alembic check показывал расхождение со схемой. Ключ в SQLite безымянный:
+batch-режим пересоздает таблицу, имя дает naming_convention.
+
+Revision ID: 0022
+Revises: 0021
+Create Date: 2026-10-19
+"""
+from alembic import op
+
+from migrations.helpers import is_postgres
+
+revision = "0022"
+down_revision = "0021"
+branch_labels = None
+depends_on = None
+
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+FK_NAME = "fk_medical_records_appointment_id_appointments"
+
+def upgrade():
+    if is_postgres():
+        return
+    with op.batch_alter_table("medical_records", naming_convention=NAMING_CONVENTION) as batch:
+        batch.drop_constraint(FK_NAME, type_="foreignkey")
+
+def downgrade():
+    if is_postgres():
+        return
+    with op.batch_alter_table("medical_records", naming_convention=NAMING_CONVENTION) as batch:
+        batch.create_foreign_key(FK_NAME, "appointments", ["appointment_id"], ["id"])
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+import sys
+import os
+import time
+import argparse
+
+# Добавляем путь к проекту
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.database import SessionLocal
+from app.patient_summary import SUMMARY_REBUILD_BATCH, rebuild
+
+def run_rebuild(stale_only: bool, batch_size: int):
+    """Пересчет сводки по пациентам: полный или только устаревших «ближайших визитов» (раз в сутки)"""
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        refreshed = rebuild(db, stale_only=stale_only, batch_size=batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"✅ Пересчитано строк сводки: {refreshed} за {elapsed:.2f} с")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при пересчете сводки: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчет patient_summary")
+    parser.add_argument("--stale", action="store_true", help="только пациенты с прошедшим ближайшим визитом")
+    parser.add_argument("--batch-size", type=int, default=SUMMARY_REBUILD_BATCH)
+    args = parser.parse_args()
+    run_rebuild(args.stale, args.batch_size)
@@ -1,4 +1,8 @@
 #!/bin/bash
 cd ~/pediatric-crm
 source venv/bin/activate
+
+# Применяем миграции схемы один раз до старта воркеров
+alembic upgrade head || exit 1
+
 uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
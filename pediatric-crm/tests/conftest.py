@@ -0,0 +1,37 @@
+"""Общие настройки тестов: приложение работает на временной SQLite-базе"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="pediatric-crm-tests-")
+# До импорта app: database.py создает движок при импорте, рабочая база не должна пострадать
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ["LOG_DIR"] = TEST_DIR
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(scope="session")
+def engine():
+    from app.database import engine
+    from app.models import Base
+
+    Base.metadata.create_all(engine)
+    return engine
+
+@pytest.fixture
+def db(engine):
+    """Сессия на тестовой базе; после теста все таблицы очищаются"""
+    from app.database import SessionLocal
+    from app.models import Base
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        for table in reversed(Base.metadata.sorted_tables):
+            session.execute(table.delete())
+        session.commit()
+        session.close()
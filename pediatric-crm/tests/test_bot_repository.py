@@ -0,0 +1,55 @@
+"""Репозиторий бота: привязка детей при авторизации под одновременными запросами"""
+import asyncio
+from datetime import date
+
+from app import bot_repository
+from app.models import Patient, Parent, ParentChild
+
+def add_family(db):
+    parent = Parent(phone="+7 (911) 123-45-67", password="secret", first_name="Мария", last_name="Иванова")
+    children = [
+        Patient(last_name="Иванова", first_name="Анна", birth_date=date(2019, 5, 1), gender="f",
+                phone="89111234567"),
+        Patient(last_name="Иванов", first_name="Петр", birth_date=date(2021, 3, 2), gender="m",
+                phone="+79990000000", parent_phone="9111234567"),
+    ]
+    stranger = Patient(last_name="Сидоров", first_name="Иван", birth_date=date(2020, 1, 1), gender="m",
+                       phone="+79995554433")
+    db.add_all([parent, stranger] + children)
+    db.commit()
+    return parent, children, stranger
+
+def test_concurrent_logins_link_each_child_once(db):
+    parent, children, stranger = add_family(db)
+
+    async def scenario():
+        # Двойные нажатия и несколько устройств: авторизации идут параллельно в пуле потоков
+        return await asyncio.gather(*(
+            bot_repository.authenticate_parent(parent.phone, "secret", str(1000 + n)) for n in range(16)
+        ))
+    results = asyncio.run(scenario())
+
+    assert all(result and result["id"] == parent.id for result in results)
+    links = db.query(ParentChild.patient_id).filter(ParentChild.parent_id == parent.id).all()
+    assert sorted(link.patient_id for link in links) == sorted(child.id for child in children)
+
+def test_parent_sees_only_linked_children(db):
+    parent, children, stranger = add_family(db)
+
+    async def scenario():
+        await bot_repository.authenticate_parent(parent.phone, "secret", "1000")
+        listed = await bot_repository.linked_children(parent.id)
+        own = await bot_repository.child_by_id(parent.id, children[0].id)
+        foreign = await bot_repository.child_by_id(parent.id, stranger.id)
+        return listed, own, foreign
+    listed, own, foreign = asyncio.run(scenario())
+
+    assert [child.first_name for child in listed] == ["Петр", "Анна"]
+    assert own.id == children[0].id
+    assert foreign is None
+
+def test_wrong_password_links_nothing(db):
+    parent, _, _ = add_family(db)
+
+    assert asyncio.run(bot_repository.authenticate_parent(parent.phone, "wrong", "1000")) is None
+    assert db.query(ParentChild).count() == 0
@@ -0,0 +1,35 @@
+"""Клинический поиск: препараты по кириллической подстроке, период по дате визита"""
+from datetime import date, datetime, time
+
+from app.clinical_search import search_medical_records
+from app.models import Patient, Appointment, MedicalRecord
+
+def add_record(db, visit_date, prescriptions, created_at=None):
+    patient = Patient(first_name="Анна", last_name="Иванова", birth_date=date(2022, 5, 1), gender="female", phone="+79110000001")
+    db.add(patient)
+    db.flush()
+    appointment = Appointment(patient_id=patient.id, date=visit_date, time=time(10, 0), type="primary")
+    db.add(appointment)
+    db.flush()
+    record = MedicalRecord(appointment_id=appointment.id, prescriptions=prescriptions, created_at=created_at or datetime.now())
+    db.add(record)
+    db.commit()
+    return record
+
+def test_medication_search_folds_cyrillic_case(db):
+    template = add_record(db, date(2026, 10, 1), {"template": ["Амоксициллин 250 мг"]})
+    manual = add_record(db, date(2026, 10, 2), {"manual": [{"medication": "АМОКСИКЛАВ", "dosage": "5 мл"}]})
+    add_record(db, date(2026, 10, 3), {"template": ["Парацетамол"], "diet": "амокс"})
+
+    rows, total = search_medical_records(db, medication="амокс")
+    assert total == 2 and {row.id for row in rows} == {template.id, manual.id}
+
+def test_period_and_order_follow_visit_date(db):
+    # Запись о сентябрьском визите заполнена в октябре
+    late = add_record(db, date(2026, 9, 30), {}, created_at=datetime(2026, 10, 5))
+    october = add_record(db, date(2026, 10, 2), {}, created_at=datetime(2026, 10, 2))
+
+    rows, total = search_medical_records(db, date_from=date(2026, 10, 1), date_to=date(2026, 10, 31))
+    assert [row.id for row in rows] == [october.id]
+    rows, _ = search_medical_records(db)
+    assert [row.id for row in rows] == [october.id, late.id]
@@ -0,0 +1,12 @@
+"""Учет времени SQL-запросов"""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+def test_failed_query_does_not_leave_start_time(engine):
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM no_such_table"))
+        assert connection.info.get("query_start_time") == []
+        connection.execute(text("SELECT 1"))
+        assert connection.info["query_start_time"] == []
@@ -0,0 +1,52 @@
+"""Идемпотентность POST: повтор по ключу, отпечаток по полям формы, большие ответы"""
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import idempotency
+
+@pytest.fixture
+def client(db):
+    calls = []
+
+    async def create(request):
+        form = await request.form()
+        calls.append(dict(form))
+        return JSONResponse({"created": len(calls)})
+
+    async def report(request):
+        calls.append({})
+        return PlainTextResponse("x" * 100)
+
+    app = Starlette(routes=[Route("/api/appointments", create, methods=["POST"]),
+                            Route("/api/report", report, methods=["POST"])])
+    test_client = TestClient(idempotency.IdempotencyMiddleware(app))
+    test_client.calls = calls
+    return test_client
+
+def test_multipart_retry_is_replayed_despite_new_boundary(client):
+    fields = {"patient_id": "1", "date": "2026-11-02", "time": "10:00"}
+    first = client.post("/api/appointments", files={k: (None, v) for k, v in fields.items()}, headers={"Idempotency-Key": "k1"})
+    # Другая граница и другой порядок полей — тот же запрос
+    retry = client.post("/api/appointments", files={k: (None, v) for k, v in reversed(fields.items())}, headers={"Idempotency-Key": "k1"})
+    assert first.json() == retry.json() == {"created": 1}
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(client.calls) == 1
+
+    changed = client.post("/api/appointments", files={**{k: (None, v) for k, v in fields.items()}, "time": (None, "11:00")}, headers={"Idempotency-Key": "k1"})
+    assert changed.status_code == 422
+
+def test_urlencoded_fields_are_compared_by_content(client):
+    client.post("/api/appointments", content=b"a=1&b=2", headers={"Idempotency-Key": "k2", "Content-Type": "application/x-www-form-urlencoded"})
+    retry = client.post("/api/appointments", content=b"b=2&a=1", headers={"Idempotency-Key": "k2", "Content-Type": "application/x-www-form-urlencoded"})
+    assert retry.status_code == 200 and len(client.calls) == 1
+
+def test_large_response_replays_status_with_marker(client, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_BODY", 10)
+    first = client.post("/api/report", headers={"Idempotency-Key": "k3"})
+    retry = client.post("/api/report", headers={"Idempotency-Key": "k3"})
+    assert first.text == "x" * 100
+    assert retry.status_code == 200 and retry.json()["truncated"] is True
+    assert len(client.calls) == 1
@@ -0,0 +1,72 @@
+"""Денежный учет: проводки, остатки, перенос при слиянии, должники"""
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import ledger
+from app.dedupe import merge_patients
+from app.models import Patient, LedgerTransaction, LedgerEntry, PatientBalance
+
+def add_patient(db, last_name="Иванова", phone="+79110000001"):
+    patient = Patient(first_name="Анна", last_name=last_name, birth_date=date(2022, 5, 1), gender="female", phone=phone)
+    db.add(patient)
+    db.flush()
+    return patient
+
+def test_charge_and_payment_keep_exact_balance(db):
+    patient = add_patient(db)
+    for _ in range(3):
+        ledger.post(db, patient.id, "charge", "0.10")
+    ledger.post(db, patient.id, "charge", 1500)
+    payment = ledger.post(db, patient.id, "payment", "1000.105", method="card")
+    db.commit()
+
+    # 0.1 * 3 в float дало бы 0.30000000000000004
+    assert ledger.get_balance(db, patient.id) == Decimal("500.19")
+    assert payment.amount == Decimal("1000.11")
+    entries = db.query(LedgerEntry.account, LedgerEntry.amount).filter_by(transaction_id=payment.id).all()
+    assert sorted(entries) == [("card", Decimal("1000.11")), ("receivable", Decimal("-1000.11"))]
+    for transaction in db.query(LedgerTransaction):
+        assert sum(entry.amount for entry in transaction.entries) == 0
+
+def test_post_rejects_bad_input(db):
+    patient = add_patient(db)
+    with pytest.raises(ledger.LedgerError):
+        ledger.post(db, patient.id, "gift", 100)
+    with pytest.raises(ledger.LedgerError):
+        ledger.post(db, patient.id, "charge", "0.004")
+    with pytest.raises(ledger.LedgerError):
+        ledger.post(db, patient.id, "payment", 100, method="barter")
+
+def test_merge_moves_balance_to_main_card(db):
+    patient = add_patient(db)
+    duplicate = add_patient(db, phone="+79110000002")
+    ledger.post(db, patient.id, "charge", "700.50")
+    ledger.post(db, duplicate.id, "charge", "1200.25")
+    ledger.post(db, duplicate.id, "payment", "200")
+    db.commit()
+
+    merge_patients(db, patient.id, duplicate.id)
+    db.commit()
+
+    assert ledger.get_balance(db, patient.id) == Decimal("1700.75")
+    assert db.query(PatientBalance).filter_by(patient_id=duplicate.id).count() == 0
+    # Сами операции дубля остаются в истории основной карточки
+    assert db.query(LedgerTransaction).filter_by(patient_id=patient.id).count() == 3
+
+def test_debtors_lists_only_positive_balances_largest_first(db):
+    small = add_patient(db, "Смирнова", "+79110000003")
+    large = add_patient(db, "Петрова", "+79110000004")
+    paid = add_patient(db, "Козлова", "+79110000005")
+    overpaid = add_patient(db, "Волкова", "+79110000006")
+    ledger.post(db, small.id, "charge", "300")
+    ledger.post(db, large.id, "charge", "4500")
+    ledger.post(db, paid.id, "charge", "800")
+    ledger.post(db, paid.id, "payment", "800")
+    ledger.post(db, overpaid.id, "payment", "100")
+    db.commit()
+
+    rows = ledger.debtors(db)
+    assert [(row.patient_id, row.balance) for row in rows] == [(large.id, Decimal("4500.00")), (small.id, Decimal("300.00"))]
+    assert [row.patient_id for row in ledger.debtors(db, limit=1, offset=1)] == [small.id]
@@ -0,0 +1,22 @@
+"""Живое обновление расписания"""
+import asyncio
+from datetime import date
+
+from app import live, main
+
+def test_broker_delivers_to_subscribers_of_the_day():
+    broker = live.ScheduleBroker()
+
+    async def run():
+        queue = broker.subscribe(date(2026, 11, 2))
+        other = broker.subscribe(date(2026, 11, 3))
+        broker.publish(date(2026, 11, 2), "remove", {"id": 7})
+        return queue.get_nowait(), other.empty()
+
+    message, other_empty = asyncio.run(run())
+    assert message == 'event: remove\ndata: {"id": 7}\n\n' and other_empty
+
+def test_stream_is_refused_without_shared_channel(monkeypatch):
+    monkeypatch.setattr(main.schedule_broker, "enabled", False)
+    response = asyncio.run(main.appointments_stream(request=None, date="2026-11-02"))
+    assert response.status_code == 204
@@ -0,0 +1,107 @@
+"""Очередь уведомлений родителям: повторы с паузой, окончательные отказы, порядок выборки"""
+import asyncio
+from datetime import date, datetime, time, timedelta
+
+from aiohttp import web
+from telegram.error import Forbidden
+
+from app import bot_repository, telegram_bot
+from app.models import Patient, Appointment, MedicalRecord, Parent, ParentNotification
+
+class FakeBot:
+    """Бот, который блокирован в чате 1, падает в чате 2 и доставляет в остальные"""
+
+    def __init__(self):
+        self.delivered = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id == 1:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        if chat_id == 2:
+            raise RuntimeError("Timed out")
+        self.delivered.append((chat_id, text))
+
+def add_notification(db, chat, text="Запись перенесена"):
+    parent = Parent(phone=f"+7911000000{chat}", password="x", telegram_chat_id=str(chat))
+    db.add(parent)
+    db.flush()
+    notification = ParentNotification(parent_id=parent.id, text=text)
+    db.add(notification)
+    db.commit()
+    return notification
+
+def test_failures_are_recorded_and_do_not_block_the_queue(db):
+    blocked = add_notification(db, 1)
+    flaky = add_notification(db, 2)
+    fine = add_notification(db, 3)
+    bot = FakeBot()
+
+    assert asyncio.run(telegram_bot.deliver_pending(bot)) == 1
+    assert bot.delivered == [(3, "Запись перенесена")]
+
+    db.expire_all()
+    blocked, flaky, fine = (db.get(ParentNotification, n.id) for n in (blocked, flaky, fine))
+    assert blocked.failed_at is not None and blocked.attempts == 1 and "blocked" in blocked.last_error
+    assert flaky.failed_at is None and flaky.attempts == 1
+    assert flaky.next_attempt_at > datetime.now() + timedelta(seconds=bot_repository.NOTIFY_RETRY_BASE - 5)
+    assert fine.sent_at is not None
+
+    # Отложенное и отвергнутое не выбираются, новое уведомление уходит сразу
+    later = add_notification(db, 4)
+    assert [row.id for row in asyncio.run(bot_repository.pending_notifications())] == [later.id]
+
+def test_retries_back_off_and_give_up(db, monkeypatch):
+    monkeypatch.setattr(bot_repository, "NOTIFY_MAX_ATTEMPTS", 3)
+    flaky = add_notification(db, 2)
+
+    for attempt in range(1, 4):
+        db.query(ParentNotification).filter_by(id=flaky.id).update({"next_attempt_at": datetime.now()})
+        db.commit()
+        asyncio.run(telegram_bot.deliver_pending(FakeBot()))
+        db.expire_all()
+        row = db.get(ParentNotification, flaky.id)
+        assert row.attempts == attempt
+    assert row.failed_at is not None and row.next_attempt_at is None
+
+def test_retry_delay_doubles_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(bot_repository, "NOTIFY_RETRY_BASE", 60)
+    monkeypatch.setattr(bot_repository, "NOTIFY_RETRY_MAX", 300)
+    assert [bot_repository.retry_delay(n) for n in range(1, 6)] == [60, 120, 240, 300, 300]
+
+def test_visit_summary_falls_back_to_text_when_pdf_is_unavailable(db, monkeypatch):
+    patient = Patient(first_name="Анна", last_name="Иванова", birth_date=date(2022, 5, 1), gender="female", phone="+79110000001")
+    db.add(patient)
+    db.flush()
+    appointment = Appointment(patient_id=patient.id, date=date(2026, 10, 1), time=time(10, 0), type="primary")
+    db.add(appointment)
+    db.flush()
+    record = MedicalRecord(appointment_id=appointment.id, complaints="Кашель", recommendations="Обильное питье")
+    db.add(record)
+    db.flush()
+    notification = add_notification(db, 3, "Итоги визита Анна от 01.10.2026")
+    notification.medical_record_id = record.id
+    db.commit()
+    bot = FakeBot()
+
+    async def unavailable(request):
+        return web.Response(status=503)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/api/medical-records/{record_id}/pdf", unavailable)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        monkeypatch.setattr(telegram_bot, "API_URL", f"http://127.0.0.1:{port}")
+        try:
+            return await telegram_bot.deliver_pending(bot)
+        finally:
+            await runner.cleanup()
+
+    assert asyncio.run(run()) == 1
+    [(chat, text)] = bot.delivered
+    assert text.startswith("Итоги визита Анна от 01.10.2026") and "Кашель" in text and "Обильное питье" in text
+    db.expire_all()
+    assert db.get(ParentNotification, notification.id).sent_at is not None
@@ -0,0 +1,41 @@
+"""Выбор пациента: поиск по началу фамилии и имени без учета регистра, в том числе кириллицы"""
+from datetime import date
+
+from app.models import Patient
+from app.patient_picker import pick_patients
+
+def add_patient(db, last_name, first_name):
+    patient = Patient(last_name=last_name, first_name=first_name, birth_date=date(2020, 1, 1), gender="f", phone="1")
+    db.add(patient)
+    db.commit()
+    return patient
+
+def names(rows):
+    return [f"{row.last_name} {row.first_name}" for row in rows]
+
+def test_cyrillic_prefix_ignores_case_and_yo(db):
+    add_patient(db, "Ёлкина", "Анна")
+    add_patient(db, "Иванов", "Петр")
+
+    assert names(pick_patients(db, "елк")[0]) == ["Ёлкина Анна"]
+    assert names(pick_patients(db, "ЁЛКИНА ан")[0]) == ["Ёлкина Анна"]
+    assert names(pick_patients(db, "иванов б")[0]) == []
+
+def test_keys_follow_renames(db):
+    patient = add_patient(db, "Смирнова", "Ольга")
+    patient.last_name = "Кузнецова"
+    db.commit()
+
+    assert names(pick_patients(db, "кузн")[0]) == ["Кузнецова Ольга"]
+    assert pick_patients(db, "смир")[0] == []
+
+def test_cursor_pages_through_all_rows(db):
+    for n in range(5):
+        add_patient(db, "Петрова", f"Дарья{n}")
+
+    rows, cursor = pick_patients(db, "петр", limit=2)
+    seen = names(rows)
+    while cursor:
+        rows, cursor = pick_patients(db, "петр", limit=2, cursor=cursor)
+        seen += names(rows)
+    assert seen == [f"Петрова Дарья{n}" for n in range(5)]
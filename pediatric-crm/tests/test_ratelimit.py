@@ -0,0 +1,72 @@
+"""Ограничитель частоты: 429 с Retry-After, адрес клиента за прокси"""
+import asyncio
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app import ratelimit
+
+async def ok(request):
+    return PlainTextResponse("ok")
+
+@pytest.fixture
+def make_client(monkeypatch):
+    """Клиент приложения за RateLimitMiddleware; TestClient приходит с адреса testclient"""
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_BACKEND", "memory")
+    monkeypatch.setattr(ratelimit, "RATE_LIMIT_EXEMPT", set())
+    # Тесное правило, чтобы ведро опустошалось за несколько запросов
+    monkeypatch.setattr(ratelimit, "RATE_LIMITS", [("/api/health", None, None), ("/api/patients", 0.2, 5)])
+
+    def make(trusted_proxies=()):
+        monkeypatch.setattr(ratelimit, "RATE_LIMIT_TRUSTED_PROXIES", set(trusted_proxies))
+        app = Starlette(routes=[Route("/api/patients", ok), Route("/api/health", ok)])
+        return TestClient(ratelimit.RateLimitMiddleware(app))
+    return make
+
+def test_empty_bucket_returns_429_with_retry_after(make_client):
+    client = make_client()
+    # /api/patients: емкость 5, 0.2 токена в секунду
+    statuses = [client.get("/api/patients").status_code for _ in range(5)]
+    assert statuses == [200] * 5
+
+    response = client.get("/api/patients")
+    assert response.status_code == 429
+    assert response.json()["detail"]
+    assert 1 <= int(response.headers["retry-after"]) <= 5
+
+def test_health_is_not_limited(make_client):
+    client = make_client()
+    assert {client.get("/api/health").status_code for _ in range(50)} == {200}
+
+def test_trusted_proxy_buckets_by_real_ip(make_client):
+    client = make_client(trusted_proxies={"testclient"})
+    for _ in range(5):
+        client.get("/api/patients", headers={"X-Real-IP": "10.0.0.1"})
+    assert client.get("/api/patients", headers={"X-Real-IP": "10.0.0.1"}).status_code == 429
+    # Другой клиент за тем же прокси не делит ведро с первым
+    assert client.get("/api/patients", headers={"X-Real-IP": "10.0.0.2"}).status_code == 200
+
+def test_forwarded_headers_from_untrusted_peer_are_ignored(make_client):
+    client = make_client()
+    statuses = [
+        client.get("/api/patients", headers={"X-Forwarded-For": f"10.0.0.{n}"}).status_code
+        for n in range(6)
+    ]
+    assert statuses[-1] == 429
+
+def test_concurrency_limiter_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = ratelimit.ConcurrencyLimiter(limit=1, queue_size=1)
+        assert await limiter.acquire(timeout=1)
+        waiter = asyncio.ensure_future(limiter.acquire(timeout=1))
+        await asyncio.sleep(0)
+        # Одно место занято, единственное место в очереди тоже
+        assert not await limiter.acquire(timeout=1)
+        limiter.release()
+        assert await waiter
+        limiter.release()
+    asyncio.run(scenario())
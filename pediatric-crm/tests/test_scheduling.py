@@ -0,0 +1,122 @@
+"""Расписание: проверка слотов, массовые операции и серии"""
+from datetime import date, time
+
+import pytest
+
+from app import audit, scheduling
+from app.cache import LocalLRUCache, AVAILABILITY, STATS
+from app.models import Patient, Appointment, AuditLog
+
+def add_patient(db):
+    patient = Patient(first_name="Анна", last_name="Иванова", birth_date=date(2022, 5, 1), gender="female", phone="+79110000001")
+    db.add(patient)
+    db.flush()
+    return patient
+
+def add_appointment(db, patient, day, slot_time, status="new"):
+    appointment = Appointment(patient_id=patient.id, date=day, time=slot_time, type="repeat", status=status)
+    db.add(appointment)
+    db.flush()
+    return appointment
+
+def test_reserve_slot_rejects_busy_time(db):
+    patient = add_patient(db)
+    add_appointment(db, patient, date(2026, 11, 2), time(10, 0))
+    add_appointment(db, patient, date(2026, 11, 2), time(11, 0), status="cancelled")
+
+    with pytest.raises(scheduling.SlotConflictError) as error:
+        scheduling.reserve_slot(db, date(2026, 11, 2), time(10, 0))
+    assert error.value.conflicts == [{"date": "2026-11-02", "time": "10:00"}]
+    scheduling.reserve_slot(db, date(2026, 11, 2), time(11, 0))
+
+def test_memory_cache_does_not_keep_availability():
+    cache = LocalLRUCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        return ["10:00"]
+
+    for _ in range(2):
+        cache.get_or_set(AVAILABILITY, "2026-11-02", load)
+        cache.get_or_set(STATS, "2026-11-02", load)
+    assert len(calls) == 3
+
+def logged(db, action):
+    """Записи журнала за время теста: буфер пишется в audit_log"""
+    audit.flush()
+    return db.query(AuditLog).filter(AuditLog.entity == "appointment", AuditLog.action == action).all()
+
+@pytest.fixture
+def clean_audit(db):
+    audit.flush()
+    db.query(AuditLog).delete()
+    db.commit()
+
+def test_bulk_shift_skips_completed_and_writes_audit(db, clean_audit):
+    patient = add_patient(db)
+    day = date(2026, 11, 2)
+    new = add_appointment(db, patient, day, time(10, 0))
+    confirmed = add_appointment(db, patient, day, time(11, 0), status="confirmed")
+    completed = add_appointment(db, patient, day, time(9, 0), status="completed")
+    db.commit()
+    logged(db, "insert")
+
+    changes = scheduling.apply_bulk_action(
+        db, "shift", scheduling.appointment_filter(date_from=day, date_to=day), shift_days=1, shift_minutes=30
+    )
+    db.commit()
+
+    assert {c["id"] for c in changes} == {new.id, confirmed.id}
+    slots = {a.id: (a.date, a.time) for a in db.query(Appointment)}
+    assert slots == {
+        new.id: (date(2026, 11, 3), time(10, 30)),
+        confirmed.id: (date(2026, 11, 3), time(11, 30)),
+        completed.id: (day, time(9, 0)),
+    }
+    entries = {row.entity_id: row.changes for row in logged(db, "update")}
+    assert entries == {
+        new.id: {"date": ["2026-11-02", "2026-11-03"], "time": ["10:00:00", "10:30:00"]},
+        confirmed.id: {"date": ["2026-11-02", "2026-11-03"], "time": ["11:00:00", "11:30:00"]},
+    }
+
+def test_bulk_conflict_changes_nothing(db, clean_audit):
+    patient = add_patient(db)
+    day = date(2026, 11, 2)
+    first = add_appointment(db, patient, day, time(10, 0))
+    second = add_appointment(db, patient, day, time(11, 0))
+    # Завершенный визит занимает слот, куда попала бы вторая запись
+    add_appointment(db, patient, day, time(12, 0), status="completed")
+    db.commit()
+
+    with pytest.raises(scheduling.SlotConflictError) as error:
+        scheduling.apply_bulk_action(db, "shift", scheduling.appointment_filter(ids=[first.id, second.id]), shift_minutes=60)
+    db.rollback()
+
+    assert error.value.conflicts == [{"date": "2026-11-02", "time": "12:00"}]
+    assert {a.id: a.time for a in db.query(Appointment).filter(Appointment.id.in_([first.id, second.id]))} == {
+        first.id: time(10, 0), second.id: time(11, 0)
+    }
+    assert logged(db, "update") == []
+
+def test_series_conflict_aborts_or_skips_busy_dates(db, clean_audit):
+    patient = add_patient(db)
+    add_appointment(db, patient, date(2026, 11, 9), time(10, 0))
+    db.commit()
+    logged(db, "insert")
+    db.query(AuditLog).delete()
+    db.commit()
+
+    with pytest.raises(scheduling.SlotConflictError):
+        scheduling.create_series(db, patient.id, date(2026, 11, 2), time(10, 0), "vaccination", count=3)
+    db.rollback()
+    assert db.query(Appointment).count() == 1
+
+    series, dates, busy = scheduling.create_series(
+        db, patient.id, date(2026, 11, 2), time(10, 0), "vaccination", count=3, skip_conflicts=True
+    )
+    db.commit()
+    assert dates == [date(2026, 11, 2), date(2026, 11, 16)] and busy == [date(2026, 11, 9)]
+    created = db.query(Appointment).filter(Appointment.series_id == series.id).all()
+    assert sorted(a.date for a in created) == dates
+    assert {row.entity_id for row in logged(db, "insert")} == {a.id for a in created}
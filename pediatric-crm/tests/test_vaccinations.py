@@ -0,0 +1,31 @@
+"""Расчет следующей прививки"""
+from datetime import date
+
+from app.vaccinations import refresh_due
+from app.models import Patient, Vaccination, VaccinationDue
+
+def test_next_dose_follows_highest_recorded_dose_number(db):
+    patient = Patient(first_name="Анна", last_name="Иванова", birth_date=date(2026, 1, 10), gender="female", phone="+79110000001")
+    db.add(patient)
+    db.flush()
+    # Первая доза сделана в роддоме и не внесена, вторая внесена дважды
+    db.add_all([
+        Vaccination(patient_id=patient.id, vaccine="hepb", dose_number=2, administered_on=date(2026, 2, 12)),
+        Vaccination(patient_id=patient.id, vaccine="hepb", dose_number=2, administered_on=date(2026, 2, 12)),
+    ])
+    db.commit()
+
+    refresh_due(db, [patient.id], today=date(2026, 3, 1))
+    due = db.query(VaccinationDue).filter_by(patient_id=patient.id, vaccine="hepb").one()
+    assert due.dose_number == 3 and due.due_on == date(2026, 7, 10)
+
+def test_patients_without_status_are_not_skipped(db):
+    patient = Patient(first_name="Петр", last_name="Смирнов", birth_date=date(2026, 1, 10), gender="male", phone="+79110000002")
+    archived = Patient(first_name="Олег", last_name="Смирнов", birth_date=date(2026, 1, 10), gender="male", phone="+79110000003", status="archived")
+    db.add_all([patient, archived])
+    db.flush()
+    patient.status = None
+    db.commit()
+
+    refresh_due(db, today=date(2026, 3, 1))
+    assert {row.patient_id for row in db.query(VaccinationDue)} == {patient.id}
@@ -1,11 +1,14 @@
 #!/bin/bash
 echo "🔄 Перезапуск Pediatric CRM..."
-pkill -f uvicorn
+pkill -f "gunicorn|uvicorn"
 sleep 2
 cd ~/pediatric-crm
 source venv/bin/activate
+
+# Применяем миграции схемы один раз до старта воркеров
+alembic upgrade head || exit 1
 [ -d "app/models" ] && rm -rf app/models/
-nohup uvicorn app.main:app --host 0.0.0.0 --port 8000 > fastapi.log 2>&1 &
+nohup gunicorn -c gunicorn.conf.py app.main:app > fastapi.log 2>&1 &
 echo "✅ Сайт перезапущен"
 sleep 2
-ps aux | grep uvicorn | head -5
+ps aux | grep gunicorn | head -5
@@ -1,6 +1,6 @@
 #!/bin/bash
 echo "🛑 Остановка Pediatric CRM..."
-pkill -f uvicorn
+pkill -f "gunicorn|uvicorn"
 pkill -f run_bot.py
 echo "✅ Все процессы остановлены"
-ps aux | grep uvicorn | wc -l
+ps aux | grep gunicorn | wc -l